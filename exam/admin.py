@@ -1,7 +1,59 @@
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path, reverse
 from django.utils.html import format_html
-from django.db.models import Count, Sum
-from .models import Subject, Exam, Question, ExamSession, StudentResponse
+from django.db import connection
+from django.db.models import Count
+from django.utils.functional import cached_property
+from .models import Subject, Exam, Question, ExamSession, StudentResponse, ExamResult
+from .grading import regrade_responses
+from .imports import IMPORT_FORMATS, QuestionBankError, format_for_filename, import_exams, parse_question_bank
+from .item_analysis import get_item_analysis
+
+
+# Unfiltered changelists of tables at least this large show an estimated total instead of counting
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+def estimated_row_count(model):
+    """Row count of a whole table from the database's own bookkeeping, or None if unavailable"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        elif connection.vendor == 'sqlite':
+            # Row counts recorded by the last ANALYZE; without one the table is counted exactly
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s ORDER BY idx IS NOT NULL LIMIT 1', [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for tables that were never analyzed
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the size of a large unfiltered table instead of running COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
 
 
 @admin.register(Subject)
@@ -12,8 +64,9 @@ class SubjectAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
 
     def exam_count(self, obj):
-        return obj.exam_set.count()
+        return obj.exam_count
     exam_count.short_description = 'Number of Exams'
+    exam_count.admin_order_field = 'exam_count'
 
     def get_queryset(self, request):
         return super().get_queryset(request).annotate(
@@ -31,13 +84,33 @@ class QuestionInline(admin.TabularInline):
         return 50  # Limit max questions per exam
 
 
+class QuestionBankImportForm(forms.Form):
+    bank = forms.FileField(
+        label='Question bank',
+        help_text='A .json or .csv file; see SETUP.md for the layout',
+    )
+    prerender = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Prerender question audio in the background',
+    )
+
+    def clean_bank(self):
+        bank = self.cleaned_data['bank']
+        if format_for_filename(bank.name) is None:
+            raise forms.ValidationError(f"Upload a {' or '.join(IMPORT_FORMATS)} file")
+        return bank
+
+
 @admin.register(Exam)
 class ExamAdmin(admin.ModelAdmin):
-    list_display = ['title', 'subject', 'grade_level', 'duration_minutes', 'question_count', 'total_points', 'is_active', 'created_at']
+    list_display = ['title', 'subject', 'grade_level', 'duration_minutes', 'question_count', 'total_points', 'is_active', 'reports', 'created_at']
     list_filter = ['subject', 'grade_level', 'is_active', 'language', 'created_at']
     search_fields = ['title', 'subject__name', 'instructions']
     readonly_fields = ['created_at', 'question_count', 'total_points']
     inlines = [QuestionInline]
+    actions = ['regrade_exams', 'extend_active_sessions']
+    change_list_template = 'admin/exam/exam/change_list.html'
     
     fieldsets = (
         ('Basic Information', {
@@ -52,17 +125,86 @@ class ExamAdmin(admin.ModelAdmin):
         }),
     )
 
-    def question_count(self, obj):
-        return obj.get_total_questions()
-    question_count.short_description = 'Questions'
-
-    def total_points(self, obj):
-        return obj.get_total_points()
-    total_points.short_description = 'Total Points'
-
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('subject', 'created_by')
 
+    def reports(self, obj):
+        return format_html(
+            '<a href="{}">Statistics</a> | <a href="{}">Item analysis</a> | <a href="{}?exam__id__exact={}">Sessions</a>',
+            reverse('exam:exam_stats', args=[obj.pk]),
+            reverse('admin:exam_exam_item_analysis', args=[obj.pk]),
+            reverse('admin:exam_examsession_changelist'),
+            obj.pk,
+        )
+    reports.short_description = 'Reports'
+
+    def get_urls(self):
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_view),
+                name='exam_exam_import',
+            ),
+            path(
+                '<path:object_id>/item-analysis/',
+                self.admin_site.admin_view(self.item_analysis_view),
+                name='exam_exam_item_analysis',
+            ),
+        ] + super().get_urls()
+
+    def item_analysis_view(self, request, object_id):
+        exam = get_object_or_404(Exam.objects.select_related('stats'), pk=object_id)
+        analysis = get_item_analysis(exam, use_cache=request.GET.get('refresh') is None)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': exam,
+            'title': f'Item analysis: {exam.title}',
+            'analysis': analysis,
+        }
+        return render(request, 'admin/exam/exam/item_analysis.html', context)
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        form = QuestionBankImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['bank']
+            try:
+                bank = parse_question_bank(upload.read(), format_for_filename(upload.name))
+            except QuestionBankError as e:
+                for error in e.errors:
+                    form.add_error('bank', error)
+            else:
+                exams, _ = import_exams(bank, request.user, prerender=form.cleaned_data['prerender'])
+                questions = sum(len(spec.questions) for spec in bank)
+                self.message_user(request, f"Imported {len(exams)} exams with {questions} questions.")
+                return redirect('admin:exam_exam_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import question bank',
+            'form': form,
+        }
+        return render(request, 'admin/exam/exam/import_exams.html', context)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline edits may touch many questions; settle the totals once at the end
+        Exam.sync_question_totals([form.instance.pk])
+
+    @admin.action(description='Regrade all responses for selected exams')
+    def regrade_exams(self, request, queryset):
+        result = regrade_responses(Question.objects.filter(exam__in=queryset))
+        self.message_user(request, f"Regraded {result['scanned']} responses ({result['changed']} changed).")
+
+    @admin.action(description='Give all active sessions of selected exams 5 more minutes')
+    def extend_active_sessions(self, request, queryset):
+        extended = ExamSession.objects.filter(exam__in=queryset).active().extend_deadline(5 * 60)
+        self.message_user(request, f"Extended {extended} active sessions by 5 minutes.")
+
     def save_model(self, request, obj, form, change):
         if not change:  # Only set created_by for new objects
             obj.created_by = request.user
@@ -72,9 +214,12 @@ class ExamAdmin(admin.ModelAdmin):
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ['exam', 'order', 'question_preview', 'question_type', 'points']
-    list_filter = ['exam', 'question_type', 'points']
+    # Filtering by exam is done from the search box; a filter would list every exam
+    list_filter = ['exam__subject', 'question_type', 'points']
+    autocomplete_fields = ['exam']
     search_fields = ['question_text', 'exam__title']
     ordering = ['exam', 'order']
+    actions = ['regrade_questions']
     
     fieldsets = (
         ('Question Details', {
@@ -91,7 +236,12 @@ class QuestionAdmin(admin.ModelAdmin):
     question_preview.short_description = 'Question Text'
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('exam')
+        return super().get_queryset(request).select_related('exam__subject')
+
+    @admin.action(description='Regrade responses for selected questions')
+    def regrade_questions(self, request, queryset):
+        result = regrade_responses(queryset)
+        self.message_user(request, f"Regraded {result['scanned']} responses ({result['changed']} changed).")
 
 
 class StudentResponseInline(admin.TabularInline):
@@ -103,14 +253,25 @@ class StudentResponseInline(admin.TabularInline):
     def has_add_permission(self, request, obj=None):
         return False
 
+    def get_queryset(self, request):
+        # Each row's label names the student, so the session is needed too
+        return super().get_queryset(request).select_related('exam_session', 'question')
+
 
 @admin.register(ExamSession)
 class ExamSessionAdmin(admin.ModelAdmin):
     list_display = ['exam', 'student_name', 'student_grade', 'current_state', 'progress', 'score_display', 'time_remaining_display', 'started_at']
-    list_filter = ['exam', 'current_state', 'started_at', 'completed_at']
+    # Per-exam lists are linked from the exam changelist; a filter would list every exam
+    list_filter = ['current_state', 'exam__subject', 'started_at', 'completed_at']
     search_fields = ['student_name', 'exam__title']
-    readonly_fields = ['session_id', 'started_at', 'completed_at', 'progress_percentage', 'score_display']
+    ordering = ['-started_at', '-id']
+    autocomplete_fields = ['exam']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ['session_id', 'started_at', 'completed_at', 'progress_percentage', 'score_display',
+                       'time_remaining_display', 'deadline_at', 'paused_at', 'extension_seconds']
     inlines = [StudentResponseInline]
+    actions = ['extend_five_minutes', 'pause_sessions', 'resume_sessions']
     
     fieldsets = (
         ('Student Information', {
@@ -120,7 +281,10 @@ class ExamSessionAdmin(admin.ModelAdmin):
             'fields': ('exam', 'session_id', 'current_state', 'current_question_index')
         }),
         ('Progress & Scoring', {
-            'fields': ('progress_percentage', 'total_score', 'score_display', 'time_remaining')
+            'fields': ('progress_percentage', 'total_score', 'score_display')
+        }),
+        ('Timer', {
+            'fields': ('time_remaining_display', 'deadline_at', 'paused_at', 'extension_seconds')
         }),
         ('Timestamps', {
             'fields': ('started_at', 'completed_at'),
@@ -129,12 +293,16 @@ class ExamSessionAdmin(admin.ModelAdmin):
     )
 
     def progress(self, obj):
-        return f"{obj.progress_percentage:.1f}%"
+        # Annotated by with_progress() on changelists; the change form computes it
+        progress = getattr(obj, 'progress', None)
+        if progress is None:
+            progress = obj.progress_percentage
+        return f"{progress:.1f}%"
     progress.short_description = 'Progress'
+    progress.admin_order_field = 'progress'
 
     def score_display(self, obj):
-        total_possible = obj.exam.get_total_points()
-        return f"{obj.total_score}/{total_possible}"
+        return f"{obj.total_score}/{obj.exam.total_points}"
     score_display.short_description = 'Score'
 
     def time_remaining_display(self, obj):
@@ -145,11 +313,28 @@ class ExamSessionAdmin(admin.ModelAdmin):
         return obj.time_remaining_formatted
     time_remaining_display.short_description = 'Time Remaining'
 
+    @admin.action(description='Give selected sessions 5 more minutes')
+    def extend_five_minutes(self, request, queryset):
+        extended = queryset.active().extend_deadline(5 * 60)
+        self.message_user(request, f"Extended {extended} active sessions by 5 minutes.")
+
+    @admin.action(description='Pause selected sessions')
+    def pause_sessions(self, request, queryset):
+        for session in queryset.active().filter(paused_at__isnull=True):
+            session.pause()
+        self.message_user(request, "Paused selected sessions.")
+
+    @admin.action(description='Resume selected sessions')
+    def resume_sessions(self, request, queryset):
+        for session in queryset.filter(paused_at__isnull=False):
+            session.resume()
+        self.message_user(request, "Resumed selected sessions.")
+
     def has_add_permission(self, request):
         return False  # Sessions created through voice interface only
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('exam', 'exam__subject')
+        return super().get_queryset(request).select_related('exam__subject').with_progress()
 
 
 @admin.register(StudentResponse)
@@ -158,6 +343,11 @@ class StudentResponseAdmin(admin.ModelAdmin):
     list_filter = ['is_correct', 'question__question_type', 'answered_at']
     search_fields = ['exam_session__student_name', 'question__question_text', 'final_answer']
     readonly_fields = ['exam_session', 'question', 'transcribed_text', 'answered_at', 'is_correct', 'points_earned']
+    raw_id_fields = ['exam_session', 'question']
+    # Newest first along the primary key, so pages never sort the whole table
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Response Details', {
@@ -180,7 +370,27 @@ class StudentResponseAdmin(admin.ModelAdmin):
         return False  # Responses created through voice interface only
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('exam_session', 'question')
+        return super().get_queryset(request).select_related('exam_session__exam__subject', 'question')
+
+
+@admin.register(ExamResult)
+class ExamResultAdmin(admin.ModelAdmin):
+    list_display = ['exam_session', 'exam_title', 'total_score', 'max_score', 'accuracy_percentage', 'completed_at']
+    list_filter = ['exam__subject', 'completed_at']
+    search_fields = ['exam_session__student_name', 'exam_title']
+    readonly_fields = [field.name for field in ExamResult._meta.fields]
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False  # Written when a session completes
+
+    def has_change_permission(self, request, obj=None):
+        return False  # Only regrades update summaries, and only the rebuild_results command rewrites them
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('exam_session__exam__subject')
 
 
 # Custom admin site configuration
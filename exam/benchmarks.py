@@ -0,0 +1,314 @@
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+import platform
+import statistics
+import time
+
+from django.conf import settings
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .models import Exam, ExamSession, StudentResponse
+from .speech import fake_audio
+from .voice_processor import VoiceCommandParser, VoiceFlowManager, VoiceProcessor
+
+# What students say, paired with the state they say it in
+TRANSCRIPT_CORPUS = [
+    ('Amina Wanjiru', 'student_name'),
+    ('my name is Brian Otieno', 'student_name'),
+    ('grade four', 'student_grade'),
+    ('I am in class six', 'student_grade'),
+    ('start', 'exam_briefing'),
+    ('please repeat the instructions', 'exam_briefing'),
+    ('I am ready to begin', 'exam_briefing'),
+    ('okay', 'question_reading'),
+    ('say again', 'question_reading'),
+    ('how much time do I have left', 'question_reading'),
+    ('go back to the previous question', 'question_reading'),
+    ('next question please', 'question_reading'),
+    ('the answer is B', 'answer_capture'),
+    ('option C', 'answer_capture'),
+    ('I think it is true', 'answer_capture'),
+    ('false', 'answer_capture'),
+    ('photosynthesis', 'answer_capture'),
+    ('um I am not sure maybe A', 'answer_capture'),
+    ('yes', 'answer_confirmation'),
+    ("that's right", 'answer_confirmation'),
+    ('no that is wrong', 'answer_confirmation'),
+    ('correct', 'answer_confirmation'),
+    ('can you repeat that', 'answer_confirmation'),
+    ('Nairobi is the capital city', 'answer_capture'),
+]
+
+# Answers as extract_answer sees them, with the type of the question being answered
+ANSWER_CORPUS = [
+    ('B', 'multiple_choice'),
+    ('option D', 'multiple_choice'),
+    ('the answer is a', 'multiple_choice'),
+    ('I would go with choice C', 'multiple_choice'),
+    ('hmm let me think, it could be the second one', 'multiple_choice'),
+    ('true', 'true_false'),
+    ('that is false', 'true_false'),
+    ('I believe it is true', 'true_false'),
+    ('twelve', 'short_answer'),
+    ('the water cycle', 'short_answer'),
+    ('  Mount Kenya  ', 'short_answer'),
+]
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    calls: int
+    # Median of the fastest round; the most repeatable figure, and the one compared
+    best_us: float
+    median_us: float
+    p95_us: float
+
+
+class Benchmark:
+    """A piece of the voice hot path timed in isolation.
+
+    setup() runs once before timing and teardown() once after; reset() runs
+    untimed before every call, for steps that change what they work on.
+    """
+    name = None
+    description = ''
+
+    def setup(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+    def teardown(self):
+        pass
+
+
+class ParseCommandBenchmark(Benchmark):
+    name = 'parse_command'
+    description = 'VoiceCommandParser.parse_command over the transcript corpus'
+
+    def setup(self):
+        self.parser = VoiceCommandParser()
+
+    def run(self):
+        for transcript, state in TRANSCRIPT_CORPUS:
+            self.parser.parse_command(transcript, state)
+
+
+class ExtractAnswerBenchmark(Benchmark):
+    name = 'extract_answer'
+    description = 'VoiceCommandParser.extract_answer and is_valid_answer over the answer corpus'
+
+    def setup(self):
+        self.parser = VoiceCommandParser()
+
+    def run(self):
+        for text, question_type in ANSWER_CORPUS:
+            answer = self.parser.extract_answer(text, question_type)
+            self.parser.is_valid_answer(answer['answer'], question_type)
+
+
+class CheckAnswerBenchmark(Benchmark):
+    name = 'check_answer'
+    description = 'StudentResponse.check_answer, grading and saving one response'
+
+    def setup(self):
+        self.response = StudentResponse.objects.select_related('question').order_by('pk').first()
+
+    def run(self):
+        self.response.check_answer()
+
+
+class GradeBenchmark(Benchmark):
+    name = 'grade'
+    description = 'StudentResponse.grade for one answer of every question type'
+
+    def setup(self):
+        self.cases = []
+        for question in _benchmark_exam().questions.all():
+            answer = {'multiple_choice': 'option B', 'true_false': 'it is true'}.get(question.question_type, 'twelve')
+            self.cases.append((question, answer))
+
+    def run(self):
+        for question, answer in self.cases:
+            StudentResponse.grade(question, answer)
+
+
+class FormatForVoiceBenchmark(Benchmark):
+    name = 'format_for_voice'
+    description = 'Question.format_for_voice for every question of an exam'
+
+    def setup(self):
+        self.questions = list(_benchmark_exam().questions.all())
+
+    def run(self):
+        for question in self.questions:
+            question.format_for_voice()
+
+
+class GenerateToneBenchmark(Benchmark):
+    name = 'generate_tone'
+    description = 'VoiceProcessor.generate_tone with the configured tone settings'
+
+    def setup(self):
+        self.processor = VoiceProcessor()
+        tone = getattr(settings, 'VOICE_SETTINGS', {}).get('TONE_SETTINGS', {})
+        self.kwargs = {key: tone[key] for key in ('frequency', 'duration', 'sample_rate') if key in tone}
+
+    def run(self):
+        self.processor.generate_tone(**self.kwargs)
+
+
+class VoiceTurnBenchmark(Benchmark):
+    """One handle_voice_input turn with the fake speech backend, from a fixed starting state"""
+    state = None
+    utterance = None
+
+    def setup(self):
+        self.speech = override_settings(SPEECH_BACKEND={'BACKEND': 'exam.speech.FakeSpeechBackend'})
+        self.speech.enable()
+        self.manager = VoiceFlowManager()
+        self.audio = fake_audio(self.utterance)
+        self.session = ExamSession.objects.create(
+            exam=_benchmark_exam(),
+            student_name='Benchmark',
+            current_state=self.state,
+            deadline_at=timezone.now() + timedelta(days=1),
+        )
+
+    def reset(self):
+        ExamSession.objects.filter(pk=self.session.pk).update(current_state=self.state, current_question_index=0)
+        self.turn_session = ExamSession.objects.select_related('exam').get(pk=self.session.pk)
+        self.turn_session._request_session = {'temp_answer': 'B', 'temp_transcript': 'option B'}
+
+    def run(self):
+        response = self.manager.handle_voice_input(self.turn_session, self.audio)
+        if response.get('error'):
+            raise RuntimeError(f"{self.name} turn failed: {response['message']}")
+
+    def teardown(self):
+        self.session.delete()
+        self.speech.disable()
+
+
+class AnswerTurnBenchmark(VoiceTurnBenchmark):
+    name = 'turn_answer'
+    description = 'handle_voice_input capturing an answer (transcribe, extract, TTS)'
+    state = 'answer_capture'
+    utterance = 'the answer is B'
+
+
+class ConfirmTurnBenchmark(VoiceTurnBenchmark):
+    name = 'turn_confirm'
+    description = 'handle_voice_input confirming an answer (grade, upsert, stats, advance, TTS)'
+    state = 'answer_confirmation'
+    utterance = 'yes'
+
+
+BENCHMARKS = [
+    ParseCommandBenchmark,
+    ExtractAnswerBenchmark,
+    CheckAnswerBenchmark,
+    GradeBenchmark,
+    FormatForVoiceBenchmark,
+    GenerateToneBenchmark,
+    AnswerTurnBenchmark,
+    ConfirmTurnBenchmark,
+]
+
+
+def _benchmark_exam():
+    return Exam.objects.filter(question_count__gt=0).order_by('-question_count', 'pk').first()
+
+
+def seed_benchmark_data(seed=0):
+    """The small fixed dataset every benchmark runs against"""
+    from .load_data import generate_load_data
+
+    generate_load_data(seed=seed, subjects=1, exams=1, questions=20, sessions=5, active_fraction=0.0)
+
+
+def sample_benchmark(benchmark, min_time, min_calls, warmup=3):
+    """Seconds of each run() call, timed one by one until both min_time and min_calls are reached"""
+    benchmark.setup()
+    try:
+        for _ in range(warmup):
+            benchmark.reset()
+            benchmark.run()
+        samples = []
+        spent = 0.0
+        while spent < min_time or len(samples) < min_calls:
+            benchmark.reset()
+            started = time.perf_counter()
+            benchmark.run()
+            elapsed = time.perf_counter() - started
+            samples.append(elapsed)
+            spent += elapsed
+    finally:
+        benchmark.teardown()
+    return samples
+
+
+def run_benchmarks(names=None, min_time=0.5, min_calls=20, rounds=5):
+    """Time the selected benchmarks (all by default) against data already in the database.
+
+    Benchmarks take turns over several rounds, so a burst of noise on the
+    machine lands in one round of each rather than in all of one benchmark.
+    The fastest round's median is the figure to compare between runs.
+    """
+    selected = [benchmark for benchmark in BENCHMARKS if not names or benchmark.name in names]
+    samples = {benchmark.name: [] for benchmark in selected}
+    round_medians = {benchmark.name: [] for benchmark in selected}
+    for _ in range(rounds):
+        for benchmark_class in selected:
+            round_samples = sample_benchmark(
+                benchmark_class(), min_time / rounds, max(1, -(-min_calls // rounds))
+            )
+            samples[benchmark_class.name].extend(round_samples)
+            round_medians[benchmark_class.name].append(statistics.median(round_samples))
+
+    results = []
+    for benchmark_class in selected:
+        name = benchmark_class.name
+        timings = sorted(samples[name])
+        results.append(BenchmarkResult(
+            name=name,
+            calls=len(timings),
+            best_us=round(min(round_medians[name]) * 1e6, 2),
+            median_us=round(statistics.median(timings) * 1e6, 2),
+            p95_us=round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1e6, 2),
+        ))
+    return results
+
+
+def baseline_payload(results):
+    """JSON-ready baseline, with the environment the numbers were measured in"""
+    return {
+        'created_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()}',
+        'results': {result.name: asdict(result) for result in results},
+    }
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """(name, baseline best, current best, relative change) of every benchmark slower than threshold"""
+    regressions = []
+    for result in results:
+        change = relative_change(result, baseline)
+        if change is not None and change > threshold:
+            regressions.append((result.name, baseline['results'][result.name]['best_us'], result.best_us, change))
+    return regressions
+
+
+def relative_change(result, baseline):
+    """How much slower (positive) or faster a result is than the baseline, or None if it has no entry"""
+    previous = (baseline or {}).get('results', {}).get(result.name)
+    if not previous or not previous.get('best_us'):
+        return None
+    return result.best_us / previous['best_us'] - 1
@@ -0,0 +1,161 @@
+from collections import OrderedDict, defaultdict
+from django.utils import timezone
+import asyncio
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Channel every session event is also published on, for the supervisor monitor
+MONITOR_CHANNEL = 'monitor'
+
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 32
+
+# Sentinel event telling subscribers to reload state from the database
+REFRESH = None
+
+# Recent payloads kept per process so pollers can ask for what changed since a version
+MAX_REMEMBERED_STATES = 1024
+
+_recent_states = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def session_channel(session_id):
+    return f'session:{session_id}'
+
+
+def session_state_payload(session):
+    """Serialize the client-visible state of a session"""
+    snapshot = session.exam_snapshot
+    current_question = session.current_question
+
+    return {
+        # A session created in this request still holds the UUID its id defaults to
+        'session_id': str(session.session_id),
+        'version': session.version,
+        'state': session.current_state,
+        'student_name': session.student_name,
+        'student_grade': session.student_grade,
+        'current_question_index': session.current_question_index,
+        'total_questions': snapshot.question_count,
+        'progress_percentage': session.progress_percentage,
+        'time_remaining': session.time_remaining,
+        'time_remaining_formatted': session.time_remaining_formatted,
+        'deadline_at': session.effective_deadline.isoformat(),
+        'paused': session.paused_at is not None,
+        'server_time': timezone.now().isoformat(),
+        'total_score': session.total_score,
+        'max_score': snapshot.total_points,
+        'exam_title': snapshot.title,
+        'subject': snapshot.subject_name,
+        'current_question': {
+            'order': current_question.order,
+            'text': current_question.question_text,
+            'type': current_question.question_type,
+            'options': dict(current_question.options) if current_question.options else None,
+            'points': current_question.points
+        } if current_question else None
+    }
+
+
+def remember_state(payload):
+    """Keep the first payload served for a session version for later deltas"""
+    key = (str(payload['session_id']), payload['version'])
+    with _recent_lock:
+        if key in _recent_states:
+            _recent_states.move_to_end(key)
+            return
+        _recent_states[key] = payload
+        if len(_recent_states) > MAX_REMEMBERED_STATES:
+            _recent_states.popitem(last=False)
+
+
+def state_delta(payload, since):
+    """Return only the fields of payload that changed after version since.
+
+    Returns None when the state at that version is no longer remembered by
+    this process; the caller then falls back to the full payload.
+    """
+    with _recent_lock:
+        previous = _recent_states.get((str(payload['session_id']), since))
+    if previous is None:
+        return None
+
+    delta = {key: value for key, value in payload.items() if previous.get(key) != value}
+    delta.update(session_id=payload['session_id'], version=payload['version'], since=since)
+    return delta
+
+
+class EventBroker:
+    """In-process fan-out of events from request threads to asyncio subscribers"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """Register the running event loop for a channel and return its queue"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[channel].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    def has_subscribers(self, *channels):
+        with self._lock:
+            return any(self._subscribers.get(channel) for channel in channels)
+
+    def publish(self, channel, event):
+        """Deliver an event to every subscriber of a channel; safe from any thread"""
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down; it will unsubscribe itself
+                pass
+
+
+def _offer(queue, event):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+broker = EventBroker()
+
+
+def publish_session_state(session):
+    """Push a session's current state to its own stream and the monitor"""
+    channel = session_channel(session.session_id)
+    if not broker.has_subscribers(channel, MONITOR_CHANNEL):
+        return
+    try:
+        payload = session_state_payload(session)
+    except Exception as e:
+        logger.error(f"Failed to build session event: {str(e)}")
+        return
+    broker.publish(channel, payload)
+    broker.publish(MONITOR_CHANNEL, payload)
+
+
+def publish_session_refresh(session_ids):
+    """Tell subscribers of sessions changed by bulk updates to reload their state"""
+    for session_id in session_ids:
+        broker.publish(session_channel(session_id), REFRESH)
+    broker.publish(MONITOR_CHANNEL, REFRESH)
+
+
+def format_sse(payload, event='state'):
+    """Encode a payload as a Server-Sent Events message"""
+    return f"id: {payload['version']}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from functools import partial
+import logging
+import time
+
+from .events import publish_session_refresh
+from .grading import recompute_session_totals
+from .models import ExamSession
+from .results import record_exam_results
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def expire_overdue_sessions(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Complete every active, unpaused session whose deadline has passed.
+
+    Sessions are closed with one set-based UPDATE per batch, which also
+    stamps completed_at, and their scores and result summaries are finalized
+    from the stored responses in the same transaction. Returns
+    (expired, elapsed_seconds).
+    """
+    now = now or timezone.now()
+    started = time.monotonic()
+    # Sessions without a stored deadline time out by their exam duration, as effective_deadline does
+    ExamSession.objects.active().fill_deadlines()
+    overdue = ExamSession.objects.active().filter(
+        paused_at__isnull=True, deadline_at__lte=now
+    ).order_by('deadline_at').values_list('pk', 'session_id')
+
+    expired = 0
+    while True:
+        batch = list(overdue[:batch_size])
+        if not batch:
+            break
+        expired += _close_batch([pk for pk, _ in batch], now)
+
+    elapsed = time.monotonic() - started
+    if expired:
+        logger.info(f"Expired {expired} overdue sessions in {elapsed:.3f}s")
+    return expired, elapsed
+
+
+def _close_batch(pks, now):
+    """Complete the sessions among pks that are still overdue; returns how many were closed"""
+    with transaction.atomic():
+        # A pause or extension committed since the ids were read takes the session out of the batch
+        ExamSession.objects.filter(pk__in=pks).active().filter(
+            paused_at__isnull=True, deadline_at__lte=now
+        ).update(
+            current_state='exam_complete',
+            completed_at=now,
+            version=F('version') + 1,
+        )
+        closed = dict(ExamSession.objects.filter(
+            pk__in=pks, current_state='exam_complete', completed_at=now
+        ).values_list('pk', 'session_id'))
+        if not closed:
+            return 0
+        recompute_session_totals(list(closed))
+        record_exam_results(ExamSession.objects.filter(pk__in=list(closed)).select_related('exam'))
+        transaction.on_commit(partial(publish_session_refresh, list(closed.values())))
+    return len(closed)
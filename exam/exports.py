@@ -0,0 +1,143 @@
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from itertools import islice
+import csv
+import io
+
+from .models import ExamResult, StudentResponse
+
+# Rows fetched per database round trip; memory stays bounded by this, not the export size
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows written per chunk handed to the client
+ROWS_PER_WRITE = 500
+
+# (column name, ORM lookup) pairs; only these columns are selected
+SESSION_COLUMNS = [
+    ('session_id', 'exam_session__session_id'),
+    ('student_name', 'exam_session__student_name'),
+    ('student_grade', 'exam_session__student_grade'),
+    ('exam_id', 'exam_id'),
+    ('exam_title', 'exam_title'),
+    ('subject', 'subject_name'),
+    ('started_at', 'exam_session__started_at'),
+    ('completed_at', 'completed_at'),
+    ('total_score', 'total_score'),
+    ('max_score', 'max_score'),
+    ('correct_answers', 'correct_answers'),
+    ('answered_questions', 'answered_questions'),
+    ('total_questions', 'total_questions'),
+    ('accuracy_percentage', 'accuracy_percentage'),
+    ('completion_percentage', 'completion_percentage'),
+    ('time_taken_seconds', 'time_taken_seconds'),
+]
+
+RESPONSE_COLUMNS = [
+    ('session_id', 'exam_session__session_id'),
+    ('student_name', 'exam_session__student_name'),
+    ('exam_id', 'question__exam_id'),
+    ('question_order', 'question__order'),
+    ('question_type', 'question__question_type'),
+    ('final_answer', 'final_answer'),
+    ('is_correct', 'is_correct'),
+    ('points_earned', 'points_earned'),
+    ('attempts', 'attempts'),
+    ('answered_at', 'answered_at'),
+]
+
+EXPORT_KINDS = {
+    'sessions': SESSION_COLUMNS,
+    'responses': RESPONSE_COLUMNS,
+}
+
+
+def date_bounds(since=None, until=None):
+    """Turn inclusive since/until dates into an aware [start, end) datetime range"""
+    start = timezone.make_aware(datetime.combine(since, time.min)) if since else None
+    end = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min)) if until else None
+    return start, end
+
+
+def export_rows(kind, exam_id=None, since=None, until=None):
+    """Return (header, row iterator) for an export of completed sessions or their responses"""
+    columns = EXPORT_KINDS[kind]
+    start, end = date_bounds(since, until)
+
+    if kind == 'sessions':
+        # Finished results are read from their stored summaries
+        rows = ExamResult.objects.all()
+        completed_at = 'completed_at'
+        if exam_id:
+            rows = rows.filter(exam_id=exam_id)
+        rows = rows.order_by('completed_at', 'pk')
+    else:
+        rows = StudentResponse.objects.filter(exam_session__current_state='exam_complete')
+        completed_at = 'exam_session__completed_at'
+        if exam_id:
+            rows = rows.filter(question__exam_id=exam_id)
+        # Grouped by session in question order, as the sessions are read from the join
+        rows = rows.order_by('exam_session_id', 'question__order')
+
+    if start:
+        rows = rows.filter(**{f'{completed_at}__gte': start})
+    if end:
+        rows = rows.filter(**{f'{completed_at}__lt': end})
+
+    header = [name for name, _ in columns]
+    rows = rows.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return header, rows
+
+
+def _cell(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _batches(rows):
+    while True:
+        batch = list(islice(rows, ROWS_PER_WRITE))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_csv(header, rows):
+    """Encode rows as CSV, yielding one string per ROWS_PER_WRITE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in _batches(rows):
+        writer.writerows([[_cell(value) for value in row] for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(header, rows):
+    """Encode rows as JSON Lines, yielding one string per ROWS_PER_WRITE rows"""
+    encoder = DjangoJSONEncoder()
+    for batch in _batches(rows):
+        yield ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in batch)
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
+
+
+async def iterate_async(chunks):
+    """Drive a synchronous chunk iterator one chunk at a time from async code.
+
+    Under ASGI Django would otherwise read a synchronous streaming iterator
+    to the end before sending anything.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            break
+        yield chunk
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from functools import partial
+import logging
+
+from .item_analysis import invalidate_item_analysis
+from .models import ExamResult, ExamSession, StudentResponse
+from .results import apply_regraded_responses
+from .stats import record_answer, record_score_changes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def recompute_session_totals(session_ids):
+    """Recompute total_score for the given sessions with one aggregate UPDATE"""
+    points = StudentResponse.objects.filter(
+        exam_session=OuterRef('pk')
+    ).order_by().values('exam_session').annotate(
+        total=Sum('points_earned')
+    ).values('total')
+
+    return ExamSession.objects.filter(pk__in=session_ids).update(
+        total_score=Coalesce(Subquery(points), Value(0)),
+        version=F('version') + 1,
+    )
+
+
+def regrade_responses(questions, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Regrade every stored response to the given questions.
+
+    Responses are streamed in chunks and graded in memory; only rows whose
+    outcome changed are written back, and the totals of the sessions they
+    belong to are recomputed once per chunk.
+    """
+    questions = {question.pk: question for question in questions}
+    result = {'scanned': 0, 'changed': 0, 'sessions': 0}
+    if not questions:
+        return result
+
+    responses = StudentResponse.objects.filter(
+        question_id__in=list(questions)
+    ).only(
+        'id', 'question_id', 'exam_session_id', 'final_answer', 'is_correct', 'points_earned'
+    ).order_by('pk').iterator(chunk_size=chunk_size)
+
+    changed = []
+    session_ids = set()
+    # question id -> [change in correct answers, change in points]
+    answer_deltas = defaultdict(lambda: [0, 0])
+    for response in responses:
+        result['scanned'] += 1
+        is_correct, points_earned = StudentResponse.grade(
+            questions[response.question_id], response.final_answer
+        )
+        if is_correct != response.is_correct or points_earned != response.points_earned:
+            deltas = answer_deltas[response.question_id]
+            deltas[0] += int(is_correct) - int(response.is_correct)
+            deltas[1] += points_earned - response.points_earned
+            response.is_correct = is_correct
+            response.points_earned = points_earned
+            changed.append(response)
+            session_ids.add(response.exam_session_id)
+
+        if len(changed) >= chunk_size:
+            _flush_regraded(changed, session_ids, answer_deltas, result)
+            changed, session_ids = [], set()
+            answer_deltas.clear()
+
+    if changed:
+        _flush_regraded(changed, session_ids, answer_deltas, result)
+
+    logger.info(
+        f"Regraded {result['scanned']} responses: {result['changed']} changed "
+        f"across {result['sessions']} sessions"
+    )
+    return result
+
+
+def _flush_regraded(changed, session_ids, answer_deltas, result):
+    """Write one batch of regraded responses and refresh their session totals, statistics and results"""
+    completed = ExamSession.objects.filter(pk__in=session_ids, current_state='exam_complete')
+    with transaction.atomic():
+        StudentResponse.objects.bulk_update(changed, ['is_correct', 'points_earned'])
+        scores_before = dict(completed.values_list('pk', 'total_score'))
+        recompute_session_totals(session_ids)
+
+        for question_id, (correct, points) in answer_deltas.items():
+            record_answer(question_id, correct=correct, points=points)
+
+        score_changes = defaultdict(list)
+        exam_ids = set()
+        for pk, exam_id, score, max_score in completed.values_list(
+            'pk', 'exam_id', 'total_score', 'exam__total_points'
+        ):
+            exam_ids.add(exam_id)
+            if score != scores_before[pk]:
+                score_changes[exam_id].append((scores_before[pk], score, max_score))
+        record_score_changes(score_changes)
+        # Result pages, the session monitor and exports read the stored summaries
+        apply_regraded_responses(changed)
+        # Item analysis reads completed sessions' responses, which a regrade changes without a new completion
+        transaction.on_commit(partial(invalidate_item_analysis, exam_ids))
+
+    result['changed'] += len(changed)
+    result['sessions'] += len(session_ids)
+
+
+def reconcile_session_scores(sessions=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Find sessions whose incrementally maintained total_score has drifted and fix them.
+
+    Returns (checked, repaired) counts. Drift is detected in SQL, so only the
+    ids of sessions that actually need repair are fetched. The stored results
+    of repaired completed sessions and their exams' statistics are corrected
+    with them.
+    """
+    if sessions is None:
+        sessions = ExamSession.objects.all()
+
+    checked = sessions.count()
+    drifted = sessions.annotate(
+        actual_score=Coalesce(Sum('responses__points_earned'), Value(0))
+    ).filter(~Q(total_score=F('actual_score'))).order_by().values_list('pk', flat=True)
+
+    # Drift is rare, so the id list is small; materialize it before writing to the table
+    drifted = list(drifted)
+    repaired = 0
+    for start in range(0, len(drifted), chunk_size):
+        with transaction.atomic():
+            repaired += recompute_session_totals(drifted[start:start + chunk_size])
+            _reconcile_results(drifted[start:start + chunk_size])
+
+    if repaired:
+        logger.warning(f"Reconciled drifted scores on {repaired} of {checked} sessions")
+    return checked, repaired
+
+
+def _reconcile_results(session_ids):
+    """Bring the stored results of these sessions, and the statistics counting them, back in line with the responses"""
+    scores_before = dict(
+        ExamResult.objects.filter(exam_session_id__in=session_ids).values_list('exam_session_id', 'total_score')
+    )
+    if not scores_before:
+        return
+    responses = StudentResponse.objects.filter(exam_session_id__in=list(scores_before)).only(
+        'id', 'exam_session_id', 'question_id', 'is_correct', 'points_earned'
+    )
+
+    score_changes = defaultdict(list)
+    for result in apply_regraded_responses(responses):
+        score_before = scores_before[result.exam_session_id]
+        if result.total_score != score_before:
+            score_changes[result.exam_id].append((score_before, result.total_score, result.max_score))
+    record_score_changes(score_changes)
@@ -0,0 +1,302 @@
+from dataclasses import dataclass
+from django.db import transaction
+import csv
+import io
+import json
+import logging
+
+from .models import Exam, Question, Subject
+from .tts_cache import prerender_in_background
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ['json', 'csv']
+
+# Questions inserted per INSERT statement
+BULK_BATCH_SIZE = 500
+
+# Validation stops collecting after this many problems
+MAX_REPORTED_ERRORS = 50
+
+OPTION_LETTERS = ['A', 'B', 'C', 'D']
+LANGUAGES = {code for code, _ in Exam.LANGUAGE_CHOICES}
+QUESTION_TYPES = {code for code, _ in Question.QUESTION_TYPES}
+
+# CSV banks have one question per row; rows sharing these columns form one exam
+CSV_EXAM_COLUMNS = ['exam', 'subject', 'grade_level']
+
+
+class QuestionBankError(ValueError):
+    """A question bank failed validation; errors lists every problem found"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} problem(s) in question bank: " + '; '.join(errors[:3]))
+
+
+@dataclass
+class ExamSpec:
+    """A validated exam and its questions, ready to insert"""
+    subject_code: str
+    subject_name: str
+    fields: dict
+    questions: list
+
+    @property
+    def title(self):
+        return self.fields['title']
+
+
+def format_for_filename(filename):
+    """Guess the import format from an uploaded file's extension"""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def parse_question_bank(content, format):
+    """Parse and validate a JSON or CSV question bank entirely in memory.
+
+    Returns a list of ExamSpec, or raises QuestionBankError listing every
+    problem found so a bank can be fixed in one pass.
+    """
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise QuestionBankError(['File is not UTF-8 encoded'])
+
+    if format == 'json':
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            raise QuestionBankError([f"Invalid JSON: {e}"])
+        raw_exams = data.get('exams') if isinstance(data, dict) else data
+        if not isinstance(raw_exams, list):
+            raise QuestionBankError(['Expected a list of exams or an object with an "exams" list'])
+    elif format == 'csv':
+        raw_exams = _exams_from_csv(content)
+    else:
+        raise QuestionBankError([f"Unsupported format: {format}"])
+
+    errors = []
+    bank = []
+    for position, raw_exam in enumerate(raw_exams, start=1):
+        spec = _validate_exam(raw_exam, f"Exam {position}", errors)
+        if spec is not None:
+            bank.append(spec)
+        if len(errors) >= MAX_REPORTED_ERRORS:
+            break
+
+    if not raw_exams:
+        errors.append('The question bank contains no exams')
+    if errors:
+        raise QuestionBankError(errors[:MAX_REPORTED_ERRORS])
+    return bank
+
+
+def _exams_from_csv(content):
+    """Group CSV question rows into exam dicts shaped like the JSON format"""
+    reader = csv.DictReader(io.StringIO(content))
+    missing = [column for column in CSV_EXAM_COLUMNS + ['question_text', 'question_type', 'correct_answer']
+               if column not in (reader.fieldnames or [])]
+    if missing:
+        raise QuestionBankError([f"Missing CSV columns: {', '.join(missing)}"])
+
+    exams = {}
+    for line, row in enumerate(reader, start=2):
+        row = {key: (value or '').strip() for key, value in row.items() if key}
+        key = tuple(row[column] for column in CSV_EXAM_COLUMNS)
+        if key not in exams:
+            exams[key] = {
+                'title': row['exam'],
+                'subject': row['subject'],
+                'subject_name': row.get('subject_name', ''),
+                'grade_level': row['grade_level'],
+                'duration_minutes': row.get('duration_minutes') or None,
+                'language': row.get('language') or None,
+                'instructions': row.get('instructions', ''),
+                'questions': [],
+            }
+        options = {
+            letter: row[f'option_{letter.lower()}']
+            for letter in OPTION_LETTERS if row.get(f'option_{letter.lower()}')
+        }
+        exams[key]['questions'].append({
+            'line': line,
+            'order': row.get('order') or None,
+            'question_text': row['question_text'],
+            'question_type': row['question_type'],
+            'options': options or None,
+            'correct_answer': row['correct_answer'],
+            'points': row.get('points') or None,
+        })
+    return list(exams.values())
+
+
+def _integer(value, default, where, name, errors, minimum=1):
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        errors.append(f"{where}: {name} must be a whole number, got {value!r}")
+        return None
+    if number < minimum:
+        errors.append(f"{where}: {name} must be at least {minimum}")
+        return None
+    return number
+
+
+def _text(raw, name, where, errors, max_length=None, required=True):
+    value = raw.get(name)
+    if isinstance(value, (list, dict)):
+        errors.append(f"{where}: {name} must be text, got a {type(value).__name__}")
+        return ''
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        errors.append(f"{where}: {name} is required")
+    elif max_length and len(value) > max_length:
+        errors.append(f"{where}: {name} is longer than {max_length} characters")
+    return value
+
+
+def _validate_exam(raw, where, errors):
+    """Validate one exam dict, appending problems to errors; returns an ExamSpec or None"""
+    if not isinstance(raw, dict):
+        errors.append(f"{where}: expected an object")
+        return None
+    error_count = len(errors)
+
+    title = _text(raw, 'title', where, errors, max_length=Exam._meta.get_field('title').max_length)
+    if title:
+        where = f"{where} ({title})"
+    subject_code = _text(raw, 'subject', where, errors, max_length=Subject._meta.get_field('code').max_length)
+    subject_name = _text(raw, 'subject_name', where, errors, max_length=100, required=False)
+    grade_level = _text(raw, 'grade_level', where, errors, max_length=Exam._meta.get_field('grade_level').max_length)
+    instructions = _text(raw, 'instructions', where, errors, required=False)
+    duration = _integer(raw.get('duration_minutes'), 45, where, 'duration_minutes', errors)
+    language = raw.get('language') or 'en'
+    # Checked as a string first: a list or object from JSON cannot be looked up in a set
+    if not isinstance(language, str) or language not in LANGUAGES:
+        errors.append(f"{where}: language must be one of {', '.join(sorted(LANGUAGES))}")
+
+    raw_questions = raw.get('questions')
+    if not isinstance(raw_questions, list) or not raw_questions:
+        errors.append(f"{where}: questions must be a non-empty list")
+        raw_questions = []
+
+    questions = []
+    orders = {}
+    for position, raw_question in enumerate(raw_questions, start=1):
+        question = _validate_question(raw_question, position, where, errors)
+        if question is None:
+            continue
+        # unique_together (exam, order) is enforced here rather than by a failed INSERT
+        if question['order'] in orders:
+            errors.append(
+                f"{where}: questions {orders[question['order']]} and {position} both have order {question['order']}"
+            )
+        orders.setdefault(question['order'], position)
+        questions.append(question)
+
+    if len(errors) > error_count:
+        return None
+    return ExamSpec(
+        subject_code=subject_code,
+        subject_name=subject_name or subject_code,
+        fields={
+            'title': title,
+            'grade_level': grade_level,
+            'duration_minutes': duration,
+            'language': language,
+            'instructions': instructions,
+        },
+        questions=questions,
+    )
+
+
+def _validate_question(raw, position, exam_where, errors):
+    """Validate one question dict, appending problems to errors; returns model field values or None"""
+    where = f"{exam_where} question {position}"
+    if not isinstance(raw, dict):
+        errors.append(f"{where}: expected an object")
+        return None
+    if raw.get('line'):
+        where = f"{where} (line {raw['line']})"
+    error_count = len(errors)
+
+    question_text = _text(raw, 'question_text', where, errors)
+    question_type = raw.get('question_type')
+    correct_answer = _text(raw, 'correct_answer', where, errors, max_length=500)
+    order = _integer(raw.get('order'), position, where, 'order', errors)
+    points = _integer(raw.get('points'), 1, where, 'points', errors)
+
+    options = raw.get('options') or None
+    if not isinstance(question_type, str) or question_type not in QUESTION_TYPES:
+        errors.append(f"{where}: question_type must be one of {', '.join(sorted(QUESTION_TYPES))}")
+    elif question_type == 'multiple_choice':
+        if isinstance(options, list):
+            options = dict(zip(OPTION_LETTERS, options))
+        if not isinstance(options, dict) or len(options) < 2:
+            errors.append(f"{where}: multiple choice questions need at least two options")
+        elif set(options) - set(OPTION_LETTERS):
+            errors.append(f"{where}: options must be keyed {', '.join(OPTION_LETTERS)}")
+        elif correct_answer.upper() not in options:
+            errors.append(f"{where}: correct_answer {correct_answer!r} is not one of the options")
+        else:
+            correct_answer = correct_answer.upper()
+            options = {letter: str(options[letter]) for letter in OPTION_LETTERS if letter in options}
+    else:
+        options = None
+        if question_type == 'true_false':
+            if correct_answer.lower() not in ('true', 'false'):
+                errors.append(f"{where}: correct_answer must be true or false")
+            correct_answer = correct_answer.lower()
+
+    if len(errors) > error_count:
+        return None
+    return {
+        'order': order,
+        'question_text': question_text,
+        'question_type': question_type,
+        'options': options,
+        'correct_answer': correct_answer,
+        'points': points,
+    }
+
+
+def _subjects_for(bank):
+    """Map subject codes to Subjects, creating the missing ones in one INSERT"""
+    names = {spec.subject_code: spec.subject_name for spec in bank}
+    subjects = Subject.objects.in_bulk(list(names), field_name='code')
+    missing = [Subject(code=code, name=name) for code, name in names.items() if code not in subjects]
+    if missing:
+        Subject.objects.bulk_create(missing, ignore_conflicts=True)
+        subjects = Subject.objects.in_bulk(list(names), field_name='code')
+    return subjects
+
+
+def import_exams(bank, created_by, prerender=False):
+    """Insert validated exams, one transaction and one bulk INSERT of questions per exam.
+
+    With prerender, question audio is synthesized into the TTS cache on a
+    background thread once the import has committed. Returns (exams, thread),
+    where thread is the prerender thread or None.
+    """
+    subjects = _subjects_for(bank)
+
+    exams = []
+    for spec in bank:
+        with transaction.atomic():
+            exam = Exam.objects.create(subject=subjects[spec.subject_code], created_by=created_by, **spec.fields)
+            Question.objects.bulk_create(
+                [Question(exam=exam, **question) for question in spec.questions],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            # bulk_create skips Question.save(), so settle the totals once per exam
+            Exam.sync_question_totals([exam.pk])
+        exams.append(exam)
+        logger.info(f"Imported exam {exam.pk} ({exam.title}) with {len(spec.questions)} questions")
+
+    thread = prerender_in_background([exam.pk for exam in exams]) if prerender and exams else None
+    return exams, thread
@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from django.core.cache import cache
+import logging
+import numpy as np
+import time
+
+from .models import StudentResponse
+
+logger = logging.getLogger(__name__)
+
+OPTION_LETTERS = ['A', 'B', 'C', 'D']
+
+# Responses fetched per round trip while streaming the response matrix
+STREAM_CHUNK_SIZE = 10000
+
+
+@dataclass(frozen=True)
+class ItemStatistics:
+    """Psychometrics of one question"""
+    question_id: int
+    order: int
+    question_text: str
+    question_type: str
+    correct_answer: str
+    responses: int
+    difficulty: float  # Proportion of students answering correctly
+    discrimination: object  # Corrected point-biserial, or None without variance
+    distractors: object  # Option letter -> times chosen, for multiple choice only
+
+
+@dataclass(frozen=True)
+class ItemAnalysis:
+    """Item analysis of an exam's completed sessions at one content version"""
+    exam_id: int
+    version: int
+    students: int
+    mean_score: float
+    std_score: float
+    kr20: object  # None when there are too few items or no score variance
+    items: tuple
+    elapsed: float
+
+
+def load_response_matrix(snapshot):
+    """Stream an exam's completed responses into a dense students-by-questions matrix.
+
+    Returns (correct, answered, chosen): correct is a float matrix of 0/1
+    outcomes with unanswered questions scored 0, answered counts responses
+    per question, and chosen counts picked options as a (questions, options)
+    matrix that is zero for non multiple-choice columns.
+    """
+    question_ids = np.array([question.id for question in snapshot.questions], dtype=np.int64)
+    order = np.argsort(question_ids)
+    multiple_choice = {q.id for q in snapshot.questions if q.question_type == 'multiple_choice'}
+
+    rows = StudentResponse.objects.filter(
+        question_id__in=question_ids.tolist(),
+        exam_session__current_state='exam_complete',
+    ).order_by().values_list(
+        'exam_session_id', 'question_id', 'is_correct', 'final_answer'
+    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+    session_ids, response_question_ids, outcomes, options = [], [], [], []
+    # Answers repeat heavily ("A", "b", "option c"), so parse each distinct string once
+    parsed = {}
+    for session_id, question_id, is_correct, final_answer in rows:
+        session_ids.append(session_id)
+        response_question_ids.append(question_id)
+        outcomes.append(is_correct)
+        option = -1
+        if question_id in multiple_choice:
+            if final_answer not in parsed:
+                letter = StudentResponse.chosen_option(final_answer)
+                parsed[final_answer] = OPTION_LETTERS.index(letter) if letter else -1
+            option = parsed[final_answer]
+        options.append(option)
+
+    _, student_index = np.unique(np.array(session_ids, dtype=np.int64), return_inverse=True)
+    columns = order[np.searchsorted(question_ids, np.array(response_question_ids, dtype=np.int64), sorter=order)]
+
+    students = int(student_index.max()) + 1 if len(session_ids) else 0
+    correct = np.zeros((students, len(question_ids)))
+    correct[student_index, columns] = np.array(outcomes, dtype=np.float64)
+
+    answered = np.bincount(columns, minlength=len(question_ids))
+
+    options = np.array(options, dtype=np.int64)
+    picked = options >= 0
+    chosen = np.bincount(
+        columns[picked] * len(OPTION_LETTERS) + options[picked],
+        minlength=len(question_ids) * len(OPTION_LETTERS),
+    ).reshape(len(question_ids), len(OPTION_LETTERS))
+    return correct, answered, chosen
+
+
+def analyze_matrix(correct):
+    """Difficulty, corrected point-biserial and KR-20 of a 0/1 students-by-items matrix"""
+    students, items = correct.shape
+    if students == 0:
+        return np.full(items, np.nan), np.full(items, np.nan), None, 0.0, 0.0
+
+    totals = correct.sum(axis=1)
+    difficulty = correct.mean(axis=0)
+
+    # Correlate each item with the rest of the test so it does not inflate its own score
+    rest = totals[:, None] - correct
+    item_std = correct.std(axis=0)
+    rest_std = rest.std(axis=0)
+    covariance = (correct * rest).mean(axis=0) - difficulty * rest.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discrimination = covariance / (item_std * rest_std)
+    discrimination[(item_std == 0) | (rest_std == 0)] = np.nan
+
+    variance = totals.var()
+    kr20 = None
+    if items > 1 and variance > 0:
+        kr20 = float(items / (items - 1) * (1 - (difficulty * (1 - difficulty)).sum() / variance))
+
+    return difficulty, discrimination, kr20, float(totals.mean()), float(totals.std())
+
+
+def compute_item_analysis(snapshot):
+    """Run the item analysis of an exam snapshot against its completed responses"""
+    started = time.monotonic()
+    correct, answered, chosen = load_response_matrix(snapshot)
+    difficulty, discrimination, kr20, mean_score, std_score = analyze_matrix(correct)
+
+    items = []
+    for column, question in enumerate(snapshot.questions):
+        is_multiple_choice = question.question_type == 'multiple_choice'
+        items.append(ItemStatistics(
+            question_id=question.id,
+            order=question.order,
+            question_text=question.question_text,
+            question_type=question.question_type,
+            correct_answer=question.correct_answer,
+            responses=int(answered[column]),
+            difficulty=None if np.isnan(difficulty[column]) else float(difficulty[column]),
+            discrimination=None if np.isnan(discrimination[column]) else float(discrimination[column]),
+            distractors=dict(zip(OPTION_LETTERS, chosen[column].tolist())) if is_multiple_choice else None,
+        ))
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Item analysis of exam {snapshot.exam_id}: {correct.shape[0]} students x "
+        f"{correct.shape[1]} questions in {elapsed:.3f}s"
+    )
+    return ItemAnalysis(
+        exam_id=snapshot.exam_id,
+        version=snapshot.version,
+        students=correct.shape[0],
+        mean_score=mean_score,
+        std_score=std_score,
+        kr20=kr20,
+        items=tuple(items),
+        elapsed=elapsed,
+    )
+
+
+def _revision_key(exam_id):
+    return f'item-analysis-revision:{exam_id}'
+
+
+def invalidate_item_analysis(exam_ids):
+    """Make cached analyses of these exams stale, for changes their cache key cannot see such as a regrade"""
+    for exam_id in exam_ids:
+        key = _revision_key(exam_id)
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def _cache_key(exam):
+    # New completions and content edits change the key; regrades bump the revision
+    completed = exam.stats.sessions_completed if hasattr(exam, 'stats') else 0
+    revision = cache.get(_revision_key(exam.pk), 0)
+    return f'item-analysis:{exam.pk}:{exam.content_version}:{completed}:{revision}'
+
+
+def get_item_analysis(exam, use_cache=True):
+    """Return the item analysis of an exam, computing it only when its inputs changed"""
+    key = _cache_key(exam)
+    if use_cache:
+        analysis = cache.get(key)
+        if analysis is not None:
+            return analysis
+
+    analysis = compute_item_analysis(exam.get_snapshot())
+    cache.set(key, analysis, None)
+    return analysis
@@ -0,0 +1,303 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+import logging
+import numpy as np
+import os
+import uuid
+
+from .models import Exam, ExamResult, ExamSession, Question, StudentResponse, Subject
+from .results import build_exam_result
+from .stats import recompute_exam_stats
+
+logger = logging.getLogger(__name__)
+
+# Generated subjects are tagged with this code prefix so they can be purged again
+SUBJECT_CODE_PREFIX = 'LOAD'
+
+SUBJECT_NAMES = [
+    'Mathematics', 'English', 'Kiswahili', 'Science', 'Social Studies',
+    'Religious Education', 'Agriculture', 'Home Science', 'Art and Craft', 'Music',
+]
+FIRST_NAMES = [
+    'Amani', 'Baraka', 'Imani', 'Wanjiru', 'Achieng', 'Otieno', 'Kamau', 'Njeri', 'Akinyi', 'Zawadi',
+    'Neema', 'Juma', 'Halima', 'Brian', 'Faith', 'Mercy', 'Kevin', 'Grace', 'Cheruiyot', 'Nafula',
+]
+SURNAMES = [
+    'Otieno', 'Kamau', 'Mwangi', 'Wanjiku', 'Odhiambo', 'Kiptoo', 'Mutua', 'Njoroge', 'Ochieng',
+    'Wambui', 'Kariuki', 'Chebet', 'Omondi', 'Mohamed', 'Wafula',
+]
+WORDS = [
+    'river', 'mountain', 'market', 'teacher', 'harvest', 'rain', 'lion', 'school', 'village', 'maize',
+    'water', 'sun', 'forest', 'road', 'goat', 'book', 'family', 'city', 'ocean', 'tree',
+]
+OPTION_LETTERS = ['A', 'B', 'C', 'D']
+DURATIONS = [20, 30, 45, 60]
+
+# Shares of generated sessions by state; the rest are completed
+ABANDONED_FRACTION = 0.02
+ACTIVE_STATE_WEIGHTS = {
+    'student_name': 0.05,
+    'student_grade': 0.05,
+    'exam_briefing': 0.1,
+    'question_reading': 0.3,
+    'answer_capture': 0.3,
+    'answer_confirmation': 0.2,
+}
+# Completed sessions that ran out of time rather than finishing
+EXPIRED_FRACTION = 0.05
+# Fake recordings start with the WebM (EBML) magic number
+WEBM_MAGIC = b'\x1a\x45\xdf\xa3'
+# Rows per UPDATE when writing generated timestamps back
+TIMESTAMP_BATCH_SIZE = 500
+
+
+def _restore_timestamps(objects, field_name, values):
+    """Write generated values of an auto_now_add field over the now() bulk_create stamped on the rows"""
+    for obj, value in zip(objects, values):
+        setattr(obj, field_name, value)
+    if objects:
+        type(objects[0]).objects.bulk_update(objects, [field_name], batch_size=TIMESTAMP_BATCH_SIZE)
+
+
+def purge_load_data():
+    """Delete every generated subject together with its exams, sessions and responses"""
+    deleted, _ = Subject.objects.filter(code__startswith=SUBJECT_CODE_PREFIX).delete()
+    return deleted
+
+
+def _make_question(rng, exam, order):
+    question_type = rng.choice(['multiple_choice', 'true_false', 'short_answer'], p=[0.6, 0.25, 0.15])
+    points = int(rng.choice([1, 2, 3], p=[0.6, 0.3, 0.1]))
+    word, other = rng.choice(WORDS, size=2, replace=False)
+    if question_type == 'multiple_choice':
+        options = dict(zip(OPTION_LETTERS, rng.choice(WORDS, size=4, replace=False).tolist()))
+        return Question(
+            exam=exam, order=order, question_type=question_type, points=points, options=options,
+            question_text=f'Which word goes best with {word}?',
+            correct_answer=str(rng.choice(OPTION_LETTERS)),
+        )
+    if question_type == 'true_false':
+        return Question(
+            exam=exam, order=order, question_type=question_type, points=points,
+            question_text=f'A {word} is bigger than a {other}.',
+            correct_answer=str(rng.choice(['true', 'false'])),
+        )
+    a, b = rng.integers(1, 50, size=2)
+    return Question(
+        exam=exam, order=order, question_type=question_type, points=points,
+        question_text=f'What is {a} plus {b}?', correct_answer=str(a + b),
+    )
+
+
+def _wrong_answer(rng, question):
+    if question.question_type == 'multiple_choice':
+        return str(rng.choice([letter for letter in OPTION_LETTERS if letter != question.correct_answer]))
+    if question.question_type == 'true_false':
+        return 'false' if question.correct_answer == 'true' else 'true'
+    return str(int(question.correct_answer) + int(rng.choice([-2, -1, 1, 10])))
+
+
+def _create_exams(rng, subjects, exams, questions_per_exam, created_by):
+    """Bulk-create subjects, exams and questions; returns the exams with their totals synced"""
+    existing = Subject.objects.filter(code__startswith=SUBJECT_CODE_PREFIX).count()
+    subject_rows = Subject.objects.bulk_create([
+        Subject(code=f'{SUBJECT_CODE_PREFIX}{existing + i:02d}', name=SUBJECT_NAMES[i % len(SUBJECT_NAMES)])
+        for i in range(subjects)
+    ])
+
+    exam_rows = []
+    for i in range(exams):
+        subject = subject_rows[i % len(subject_rows)]
+        grade = int(rng.integers(1, 9))
+        exam_rows.append(Exam(
+            title=f'{subject.name} Grade {grade} Paper {i + 1}',
+            subject=subject,
+            grade_level=f'Grade {grade}',
+            duration_minutes=int(rng.choice(DURATIONS)),
+            language='sw' if subject.name == 'Kiswahili' else 'en',
+            instructions='Listen carefully to each question and answer clearly.',
+            created_by=created_by,
+        ))
+    exam_rows = Exam.objects.bulk_create(exam_rows)
+
+    Question.objects.bulk_create(
+        [_make_question(rng, exam, order) for exam in exam_rows for order in range(1, questions_per_exam + 1)],
+        batch_size=1000,
+    )
+    exam_ids = [exam.pk for exam in exam_rows]
+    Exam.sync_question_totals(exam_ids)
+    return list(Exam.objects.select_related('subject').filter(pk__in=exam_ids).order_by('pk'))
+
+
+def _session_times(rng, now, days, duration, active):
+    """Start time clustered in school hours on weekdays, or within the last exam duration if active"""
+    if active:
+        return now - timedelta(seconds=float(rng.uniform(0, duration * 60)))
+    day = timezone.localtime(now) - timedelta(days=int(rng.integers(1, days + 1)))
+    if day.weekday() >= 5:
+        day -= timedelta(days=day.weekday() - 4)
+    minutes = float(np.clip(rng.normal(11 * 60, 100), 8 * 60, 16 * 60))
+    return day.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(minutes=minutes)
+
+
+def _write_recording(rng, name):
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as recording:
+        recording.write(WEBM_MAGIC + rng.bytes(int(rng.integers(2000, 8000))))
+
+
+def _generate_session(rng, exam, difficulty, now, days, active_fraction, recordings, recording_rng):
+    """Build one unsaved session in a sampled state with its graded responses"""
+    snapshot = exam.get_snapshot()
+    questions = snapshot.questions
+    duration = exam.duration_minutes
+
+    draw = rng.random()
+    if draw < ABANDONED_FRACTION:
+        state = 'setup'
+    elif draw < ABANDONED_FRACTION + active_fraction:
+        state = str(rng.choice(list(ACTIVE_STATE_WEIGHTS), p=list(ACTIVE_STATE_WEIGHTS.values())))
+    else:
+        state = 'exam_complete'
+
+    started_at = _session_times(rng, now, days, duration, active=state in ACTIVE_STATE_WEIGHTS)
+    session = ExamSession(
+        exam=exam,
+        session_id=str(uuid.UUID(bytes=rng.bytes(16), version=4)),
+        current_state=state,
+        started_at=started_at,
+        deadline_at=started_at + timedelta(minutes=duration),
+    )
+    if state != 'setup':
+        session.student_name = f'{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}'
+    if state not in ('setup', 'student_name'):
+        session.student_grade = exam.grade_level
+
+    if state == 'exam_complete':
+        expired = rng.random() < EXPIRED_FRACTION
+        taken = duration * 60 * (1.0 if expired else float(rng.beta(5, 2)))
+        session.completed_at = started_at + timedelta(seconds=taken)
+        # Students who run out of time leave the last questions unanswered
+        answered = int(len(questions) * rng.uniform(0.6, 1.0)) if expired else len(questions)
+        session.current_question_index = len(questions) if not expired else answered
+        elapsed = taken
+    elif state in ('question_reading', 'answer_capture', 'answer_confirmation'):
+        answered = int(rng.integers(0, len(questions))) if questions else 0
+        session.current_question_index = answered
+        elapsed = (now - started_at).total_seconds()
+    else:
+        answered = 0
+        elapsed = 0
+
+    # Rasch model: the chance of a correct answer grows with ability minus question difficulty
+    ability = rng.normal(0.3, 1.0)
+    correct = rng.random(answered) < 1 / (1 + np.exp(difficulty[:answered] - ability))
+    gaps = rng.exponential(1.0, answered + 1)
+    offsets = np.cumsum(gaps)[:answered] / gaps.sum() * elapsed
+
+    responses = []
+    for question, is_correct, offset in zip(questions[:answered], correct, offsets):
+        answer = question.correct_answer if is_correct else _wrong_answer(rng, question)
+        response = StudentResponse(
+            question_id=question.id,
+            transcribed_text=answer if rng.random() < 0.5 else f'my answer is {answer}',
+            final_answer=answer,
+            is_correct=bool(is_correct),
+            points_earned=question.points if is_correct else 0,
+            answered_at=started_at + timedelta(seconds=float(offset)),
+            attempts=int(rng.geometric(0.8)),
+        )
+        if recordings and recording_rng.random() < recordings:
+            response.audio_file.name = (
+                f'responses/{response.answered_at:%Y/%m/%d}/load-{session.session_id}-{question.order}.webm'
+            )
+        responses.append(response)
+    session.total_score = sum(response.points_earned for response in responses)
+    return session, responses
+
+
+def generate_load_data(seed=0, subjects=4, exams=20, questions=25, sessions=10000, active_fraction=0.05,
+                       days=60, recordings=0.0, batch_size=1000):
+    """Bulk-create a deterministic synthetic dataset for benchmarks and query-budget tests.
+
+    The same seed produces the same exams, students, states and answers;
+    timestamps are relative to now so active sessions are still live.
+    Completed sessions get their ExamResult and statistics are recomputed
+    for the generated exams. Returns a dict of row counts.
+    """
+    rng = np.random.default_rng(seed)
+    # A separate stream, so asking for recordings does not change the rest of the data
+    recording_rng = np.random.default_rng([seed, 1])
+    now = timezone.now()
+    created_by, _ = User.objects.get_or_create(username='loadgen', defaults={'is_active': False})
+
+    with transaction.atomic():
+        exam_rows = _create_exams(rng, subjects, exams, questions, created_by)
+    difficulties = {exam.pk: rng.normal(0, 1, exam.question_count) for exam in exam_rows}
+    exam_choice = rng.dirichlet(np.ones(len(exam_rows)) * 2)
+
+    counts = {'subjects': subjects, 'exams': len(exam_rows), 'questions': sum(e.question_count for e in exam_rows),
+              'sessions': 0, 'responses': 0, 'results': 0, 'recordings': 0}
+
+    remaining = sessions
+    while remaining > 0:
+        batch = []
+        for exam_index in rng.choice(len(exam_rows), size=min(batch_size, remaining), p=exam_choice):
+            exam = exam_rows[exam_index]
+            batch.append(_generate_session(
+                rng, exam, difficulties[exam.pk], now, days, active_fraction, recordings, recording_rng
+            ))
+        remaining -= len(batch)
+
+        with transaction.atomic():
+            # bulk_create stamps auto_now_add fields with now(), so the generated times are written back after it
+            started = [session.started_at for session, _ in batch]
+            created = ExamSession.objects.bulk_create([session for session, _ in batch])
+            if created and created[0].pk is None:
+                # Backends that cannot return ids from a bulk INSERT
+                pks = dict(ExamSession.objects.filter(
+                    session_id__in=[session.session_id for session in created]
+                ).values_list('session_id', 'pk'))
+                for session in created:
+                    session.pk = pks[session.session_id]
+            _restore_timestamps(created, 'started_at', started)
+
+            responses = []
+            results = []
+            for session, session_responses in batch:
+                for response in session_responses:
+                    response.exam_session = session
+                responses.extend(session_responses)
+                if session.current_state == 'exam_complete':
+                    results.append(build_exam_result(
+                        session, {response.question_id: response for response in session_responses}
+                    ))
+            answered = [response.answered_at for response in responses]
+            StudentResponse.objects.bulk_create(responses, batch_size=5000)
+            if responses and responses[0].pk is None:
+                # A session answers each question at most once here, so session and question identify a row
+                pks = {
+                    (session_id, question_id): pk for pk, session_id, question_id in StudentResponse.objects.filter(
+                        exam_session__in=created
+                    ).values_list('pk', 'exam_session_id', 'question_id')
+                }
+                for response in responses:
+                    response.pk = pks[response.exam_session_id, response.question_id]
+            _restore_timestamps(responses, 'answered_at', answered)
+            ExamResult.objects.bulk_create(results, batch_size=1000)
+
+        for response in responses:
+            if response.audio_file:
+                _write_recording(recording_rng, response.audio_file.name)
+                counts['recordings'] += 1
+        counts['sessions'] += len(batch)
+        counts['responses'] += len(responses)
+        counts['results'] += len(results)
+        logger.info(f"Generated {counts['sessions']}/{sessions} sessions, {counts['responses']} responses")
+
+    recompute_exam_stats([exam.pk for exam in exam_rows])
+    return counts
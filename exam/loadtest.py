@@ -0,0 +1,420 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+import asyncio
+import heapq
+import json
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError
+from django.http.request import split_domain_port, validate_host
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+import numpy as np
+import requests
+
+from .speech import fake_audio
+from .tracing import TRACE_HEADER
+
+# What the browser client says before recording the student's name (static/js/voice_exam.js)
+WELCOME_TEXT = ('Welcome to the voice exam system. I will be your voice assistant throughout this exam. '
+                'First, please state your full name after the tone.')
+
+# Failed turns a student retries before giving up, as the browser client does
+MAX_RETRIES = 3
+
+# Turns after which a student that has not finished is counted as stuck
+MAX_TURNS_PER_QUESTION = 8
+
+PERCENTILES = (50, 95, 99)
+
+# Slowest voice turns listed in the report by trace id
+SLOWEST_TURNS = 10
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict
+    body: bytes
+
+    def json(self):
+        """The decoded JSON body, or {} for anything else (an HTML error page, audio)"""
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return {}
+
+
+class AsgiClient:
+    """One student's cookie jar against an ASGI application in this process"""
+
+    def __init__(self, application, host):
+        self.application = application
+        self.host = host
+        self.cookies = SimpleCookie()
+
+    async def request(self, method, path, data=None, files=None, headers=None):
+        path, _, query = path.partition('?')
+        if method == 'GET' and data:
+            query = urlencode(data)
+            body, content_type = b'', None
+        elif files:
+            body = encode_multipart(BOUNDARY, {**(data or {}), **files})
+            content_type = MULTIPART_CONTENT
+        else:
+            body = urlencode(data or {}).encode('ascii')
+            content_type = 'application/x-www-form-urlencoded'
+
+        raw_headers = [(b'host', self.host.encode('ascii'))]
+        if content_type:
+            raw_headers += [(b'content-type', content_type.encode('ascii')),
+                            (b'content-length', str(len(body)).encode('ascii'))]
+        if self.cookies:
+            cookie = '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies.items())
+            raw_headers.append((b'cookie', cookie.encode('latin-1')))
+        for name, value in (headers or {}).items():
+            raw_headers.append((name.lower().encode('ascii'), value.encode('latin-1')))
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode('ascii'),
+            'query_string': query.encode('ascii'),
+            'root_path': '',
+            'headers': raw_headers,
+            'client': ('127.0.0.1', 0),
+            'server': (self.host, 80),
+        }
+        finished = asyncio.Event()
+        request_sent = False
+        status, response_headers, chunks = 500, {}, []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                for name, value in message.get('headers', []):
+                    name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+                    if name == 'set-cookie':
+                        self.cookies.load(value)
+                    response_headers[name] = value
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body', False):
+                    finished.set()
+
+        try:
+            await self.application(scope, receive, send)
+        finally:
+            finished.set()
+        return Response(status, response_headers, b''.join(chunks))
+
+    def cookie(self, name):
+        return self.cookies[name].value if name in self.cookies else None
+
+
+class HttpClient:
+    """One student's HTTP session against a running server"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    async def request(self, method, path, data=None, files=None, headers=None):
+        def send():
+            upload = {name: (f.name, f.read(), f.content_type) for name, f in (files or {}).items()}
+            response = self.session.request(
+                method,
+                self.base_url + path,
+                params=data if method == 'GET' else None,
+                data=data if method != 'GET' else None,
+                files=upload or None,
+                headers=headers,
+                timeout=self.timeout,
+            )
+            return Response(response.status_code, {k.lower(): v for k, v in response.headers.items()},
+                            response.content)
+
+        return await asyncio.get_running_loop().run_in_executor(None, send)
+
+    def cookie(self, name):
+        return self.session.cookies.get(name)
+
+
+def asgi_host():
+    """A Host header this project's ALLOWED_HOSTS accepts"""
+    allowed = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed:
+        allowed = ['.localhost', '127.0.0.1', '[::1]']
+    for pattern in allowed:
+        candidate = 'localhost' if pattern == '*' else pattern.lstrip('.')
+        if validate_host(split_domain_port(candidate)[0], allowed):
+            return candidate
+    return 'localhost'
+
+
+class LockWaitMonitor:
+    """Times SQLite write statements on every connection opened while installed.
+
+    SQLite waits for a busy lock inside the statement, so a write slower than
+    the threshold is counted as having waited on a lock; 'database is locked'
+    errors are the writes that gave up.
+    """
+
+    def __init__(self, threshold_seconds):
+        self.threshold = threshold_seconds
+        self.waits = []
+        self.locked_errors = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                with self._lock:
+                    self.locked_errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                with self._lock:
+                    self.waits.append(elapsed)
+
+    def install(self, sender, connection, **kwargs):
+        if connection.vendor == 'sqlite' and self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+@dataclass
+class LoadTestStats:
+    """Latency samples and outcomes of one load test run"""
+    endpoints: dict = field(default_factory=lambda: defaultdict(list))
+    states: dict = field(default_factory=lambda: defaultdict(list))
+    errors: dict = field(default_factory=lambda: defaultdict(int))
+    state_errors: dict = field(default_factory=lambda: defaultdict(int))
+    session_ids: list = field(default_factory=list)
+    # Heap of (seconds, trace id, state) of the slowest voice turns
+    slowest_turns: list = field(default_factory=list)
+    completed: int = 0
+    abandoned: int = 0
+    turns: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def requests(self):
+        return sum(len(samples) for samples in self.endpoints.values())
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+    def note_turn(self, seconds, trace_id, state):
+        entry = (seconds, trace_id or '', state or '')
+        if len(self.slowest_turns) < SLOWEST_TURNS:
+            heapq.heappush(self.slowest_turns, entry)
+        else:
+            heapq.heappushpop(self.slowest_turns, entry)
+
+    def summary(self, lock_monitor=None):
+        """Plain-data report: percentiles in milliseconds, rates per second"""
+        def table(samples, errors):
+            rows = {}
+            for name, seconds in sorted(samples.items()):
+                milliseconds = np.array(seconds) * 1000
+                rows[name] = {
+                    'requests': len(seconds),
+                    'errors': errors.get(name, 0),
+                    **{f'p{q}': round(float(np.percentile(milliseconds, q)), 1) for q in PERCENTILES},
+                    'max': round(float(milliseconds.max()), 1),
+                }
+            return rows
+
+        elapsed = self.elapsed or 1e-9
+        report = {
+            'elapsed_seconds': round(self.elapsed, 2),
+            'requests': self.requests,
+            'requests_per_second': round(self.requests / elapsed, 1),
+            'turns': self.turns,
+            'turns_per_second': round(self.turns / elapsed, 1),
+            'exams_completed': self.completed,
+            'exams_abandoned': self.abandoned,
+            'exams_per_minute': round(self.completed * 60 / elapsed, 1),
+            'error_rate': round(self.error_count / self.requests, 4) if self.requests else 0.0,
+            'endpoints': table(self.endpoints, self.errors),
+            'states': table(self.states, self.state_errors),
+            'slowest_turns': [
+                {'trace_id': trace_id, 'state': state, 'ms': round(seconds * 1000, 1)}
+                for seconds, trace_id, state in sorted(self.slowest_turns, reverse=True)
+            ],
+        }
+        if lock_monitor is not None:
+            report['sqlite_lock_waits'] = {
+                'threshold_ms': round(lock_monitor.threshold * 1000, 1),
+                'waits': len(lock_monitor.waits),
+                'total_seconds': round(sum(lock_monitor.waits), 3),
+                'max_ms': round(max(lock_monitor.waits, default=0) * 1000, 1),
+                'locked_errors': lock_monitor.locked_errors,
+            }
+        return report
+
+
+class VirtualStudent:
+    """Walks one exam session through the voice flow the way the browser client drives it"""
+
+    def __init__(self, number, client, exam_id, stats, rng, think_seconds=0.0):
+        self.number = number
+        self.client = client
+        self.exam_id = exam_id
+        self.stats = stats
+        self.rng = rng
+        self.think_seconds = think_seconds
+        self.session_id = None
+        self.question = None
+
+    async def call(self, endpoint, method, path, state=None, **kwargs):
+        if method == 'POST':
+            # Django's CSRF check, satisfied like the browser client does
+            kwargs['headers'] = {'X-CSRFToken': self.client.cookie('csrftoken') or '', **kwargs.get('headers', {})}
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except (requests.RequestException, OSError) as e:
+            response = Response(599, {}, str(e).encode('utf-8'))
+        elapsed = time.perf_counter() - started
+
+        failed = response.status >= 400
+        if not failed and endpoint == 'voice_process':
+            failed = bool(response.json().get('error'))
+        self.stats.endpoints[endpoint].append(elapsed)
+        if endpoint == 'voice_process':
+            self.stats.note_turn(elapsed, response.headers.get(TRACE_HEADER.lower()), state)
+        if failed:
+            self.stats.errors[endpoint] += 1
+        if state is not None:
+            self.stats.states[state].append(elapsed)
+            if failed:
+                self.stats.state_errors[state] += 1
+        return response, failed
+
+    async def think(self):
+        if self.think_seconds:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_seconds))
+
+    def utterance(self, state):
+        """What the student says in a state; answers are picked at random"""
+        if state == 'student_name':
+            return f'Student {self.number}'
+        if state == 'student_grade':
+            return 'grade four'
+        if state == 'exam_briefing':
+            return 'start'
+        if state == 'question_reading':
+            return 'okay'
+        if state == 'answer_capture':
+            question_type = self.question['type'] if self.question else 'short_answer'
+            if question_type == 'multiple_choice':
+                options = sorted((self.question or {}).get('options') or {'A': '', 'B': ''})
+                return f'option {self.rng.choice(options)}'
+            if question_type == 'true_false':
+                return self.rng.choice(['true', 'false'])
+            return 'twelve'
+        return 'yes'
+
+    async def run(self):
+        await self.call('exam_page', 'GET', '/')
+        response, failed = await self.call('start_session', 'POST', '/', data={'exam_id': str(self.exam_id)})
+        if failed:
+            self.stats.abandoned += 1
+            return
+        started = response.json()
+        self.session_id = started['session_id']
+        self.stats.session_ids.append(self.session_id)
+        turn_limit = MAX_TURNS_PER_QUESTION * (started['total_questions'] + 3)
+
+        await self.call('tts', 'POST', '/voice/tts/', data={'text': WELCOME_TEXT})
+        await self.call('tone', 'GET', '/voice/tone/')
+
+        state, retries = 'student_name', 0
+        for _ in range(turn_limit):
+            await self.think()
+            if state == 'question_reading':
+                # The student hears the question; the harness reads its type and options from the state endpoint
+                response, failed = await self.call(
+                    'session_state', 'GET', '/session/state/', data={'session_id': self.session_id}
+                )
+                if not failed:
+                    self.question = response.json().get('current_question')
+
+            audio = SimpleUploadedFile('turn.webm', fake_audio(self.utterance(state)), 'audio/webm')
+            response, failed = await self.call(
+                'voice_process', 'POST', '/voice/process/', state=state,
+                data={'session_id': self.session_id}, files={'audio': audio},
+                headers={TRACE_HEADER: uuid.uuid4().hex},
+            )
+            self.stats.turns += 1
+            reply = response.json()
+            if failed:
+                if reply.get('state') == 'exam_complete':
+                    break
+                retries += 1
+                if retries > MAX_RETRIES:
+                    break
+                continue
+            retries = 0
+
+            if reply.get('text'):
+                await self.call('tts', 'POST', '/voice/tts/', data={
+                    'text': reply['text'], 'cache': int(reply.get('cacheable', True))
+                })
+            if reply.get('include_tone'):
+                await self.call('tone', 'GET', '/voice/tone/')
+            state = reply.get('state', state)
+            if state == 'exam_complete':
+                self.stats.completed += 1
+                return
+        self.stats.abandoned += 1
+
+
+async def run_load_test(make_client, exam_id, students, seed=0, think_seconds=0.0, ramp_up_seconds=0.0):
+    """Run students concurrently through an exam; make_client() returns a fresh AsgiClient or HttpClient"""
+    stats = LoadTestStats()
+
+    async def student(number):
+        rng = random.Random(f'{seed}-{number}')
+        if ramp_up_seconds:
+            await asyncio.sleep(ramp_up_seconds * number / students)
+        await VirtualStudent(number, make_client(), exam_id, stats, rng, think_seconds).run()
+
+    # HTTP clients block in threads; give every student one for the length of the run
+    with ThreadPoolExecutor(max_workers=max(students, 1)) as executor:
+        asyncio.get_running_loop().set_default_executor(executor)
+        started = time.perf_counter()
+        await asyncio.gather(*(student(number) for number in range(1, students + 1)))
+        stats.elapsed = time.perf_counter() - started
+    return stats
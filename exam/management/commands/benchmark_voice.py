@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from exam.benchmarks import (
+    BENCHMARKS, baseline_payload, compare_to_baseline, relative_change, run_benchmarks, seed_benchmark_data
+)
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = 'Time the voice hot path in isolation and compare it with a saved baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline',
+            default='voice_benchmarks.json',
+            help='Baseline file; compared against when it exists',
+        )
+        parser.add_argument('--save', action='store_true', help='Write this run as the new baseline')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.15,
+            help='Fail when a benchmark is slower than the baseline by more than this fraction',
+        )
+        parser.add_argument(
+            '--only',
+            action='append',
+            choices=[benchmark.name for benchmark in BENCHMARKS],
+            help='Run only this benchmark (may be repeated)',
+        )
+        parser.add_argument('--min-time', type=float, default=1.0, help='Seconds spent timing each benchmark')
+        parser.add_argument('--rounds', type=int, default=5, help='Rounds the timing of each benchmark is split into')
+        parser.add_argument('--min-calls', type=int, default=20, help='Fewest timed calls per benchmark')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the benchmark dataset')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for benchmark in BENCHMARKS:
+                self.stdout.write(f'{benchmark.name:<18} {benchmark.description}')
+            return
+
+        if options['rounds'] < 1 or options['min_calls'] < 1:
+            raise CommandError('--rounds and --min-calls must be at least 1')
+
+        # A throwaway database, as the test runner uses, so runs never touch real data
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # DEBUG would log every query and skew the database-bound benchmarks
+            with override_settings(DEBUG=False):
+                seed_benchmark_data(options['seed'])
+                results = run_benchmarks(
+                    options['only'], options['min_time'], options['min_calls'], options['rounds']
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        baseline = None
+        if os.path.exists(options['baseline']) and not options['save']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        self.stdout.write(f"{'benchmark':<18} {'calls':>7} {'best us':>11} {'median us':>11} {'p95 us':>11}  baseline")
+        for result in results:
+            line = (f'{result.name:<18} {result.calls:>7} {result.best_us:>11.2f} '
+                    f'{result.median_us:>11.2f} {result.p95_us:>11.2f}')
+            change = relative_change(result, baseline)
+            if change is not None:
+                line += f'  {change:+.1%}'
+            self.stdout.write(line)
+
+        if options['save']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(baseline_payload(results), baseline_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        if baseline is None:
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save to record one")
+            return
+
+        regressions = compare_to_baseline(results, baseline, options['threshold'])
+        if regressions:
+            for name, before, after, change in regressions:
+                self.stderr.write(f'{name}: {before:.2f} us -> {after:.2f} us ({change:+.1%})')
+            raise CommandError(
+                f"{len(regressions)} benchmarks regressed by more than {options['threshold']:.0%} "
+                f"against the baseline from {baseline.get('created_at', 'an unknown date')}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {options['threshold']:.0%}"))
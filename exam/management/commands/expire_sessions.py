@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from exam.expiry import expire_overdue_sessions, DEFAULT_BATCH_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = 'Mark active sessions whose deadline has passed as complete'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Sessions closed per UPDATE',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sweeping every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=30,
+            help='Seconds between sweeps in --loop mode',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired, elapsed = expire_overdue_sessions(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Expired {expired} sessions in {elapsed:.3f}s'
+            ))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
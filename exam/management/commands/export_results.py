@@ -0,0 +1,34 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from exam.exports import EXPORT_FORMATS, EXPORT_KINDS, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream completed sessions or their responses to a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(EXPORT_KINDS), default='sessions')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--exam', type=int, help='Only export this exam ID')
+        parser.add_argument('--since', type=date.fromisoformat, help='First completion date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=date.fromisoformat, help='Last completion date (YYYY-MM-DD), inclusive')
+        parser.add_argument('--output', '-o', help='File to write; defaults to standard output')
+
+    def handle(self, *args, **options):
+        encode, _ = EXPORT_FORMATS[options['format']]
+        chunks = encode(*export_rows(
+            options['kind'], exam_id=options['exam'], since=options['since'], until=options['until']
+        ))
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        except OSError as e:
+            raise CommandError(f"Cannot write {options['output']}: {e}")
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
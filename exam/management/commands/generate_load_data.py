@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from exam.load_data import SUBJECT_CODE_PREFIX, generate_load_data, purge_load_data
+import time
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create a large, deterministic synthetic dataset for benchmarks and query-budget tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same data')
+        parser.add_argument('--subjects', type=int, default=4)
+        parser.add_argument('--exams', type=int, default=20)
+        parser.add_argument('--questions', type=int, default=25, help='Questions per exam')
+        parser.add_argument(
+            '--sessions',
+            type=int,
+            default=10000,
+            help='Sessions to create; completed ones answer about every question, '
+                 'so 40000 sessions of 25 questions is roughly 1M responses',
+        )
+        parser.add_argument(
+            '--active-fraction',
+            type=float,
+            default=0.05,
+            help='Share of sessions still in progress',
+        )
+        parser.add_argument('--days', type=int, default=60, help='Spread completed sessions over this many days')
+        parser.add_argument(
+            '--recordings',
+            type=float,
+            default=0.0,
+            help='Share of responses that get a fake recording file under MEDIA_ROOT',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions written per transaction')
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help=f'First delete everything generated before (subjects coded {SUBJECT_CODE_PREFIX}*)',
+        )
+
+    def handle(self, *args, **options):
+        if options['subjects'] < 1 or options['exams'] < 1 or options['questions'] < 1:
+            raise CommandError('--subjects, --exams and --questions must be at least 1')
+        if not 0 <= options['active_fraction'] <= 0.98:
+            raise CommandError('--active-fraction must be between 0 and 0.98')
+
+        if options['purge']:
+            deleted = purge_load_data()
+            self.stdout.write(f'Deleted {deleted} previously generated rows')
+
+        started = time.monotonic()
+        counts = generate_load_data(
+            seed=options['seed'],
+            subjects=options['subjects'],
+            exams=options['exams'],
+            questions=options['questions'],
+            sessions=options['sessions'],
+            active_fraction=options['active_fraction'],
+            days=options['days'],
+            recordings=options['recordings'],
+            batch_size=options['batch_size'],
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from exam.imports import IMPORT_FORMATS, QuestionBankError, format_for_filename, import_exams, parse_question_bank
+import time
+
+
+class Command(BaseCommand):
+    help = 'Import exams and their questions from a JSON or CSV question bank'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Question bank file')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument(
+            '--user',
+            default='admin',
+            help='Username recorded as the creator of the imported exams',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the bank without writing anything',
+        )
+        parser.add_argument(
+            '--prerender',
+            action='store_true',
+            help='Synthesize question audio into the TTS cache after importing',
+        )
+
+    def handle(self, *args, **options):
+        format = options['format'] or format_for_filename(options['path'])
+        if format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format')
+
+        try:
+            with open(options['path'], 'rb') as bank_file:
+                content = bank_file.read()
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        started = time.monotonic()
+        try:
+            bank = parse_question_bank(content, format)
+        except QuestionBankError as e:
+            for error in e.errors:
+                self.stderr.write(error)
+            raise CommandError(f'Question bank is invalid ({len(e.errors)} problems); nothing was imported')
+
+        question_total = sum(len(spec.questions) for spec in bank)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Question bank is valid: {len(bank)} exams, {question_total} questions'
+            ))
+            return
+
+        try:
+            created_by = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        exams, prerender = import_exams(bank, created_by, prerender=options['prerender'])
+        for exam in exams:
+            self.stdout.write(f'Created exam {exam.pk}: {exam.title}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(exams)} exams with {question_total} questions in {time.monotonic() - started:.2f}s'
+        ))
+
+        if prerender:
+            # The command's process would end the daemon thread, so wait for it here
+            self.stdout.write('Prerendering question audio...')
+            prerender.join()
+            self.stdout.write(self.style.SUCCESS('Prerender finished'))
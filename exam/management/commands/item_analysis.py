@@ -0,0 +1,54 @@
+from dataclasses import asdict
+from django.core.management.base import BaseCommand, CommandError
+from exam.item_analysis import get_item_analysis
+from exam.models import Exam
+import json
+
+
+def _format(value, digits=2):
+    return '-' if value is None else f'{value:.{digits}f}'
+
+
+class Command(BaseCommand):
+    help = 'Compute item difficulty, discrimination, distractor use and KR-20 reliability for an exam'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam', type=int, help='Exam ID')
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Recompute even if a cached analysis exists for this exam version',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the analysis as JSON',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            exam = Exam.objects.select_related('stats').get(pk=options['exam'])
+        except Exam.DoesNotExist:
+            raise CommandError(f"Exam {options['exam']} does not exist")
+
+        analysis = get_item_analysis(exam, use_cache=not options['no_cache'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(asdict(analysis), indent=2))
+            return
+
+        self.stdout.write(f'{exam.title}: {analysis.students} students, mean {_format(analysis.mean_score)} '
+                          f'(sd {_format(analysis.std_score)}), KR-20 {_format(analysis.kr20, 3)}')
+        self.stdout.write(f"{'Q':>3}  {'n':>7}  {'p':>5}  {'r_pb':>6}  distractors")
+        for item in analysis.items:
+            distractors = ''
+            if item.distractors:
+                distractors = '  '.join(
+                    f"{'*' if option == item.correct_answer.upper() else ' '}{option}:{count}"
+                    for option, count in item.distractors.items()
+                )
+            self.stdout.write(
+                f'{item.order:>3}  {item.responses:>7}  {_format(item.difficulty):>5}  '
+                f'{_format(item.discrimination):>6}  {distractors}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Analyzed in {analysis.elapsed:.3f}s'))
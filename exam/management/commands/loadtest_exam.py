@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from exam.loadtest import AsgiClient, HttpClient, LockWaitMonitor, asgi_host, run_load_test
+from exam.models import Exam, ExamSession
+from exam.stats import recompute_exam_stats
+import asyncio
+import glob
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = 'Run virtual students concurrently through a whole voice exam and report latency and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20, help='Concurrent virtual students')
+        parser.add_argument('--exam', type=int, help='Exam ID; defaults to the first active exam')
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server; without it the ASGI application runs in this process',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same answers and think times')
+        parser.add_argument(
+            '--think-ms',
+            type=float,
+            default=0,
+            help='Mean pause before each spoken turn (exponentially distributed); 0 is a stress test',
+        )
+        parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which students start')
+        parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout with --url')
+        parser.add_argument(
+            '--speech-latency-ms',
+            type=float,
+            default=0,
+            help='In process: median latency of the fake speech backend for each call (lognormal)',
+        )
+        parser.add_argument(
+            '--speech-url',
+            help='In process: use the Google REST backend against this stand-in (see speech_standin) '
+                 'instead of the fake backend',
+        )
+        parser.add_argument(
+            '--lock-threshold-ms',
+            type=float,
+            default=20,
+            help='In process: SQLite writes slower than this are counted as lock waits',
+        )
+        parser.add_argument('--json', dest='json_path', help='Also write the report to this file as JSON')
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete the sessions and recordings the run created and recompute the exam statistics',
+        )
+
+    def handle(self, *args, **options):
+        if options['students'] < 1:
+            raise CommandError('--students must be at least 1')
+
+        exams = Exam.objects.filter(is_active=True, question_count__gt=0)
+        exam = exams.filter(pk=options['exam']).first() if options['exam'] else exams.order_by('pk').first()
+        if exam is None:
+            raise CommandError('No active exam with questions; pass --exam or import one first')
+
+        self.stdout.write(
+            f"{options['students']} students on exam {exam.pk} ({exam.title}, {exam.question_count} questions) "
+            f"via {options['url'] or 'in-process ASGI'}"
+        )
+        lock_monitor = None
+        if options['url']:
+            stats = asyncio.run(self._run(options, exam, lambda: HttpClient(options['url'], options['timeout'])))
+        else:
+            from django.core.asgi import get_asgi_application
+
+            application = get_asgi_application()
+            host = asgi_host()
+            lock_monitor = LockWaitMonitor(options['lock_threshold_ms'] / 1000)
+            connection_created.connect(lock_monitor.install)
+            try:
+                with override_settings(**self._speech_settings(options)):
+                    stats = asyncio.run(self._run(options, exam, lambda: AsgiClient(application, host)))
+            finally:
+                connection_created.disconnect(lock_monitor.install)
+
+        report = stats.summary(lock_monitor)
+        self._print_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['json_path']}")
+
+        if options['cleanup']:
+            self._cleanup(exam, stats.session_ids)
+
+    def _run(self, options, exam, make_client):
+        return run_load_test(
+            make_client,
+            exam.pk,
+            options['students'],
+            seed=options['seed'],
+            think_seconds=options['think_ms'] / 1000,
+            ramp_up_seconds=options['ramp_up'],
+        )
+
+    def _speech_settings(self, options):
+        """Point the in-process app at canned speech, never at Google"""
+        if options['speech_url']:
+            return {
+                'SPEECH_BACKEND': {'BACKEND': 'exam.speech.GoogleRestBackend', 'OPTIONS': {'api_key': 'loadtest'}},
+                'GOOGLE_SPEECH_BASE_URL': options['speech_url'],
+                'GOOGLE_TTS_BASE_URL': options['speech_url'],
+            }
+        latency = None
+        if options['speech_latency_ms']:
+            latency = {'distribution': 'lognormal', 'median_ms': options['speech_latency_ms'], 'sigma': 0.4}
+        return {
+            'SPEECH_BACKEND': {
+                'BACKEND': 'exam.speech.FakeSpeechBackend',
+                'OPTIONS': {'seed': options['seed'], 'latency': {'transcribe': latency, 'synthesize': latency}},
+            },
+        }
+
+    def _print_report(self, report):
+        def table(title, rows):
+            self.stdout.write(f'\n{title:<22} {"requests":>8} {"errors":>7} '
+                              f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+            for name, row in rows.items():
+                self.stdout.write(f'{name:<22} {row["requests"]:>8} {row["errors"]:>7} {row["p50"]:>8} '
+                                  f'{row["p95"]:>8} {row["p99"]:>8} {row["max"]:>8}')
+
+        table('Endpoint', report['endpoints'])
+        table('Voice turn by state', report['states'])
+        self.stdout.write(
+            f"\n{report['requests']} requests in {report['elapsed_seconds']}s: "
+            f"{report['requests_per_second']} requests/s, {report['turns_per_second']} voice turns/s, "
+            f"error rate {report['error_rate']:.2%}"
+        )
+        self.stdout.write(
+            f"{report['exams_completed']} exams completed ({report['exams_per_minute']}/min), "
+            f"{report['exams_abandoned']} abandoned"
+        )
+        if report['slowest_turns']:
+            self.stdout.write('\nSlowest voice turns (look one up with slow_turns --trace):')
+            for turn in report['slowest_turns']:
+                self.stdout.write(f"  {turn['ms']:>8} ms  {turn['state']:<20} {turn['trace_id']}")
+        locks = report.get('sqlite_lock_waits')
+        if locks:
+            self.stdout.write(
+                f"SQLite: {locks['waits']} writes waited over {locks['threshold_ms']} ms "
+                f"({locks['total_seconds']}s in total, longest {locks['max_ms']} ms), "
+                f"{locks['locked_errors']} 'database is locked' errors"
+            )
+        else:
+            self.stdout.write('SQLite lock waits are only measured in process (without --url)')
+
+        style = self.style.SUCCESS if not report['exams_abandoned'] and not report['error_rate'] else self.style.WARNING
+        self.stdout.write(style('Load test finished'))
+
+    def _cleanup(self, exam, session_ids):
+        deleted, _ = ExamSession.objects.filter(session_id__in=session_ids).delete()
+        for session_id in session_ids:
+            for path in glob.glob(os.path.join(settings.MEDIA_ROOT, 'recordings', f'recording_{session_id}_*')):
+                os.remove(path)
+        recompute_exam_stats([exam.pk])
+        self.stdout.write(f'Deleted {len(session_ids)} sessions ({deleted} rows) and their recordings')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from exam.models import ExamSession
+from exam.results import DEFAULT_CHUNK_SIZE, rebuild_exam_results
+
+
+class Command(BaseCommand):
+    help = 'Write result summaries for completed sessions that do not have one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exam',
+            type=int,
+            help='Only rebuild results for sessions of this exam ID',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Replace existing summaries too, e.g. after regrading',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Sessions written per transaction',
+        )
+
+    def handle(self, *args, **options):
+        sessions = ExamSession.objects.all()
+        if options['exam']:
+            sessions = sessions.filter(exam_id=options['exam'])
+
+        processed = rebuild_exam_results(
+            sessions, replace=options['replace'], chunk_size=options['chunk_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {processed} exam results'))
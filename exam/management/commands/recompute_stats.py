@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from exam.stats import recompute_exam_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the incrementally maintained exam and question statistics from sessions and responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exam',
+            type=int,
+            action='append',
+            help='Only recompute this exam ID (may be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        recomputed = recompute_exam_stats(options['exam'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed statistics for {recomputed} exams'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from exam.models import ExamSession
+from exam.grading import reconcile_session_scores
+import time
+
+
+class Command(BaseCommand):
+    help = 'Detect and repair sessions whose total_score has drifted from their responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since-hours',
+            type=float,
+            default=None,
+            help='Only check sessions started within this many hours (default: all sessions)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, reconciling every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='Seconds between runs in --loop mode',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sessions = ExamSession.objects.all()
+            if options['since_hours'] is not None:
+                sessions = sessions.filter(
+                    started_at__gte=timezone.now() - timedelta(hours=options['since_hours'])
+                )
+
+            started = time.monotonic()
+            checked, repaired = reconcile_session_scores(sessions)
+            elapsed = time.monotonic() - started
+
+            style = self.style.WARNING if repaired else self.style.SUCCESS
+            self.stdout.write(style(
+                f'Checked {checked} sessions, repaired {repaired} in {elapsed:.2f}s'
+            ))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from exam.models import Question
+from exam.grading import regrade_responses, DEFAULT_CHUNK_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = 'Regrade stored student responses after a question answer key has changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exam',
+            type=int,
+            nargs='+',
+            default=[],
+            help='Regrade every question of these exam IDs',
+        )
+        parser.add_argument(
+            '--question',
+            type=int,
+            nargs='+',
+            default=[],
+            help='Regrade only these question IDs',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Regrade every response in the database',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of responses fetched and written per batch',
+        )
+
+    def handle(self, *args, **options):
+        if not (options['exam'] or options['question'] or options['all']):
+            raise CommandError('Specify --exam, --question or --all')
+
+        questions = Question.objects.all()
+        if not options['all']:
+            questions = questions.filter(exam_id__in=options['exam']) | questions.filter(id__in=options['question'])
+
+        started = time.monotonic()
+        result = regrade_responses(questions, chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {result['scanned']} responses, updated {result['changed']} "
+            f"and refreshed {result['sessions']} session totals in {elapsed:.2f}s"
+        ))
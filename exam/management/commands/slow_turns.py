@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from exam.tracing import dominant_stage, find_trace, format_span_tree, read_traces, summarize_traces
+from datetime import datetime, time
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slowest voice turns in the slow-turn trace log, or show one trace in full'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Trace log to read (default: TRACE_LOG_PATH)')
+        parser.add_argument('--top', type=int, default=10, help='Number of slowest turns to list')
+        parser.add_argument('--state', help='Only turns that started in this conversation state')
+        parser.add_argument('--since', help='Only turns recorded at or after this date or ISO datetime')
+        parser.add_argument('--trace', help='Print the full record of the turn with this trace id')
+        parser.add_argument('--json', action='store_true', help='Print the summary or trace as JSON')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.TRACE_LOG_PATH
+        if not path or not os.path.exists(path):
+            raise CommandError(f'No trace log at {path}; turns slower than TRACE_SLOW_TURN_MS are written there')
+
+        records = read_traces(path)
+        if options['trace']:
+            record = find_trace(records, options['trace'])
+            if record is None:
+                raise CommandError(f"No trace {options['trace']} in {path}")
+            self._print_trace(record, options['json'])
+            return
+
+        if options['state']:
+            records = (record for record in records if record.get('state') == options['state'])
+        if options['since']:
+            since = self._parse_since(options['since'])
+            records = (
+                record for record in records
+                if (parse_datetime(record.get('recorded_at') or '') or since) >= since
+            )
+
+        summary = summarize_traces(records, options['top'])
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary['count']:
+            self.stdout.write('No slow turns recorded')
+            return
+
+        self.stdout.write(f"{summary['count']} slow turns in {path}\n")
+        self.stdout.write(f"{'total ms':>9}  {'slowest stage':<22} {'state':<20} {'-> state':<20} "
+                          f"{'resp kB':>7}  trace id")
+        for record in summary['worst']:
+            name, milliseconds = dominant_stage(record)
+            stage = f'{name} {milliseconds:.0f} ms' if name else '-'
+            after = record.get('after', {}).get('state') or record.get('outcome', '')
+            response_kb = record.get('sizes', {}).get('response_bytes', 0) / 1024
+            self.stdout.write(f"{record['duration_ms']:>9.1f}  {stage:<22} {record.get('state', ''):<20} "
+                              f"{after:<20} {response_kb:>7.1f}  {record.get('trace_id')}")
+
+        self.stdout.write(f"\n{'stage':<22} {'slowest in':>10} {'total ms':>12}")
+        for row in summary['stages']:
+            self.stdout.write(f"{row['stage']:<22} {row['dominant_in']:>10} {row['total_ms']:>12.1f}")
+        self.stdout.write(self.style.SUCCESS('Show a turn in full with --trace <trace id>'))
+
+    def _parse_since(self, value):
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'--since {value} is not a date or ISO datetime')
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def _print_trace(self, record, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(record, indent=2))
+            return
+        self.stdout.write(
+            f"Trace {record.get('trace_id')} at {record.get('recorded_at')}: {record['duration_ms']:.1f} ms, "
+            f"status {record.get('status')}, outcome {record.get('outcome')}"
+        )
+        self.stdout.write(f"Session {record.get('session_id')}, {record.get('language')}")
+        self.stdout.write(f"Before: {json.dumps(record.get('before', {}))}")
+        self.stdout.write(f"After:  {json.dumps(record.get('after', {}))}")
+        self.stdout.write(f"Sizes:  {json.dumps(record.get('sizes', {}))}\n")
+        for line in format_span_tree(record['spans']):
+            self.stdout.write(line)
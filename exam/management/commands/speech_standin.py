@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from exam.speech_standin import StandinBehaviour, make_server
+import json
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Google Speech-to-Text and Text-to-Speech REST APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same sequence of injected faults')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Median (or fixed) response latency')
+        parser.add_argument(
+            '--latency-distribution',
+            choices=['fixed', 'uniform', 'lognormal'],
+            default='fixed',
+            help='uniform spreads latency from 0.5x to 1.5x the median',
+        )
+        parser.add_argument('--sigma', type=float, default=0.5, help='Spread of the lognormal distribution')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of calls answered 429')
+        parser.add_argument('--server-error-rate', type=float, default=0.0, help='Share of calls answered 500/503')
+        parser.add_argument('--drip-rate', type=float, default=0.0, help='Share of responses sent slowly')
+        parser.add_argument('--drip-seconds', type=float, default=5.0, help='Time a slow response takes to arrive')
+        parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+        parser.add_argument(
+            '--transcript',
+            help='Transcript for audio that was not made by exam.speech.fake_audio(); default is no speech',
+        )
+        parser.add_argument(
+            '--script',
+            help='JSON file with a list of steps played in order before the random behaviour, '
+                 'e.g. [{"operation": "recognize", "status": 429, "repeat": 3}, {"latency_ms": 4000}]',
+        )
+
+    def handle(self, *args, **options):
+        rates = options['rate_limit_rate'] + options['server_error_rate']
+        if not 0 <= rates <= 1 or not 0 <= options['drip_rate'] <= 1:
+            raise CommandError('Rates must be between 0 and 1, and the error rates must not add up to more than 1')
+
+        script = None
+        if options['script']:
+            try:
+                with open(options['script']) as script_file:
+                    script = json.load(script_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read script {options['script']}: {e}")
+
+        median = options['latency_ms']
+        latency = None
+        if median:
+            latency = {
+                'fixed': {'distribution': 'fixed', 'ms': median},
+                'uniform': {'distribution': 'uniform', 'min_ms': median / 2, 'max_ms': median * 1.5},
+                'lognormal': {'distribution': 'lognormal', 'median_ms': median, 'sigma': options['sigma']},
+            }[options['latency_distribution']]
+
+        behaviour = StandinBehaviour(
+            seed=options['seed'],
+            latency=latency,
+            rate_limit_rate=options['rate_limit_rate'],
+            server_error_rate=options['server_error_rate'],
+            drip_rate=options['drip_rate'],
+            drip_seconds=options['drip_seconds'],
+            retry_after=options['retry_after'],
+            script=script,
+            default_transcript=options['transcript'],
+        )
+        try:
+            server = make_server(options['host'], options['port'], behaviour)
+        except OSError as e:
+            raise CommandError(f"Cannot listen on {options['host']}:{options['port']}: {e}")
+
+        url = f"http://{options['host']}:{server.server_address[1]}"
+        self.stdout.write(self.style.SUCCESS(f'Speech stand-in listening on {url}'))
+        self.stdout.write(f'Point the app at it with GOOGLE_SPEECH_BASE_URL={url} GOOGLE_TTS_BASE_URL={url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Calls served: {json.dumps(behaviour.counts, sort_keys=True)}')
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from exam.models import Exam
+
+
+class Command(BaseCommand):
+    help = 'Verify the denormalized question_count/total_points on every exam, optionally repairing drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Rewrite the totals of exams that have drifted',
+        )
+
+    def handle(self, *args, **options):
+        drifted = Exam.objects.annotate(
+            actual_count=Count('questions'),
+            actual_points=Coalesce(Sum('questions__points'), Value(0)),
+        ).filter(
+            ~Q(question_count=F('actual_count')) | ~Q(total_points=F('actual_points'))
+        ).values_list('id', 'title', 'question_count', 'actual_count', 'total_points', 'actual_points')
+
+        drifted = list(drifted)
+        for exam_id, title, stored_count, actual_count, stored_points, actual_points in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'Exam {exam_id} ({title}): questions {stored_count} != {actual_count}, '
+                f'points {stored_points} != {actual_points}'
+            ))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All exam totals are in sync'))
+            return
+
+        if options['repair']:
+            repaired = Exam.sync_question_totals([row[0] for row in drifted])
+            self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} exams'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} exams out of sync; rerun with --repair to fix'))
@@ -0,0 +1,320 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import math
+import re
+import threading
+import time
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+NO_SPEECH = 'No speech detected'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label combination"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(tuple(str(labels[name]) for name in self.labelnames), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}'
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text exposition format.
+
+    Each server process keeps its own registry, so scrape every worker or run one.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+TURN_SECONDS = REGISTRY.histogram(
+    'sneportal_voice_turn_seconds',
+    'Wall time of a voice turn request, by the state it started in',
+    ['state', 'language', 'outcome'],
+)
+TURN_STAGE_SECONDS = REGISTRY.histogram(
+    'sneportal_voice_turn_stage_seconds',
+    'Time a voice turn spent in each stage, by the state it started in',
+    ['stage', 'state', 'language'],
+)
+SPEECH_REQUESTS = REGISTRY.counter(
+    'sneportal_speech_requests_total',
+    'Calls to the speech backend',
+    ['operation'],
+)
+SPEECH_ERRORS = REGISTRY.counter(
+    'sneportal_speech_upstream_errors_total',
+    'Speech backend calls that failed, by kind of failure',
+    ['operation', 'kind'],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'sneportal_cache_requests_total',
+    'Cache lookups by cache and result; hit rate is hit / (hit + miss)',
+    ['cache', 'result'],
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def error_kind(message):
+    """Classify a speech backend error message for the upstream error counter"""
+    message = message or ''
+    status = re.match(r'(\d{3}) ', message)
+    if status:
+        code = int(status.group(1))
+        if code == 429:
+            return 'rate_limited'
+        return 'server_error' if code >= 500 else 'client_error'
+    lowered = message.lower()
+    if 'timed out' in lowered or 'timeout' in lowered:
+        return 'timeout'
+    if 'connection' in lowered:
+        return 'connection'
+    return 'other'
+
+
+def record_speech_call(operation, result):
+    """Count a backend call and, unless it only heard silence, its failure"""
+    SPEECH_REQUESTS.inc(operation=operation)
+    if not result.get('success') and result.get('error') != NO_SPEECH:
+        SPEECH_ERRORS.inc(operation=operation, kind=error_kind(result.get('error')))
+
+
+class Span:
+    """A timed step of a voice turn, with attributes such as payload sizes and its nested steps"""
+    __slots__ = ('name', 'started', 'ended', 'attributes', 'children')
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.started = time.perf_counter()
+        self.ended = None
+        self.attributes = {}
+        self.update(attributes or {})
+        self.children = []
+
+    def update(self, attributes):
+        """Add attributes, leaving out those without a value"""
+        self.attributes.update((key, value) for key, value in attributes.items() if value is not None)
+
+    @property
+    def duration(self):
+        return (self.ended if self.ended is not None else time.perf_counter()) - self.started
+
+    def to_dict(self, origin):
+        """Plain data with times in milliseconds from origin, a perf_counter() reading"""
+        data = {
+            'name': self.name,
+            'start_ms': round((self.started - origin) * 1000, 2),
+            'duration_ms': round(self.duration * 1000, 2),
+        }
+        if self.attributes:
+            data['attributes'] = self.attributes
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class TurnTimer:
+    """Span tree of one voice turn; its top-level spans are the stages reported and aggregated"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id
+        self.root = Span('turn')
+        self._open = [self.root]
+        self.state = 'unknown'
+        self.language = 'unknown'
+        self.outcome = 'ok'
+        # Session state around the turn and payload sizes, kept for slow-turn traces
+        self.before = {}
+        self.after = {}
+        self.sizes = {}
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        span = Span(name, attributes)
+        self._open[-1].children.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            span.ended = time.perf_counter()
+            self._open.pop()
+
+    def annotate(self, **attributes):
+        """Add attributes to the innermost open span"""
+        self._open[-1].update(attributes)
+
+    @property
+    def started(self):
+        return self.root.started
+
+    @property
+    def elapsed(self):
+        return self.root.duration
+
+    @property
+    def stages(self):
+        """Seconds per top-level stage; a stage entered twice (a retried write) accumulates"""
+        totals = {}
+        for span in self.root.children:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def finish(self):
+        if self.root.ended is None:
+            self.root.ended = time.perf_counter()
+
+    def server_timing(self):
+        """Server-Timing header value, in milliseconds, with the whole turn as 'total'"""
+        timings = [*self.stages.items(), ('total', self.elapsed)]
+        return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings)
+
+    def observe(self):
+        TURN_SECONDS.observe(self.elapsed, state=self.state, language=self.language, outcome=self.outcome)
+        for name, seconds in self.stages.items():
+            TURN_STAGE_SECONDS.observe(seconds, stage=name, state=self.state, language=self.language)
+
+
+_current_turn = ContextVar('current_turn', default=None)
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+@contextmanager
+def voice_turn(trace_id=None):
+    """Make a new TurnTimer current for the code handling one voice turn"""
+    turn = TurnTimer(trace_id)
+    token = _current_turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _current_turn.reset(token)
+
+
+@contextmanager
+def stage(name, **attributes):
+    """Time a block as a span of the current voice turn; does nothing outside one"""
+    turn = _current_turn.get()
+    if turn is None:
+        yield None
+        return
+    with turn.stage(name, **attributes) as span:
+        yield span
+
+
+def annotate(**attributes):
+    """Attach attributes, such as result sizes, to the innermost open span of the current turn"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.annotate(**attributes)
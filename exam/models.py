@@ -1,8 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
 import uuid
 
+from .events import publish_session_state
+from .snapshots import get_exam_snapshot
+
 
 class Subject(models.Model):
     name = models.CharField(max_length=100)  # Science, Mathematics, Kiswahili, English
@@ -31,20 +40,76 @@ class Exam(models.Model):
     is_active = models.BooleanField(default=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from Question, kept in sync by sync_question_totals()
+    question_count = models.IntegerField('questions', default=0, editable=False)
+    total_points = models.IntegerField('total points', default=0, editable=False)
+    # Bumped on every edit to the exam or its questions; keys the snapshot cache
+    content_version = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.title} - {self.subject.name}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if not adding:
+            # Leave the column to sync_question_totals, which bumps it once in SQL
+            self.content_version = F('content_version')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not adding:
+                # A stale instance must not overwrite totals maintained by Question
+                Exam.sync_question_totals([self.pk])
+        if not adding:
+            self.refresh_from_db(fields=['content_version', 'question_count', 'total_points'])
+
     def get_total_questions(self):
-        return self.questions.count()
+        return self.question_count
 
     def get_total_points(self):
-        return sum(q.points for q in self.questions.all())
+        return self.total_points
+
+    @classmethod
+    def sync_question_totals(cls, exam_ids):
+        """Recompute question_count and total_points for the given exams in one UPDATE.
+
+        This also bumps content_version, so every write to questions must end
+        here or cached snapshots keep serving the old questions; Question.save,
+        Question.delete and the Question queryset's update and delete do.
+        """
+        questions = Question.objects.filter(exam=OuterRef('pk')).order_by().values('exam')
+        return cls.objects.filter(pk__in=exam_ids).update(
+            question_count=Coalesce(Subquery(questions.annotate(n=Count('id')).values('n')), Value(0)),
+            total_points=Coalesce(Subquery(questions.annotate(p=Sum('points')).values('p')), Value(0)),
+            content_version=F('content_version') + 1,
+        )
+
+    def get_snapshot(self):
+        """Return the cached immutable snapshot of this exam and its questions"""
+        return get_exam_snapshot(self)
 
     class Meta:
         ordering = ['-created_at']
 
 
+class QuestionQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Update questions in bulk and resync their exams' totals and content version"""
+        with transaction.atomic():
+            exam_ids = set(self.values_list('exam_id', flat=True))
+            rows = super().update(**kwargs)
+            if 'exam' in kwargs or 'exam_id' in kwargs:
+                exam_ids.update(self.values_list('exam_id', flat=True))
+            Exam.sync_question_totals(exam_ids)
+        return rows
+
+    def delete(self):
+        with transaction.atomic():
+            exam_ids = set(self.values_list('exam_id', flat=True))
+            result = super().delete()
+            Exam.sync_question_totals(exam_ids)
+        return result
+
+
 class Question(models.Model):
     QUESTION_TYPES = [
         ('multiple_choice', 'Multiple Choice'),
@@ -60,9 +125,26 @@ class Question(models.Model):
     order = models.IntegerField()
     points = models.IntegerField(default=1)
     
+    objects = QuestionQuerySet.as_manager()
+    
     def __str__(self):
         return f"Q{self.order}: {self.question_text[:50]}..."
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            exam_ids = {self.exam_id}
+            if self.pk:
+                # A question moved to another exam changes the totals of both
+                exam_ids.update(Question.objects.filter(pk=self.pk).values_list('exam_id', flat=True))
+            super().save(*args, **kwargs)
+            Exam.sync_question_totals(exam_ids)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Exam.sync_question_totals([self.exam_id])
+        return result
+
     def get_options_text(self):
         """Format options for voice reading"""
         if self.question_type == 'multiple_choice' and self.options:
@@ -86,6 +168,82 @@ class Question(models.Model):
         unique_together = ['exam', 'order']
 
 
+class StaleSessionError(Exception):
+    """An ExamSession row was written by someone else between read and conditional update"""
+
+
+class ExamSessionQuerySet(models.QuerySet):
+    def active(self):
+        """Sessions a student is still working through"""
+        return self.filter(current_state__in=ExamSession.ACTIVE_STATES)
+
+    def fill_deadlines(self):
+        """Store the exam-duration deadline that effective_deadline falls back to on sessions without one.
+
+        Runs one UPDATE per distinct exam duration, so set-based deadline
+        arithmetic and filters also cover sessions that predate deadline_at.
+        """
+        missing = self.filter(deadline_at__isnull=True)
+        filled = 0
+        for minutes in missing.order_by().values_list('exam__duration_minutes', flat=True).distinct():
+            filled += missing.filter(exam__duration_minutes=minutes).update(
+                deadline_at=F('started_at') + timedelta(minutes=minutes),
+                version=F('version') + 1,
+            )
+        return filled
+
+    def extend_deadline(self, seconds):
+        """Push the deadline of every session in the queryset back with one UPDATE"""
+        with transaction.atomic():
+            # NULL + interval is NULL, which would silently drop the extension
+            self.fill_deadlines()
+            return self.update(
+                deadline_at=F('deadline_at') + timedelta(seconds=seconds),
+                extension_seconds=F('extension_seconds') + seconds,
+                version=F('version') + 1,
+            )
+
+    def for_monitor(self):
+        """Sessions with everything a monitor card shows, loaded in one query, newest first"""
+        return self.select_related('exam__subject').only(
+            'session_id', 'student_name', 'student_grade', 'current_state',
+            'current_question_index', 'total_score', 'started_at', 'completed_at',
+            'deadline_at', 'paused_at', 'version', 'exam__title', 'exam__duration_minutes',
+            'exam__question_count', 'exam__total_points', 'exam__subject__name',
+        ).with_progress().order_by('-started_at', '-id')
+
+    def with_progress(self):
+        """Annotate question_total, max_points and progress from the exam's denormalized totals"""
+        return self.annotate(
+            question_total=F('exam__question_count'),
+            max_points=F('exam__total_points'),
+            progress=Case(
+                When(exam__question_count=0, then=Value(0.0)),
+                default=ExpressionWrapper(
+                    F('current_question_index') * 100.0 / F('exam__question_count'),
+                    output_field=FloatField(),
+                ),
+                output_field=FloatField(),
+            ),
+        )
+
+    def page(self, cursor=None, size=50):
+        """Return (sessions, next cursor) for one keyset page of a newest-first queryset.
+
+        The cursor is the (started_at, id) of the last row of the previous page,
+        so deep pages cost the same index seek as the first one. Raises
+        ValueError for a malformed cursor.
+        """
+        queryset = self
+        if cursor:
+            started_at, pk = ExamSession.decode_cursor(cursor)
+            queryset = queryset.filter(Q(started_at__lt=started_at) | Q(started_at=started_at, pk__lt=pk))
+
+        sessions = list(queryset[:size + 1])
+        next_cursor = sessions[size - 1].cursor if len(sessions) > size else None
+        return sessions[:size], next_cursor
+
+
 class ExamSession(models.Model):
     SESSION_STATES = [
         ('setup', 'Setup'),
@@ -97,6 +255,11 @@ class ExamSession(models.Model):
         ('answer_confirmation', 'Confirming Answer'),
         ('exam_complete', 'Exam Complete'),
     ]
+    ACTIVE_STATES = [
+        'student_name', 'student_grade', 'exam_briefing',
+        'question_reading', 'answer_capture', 'answer_confirmation',
+    ]
+    CURSOR_FORMAT = '%Y%m%dT%H%M%S.%f'
     
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
     session_id = models.CharField(max_length=100, unique=True, default=uuid.uuid4)
@@ -107,59 +270,207 @@ class ExamSession(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     total_score = models.IntegerField(default=0)
-    time_remaining = models.IntegerField()  # in seconds
+    # The timer is a clock, not a counter: remaining time is derived on read
+    deadline_at = models.DateTimeField(null=True, blank=True)
+    paused_at = models.DateTimeField(null=True, blank=True)
+    extension_seconds = models.IntegerField(default=0)
+    # Incremented on every write; turn transitions only apply if it is unchanged
+    version = models.IntegerField(default=0, editable=False)
+
+    objects = ExamSessionQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.exam.title} - {self.student_name or 'Unknown'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded values so changed_fields() can build minimal UPDATEs
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .stats import record_session_started
+
+        update_fields = kwargs.get('update_fields')
+        adding = self._state.adding
+        if not adding:
+            self.version += 1
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = [*update_fields, 'version']
+        if adding:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                record_session_started(self.exam_id)
+        else:
+            super().save(*args, **kwargs)
+        saved = [
+            field.attname for field in self._meta.concrete_fields
+            if update_fields is None or field.name in update_fields or field.attname in update_fields
+        ]
+        self._mark_clean(saved)
+        transaction.on_commit(partial(publish_session_state, self))
+
+    def _mark_clean(self, attnames):
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{attname: getattr(self, attname) for attname in attnames},
+        }
+
+    def changed_fields(self):
+        """Return the attnames of loaded fields modified since the row was read"""
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            field.attname for field in self._meta.concrete_fields
+            if field.attname in loaded and getattr(self, field.attname) != loaded[field.attname]
+        ]
+
+    def commit_changes(self, expressions=None, touch=False):
+        """Write changed fields with UPDATE ... WHERE version = <version read>.
+
+        expressions maps field names to F() expressions applied in the same
+        statement; touch bumps the version even when nothing changed. Raises
+        StaleSessionError if another request wrote the row first, leaving it
+        untouched.
+        """
+        values = {name: getattr(self, name) for name in self.changed_fields()}
+        values.update(expressions or {})
+        if not values and not touch:
+            return []
+
+        updated = ExamSession.objects.filter(pk=self.pk, version=self.version).update(
+            version=F('version') + 1, **values
+        )
+        if not updated:
+            raise StaleSessionError(f"Session {self.session_id} changed since version {self.version}")
+
+        self.version += 1
+        self._mark_clean([*values, 'version'])
+        transaction.on_commit(partial(publish_session_state, self))
+        return list(values)
+
+    @property
+    def exam_snapshot(self):
+        """Cached snapshot of the exam being taken"""
+        return self.exam.get_snapshot()
+
     @property
     def current_question(self):
         """Get the current question being attempted"""
-        questions = self.exam.questions.all()
-        if self.current_question_index < len(questions):
-            return questions[self.current_question_index]
-        return None
+        return self.exam_snapshot.question_at(self.current_question_index)
 
     @property
     def progress_percentage(self):
         """Calculate exam completion percentage"""
-        total_questions = self.exam.get_total_questions()
+        total_questions = self.exam_snapshot.question_count
         if total_questions == 0:
             return 0
         return (self.current_question_index / total_questions) * 100
 
+    @property
+    def cursor(self):
+        """Keyset pagination position of this session in newest-first order"""
+        started_at = self.started_at.astimezone(dt_timezone.utc)
+        return f"{started_at.strftime(self.CURSOR_FORMAT)}_{self.pk}"
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        started_at, pk = cursor.split('_')
+        started_at = datetime.strptime(started_at, cls.CURSOR_FORMAT).replace(tzinfo=dt_timezone.utc)
+        return started_at, int(pk)
+
+    @property
+    def effective_deadline(self):
+        """Absolute deadline, falling back to the exam duration for sessions without one"""
+        if self.deadline_at is not None:
+            return self.deadline_at
+        return self.started_at + timedelta(minutes=self.exam.duration_minutes)
+
+    @property
+    def time_remaining(self):
+        """Seconds left before the deadline; frozen while the session is paused"""
+        reference = self.paused_at or timezone.now()
+        return max(0, int((self.effective_deadline - reference).total_seconds()))
+
+    @property
+    def is_expired(self):
+        """Check if the deadline has passed"""
+        return self.paused_at is None and self.time_remaining <= 0
+
     @property
     def time_remaining_formatted(self):
         """Format remaining time for voice announcement"""
-        minutes = self.time_remaining // 60
-        seconds = self.time_remaining % 60
+        time_remaining = self.time_remaining
+        minutes = time_remaining // 60
+        seconds = time_remaining % 60
         if minutes > 0:
             return f"{minutes} minutes and {seconds} seconds"
         return f"{seconds} seconds"
 
-    def advance_question(self):
+    def pause(self, commit=True):
+        """Stop the clock until resume() is called"""
+        if self.paused_at is None:
+            self.paused_at = timezone.now()
+            if commit:
+                self.save(update_fields=['paused_at'])
+
+    def resume(self, commit=True):
+        """Restart the clock, moving the deadline back by the time spent paused"""
+        if self.paused_at is not None:
+            self.deadline_at = self.effective_deadline + (timezone.now() - self.paused_at)
+            self.paused_at = None
+            if commit:
+                self.save(update_fields=['deadline_at', 'paused_at'])
+
+    def extend(self, seconds, commit=True):
+        """Give this session extra time"""
+        self.deadline_at = self.effective_deadline + timedelta(seconds=seconds)
+        self.extension_seconds += seconds
+        if commit:
+            self.save(update_fields=['deadline_at', 'extension_seconds'])
+
+    def advance_question(self, commit=True):
         """Move to next question"""
         self.current_question_index += 1
-        self.save()
+        if commit:
+            self.save(update_fields=['current_question_index'])
 
-    def go_back_question(self):
+    def go_back_question(self, commit=True):
         """Go to previous question"""
         if self.current_question_index > 0:
             self.current_question_index -= 1
-            self.save()
+            if commit:
+                self.save(update_fields=['current_question_index'])
 
     def is_complete(self):
         """Check if exam is complete"""
-        return self.current_question_index >= self.exam.get_total_questions()
+        return self.current_question_index >= self.exam_snapshot.question_count
+
+    def complete_exam(self, commit=True):
+        """Mark exam as complete and, when committing, write its result summary.
+
+        Callers using commit=False must record the result themselves in the
+        transaction that saves the session.
+        """
+        from .results import record_exam_results
 
-    def complete_exam(self):
-        """Mark exam as complete"""
         self.current_state = 'exam_complete'
         self.completed_at = timezone.now()
-        self.save()
+        if commit:
+            with transaction.atomic():
+                self.save(update_fields=['current_state', 'completed_at'])
+                record_exam_results([self])
 
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            # Used by the expiry sweeper to find overdue active sessions
+            models.Index(fields=['current_state', 'deadline_at']),
+            # Keyset pages of the session monitor, per tab
+            models.Index(fields=['current_state', '-started_at', '-id']),
+            # Newest-first pages of the admin changelist
+            models.Index(fields=['-started_at', '-id']),
+        ]
 
 
 class StudentResponse(models.Model):
@@ -176,32 +487,125 @@ class StudentResponse(models.Model):
     def __str__(self):
         return f"{self.exam_session.student_name} - Q{self.question.order}: {self.final_answer}"
 
-    def check_answer(self):
-        """Check if the answer is correct and calculate points"""
-        if self.question.question_type == 'multiple_choice':
-            # Handle variations like "A", "Option A", "The answer is A"
-            answer_clean = self.final_answer.upper().strip()
-            if answer_clean in ['A', 'B', 'C', 'D']:
-                self.is_correct = answer_clean == self.question.correct_answer.upper()
-            else:
-                # Try to extract letter from longer responses
-                for letter in ['A', 'B', 'C', 'D']:
-                    if letter in answer_clean:
-                        self.is_correct = letter == self.question.correct_answer.upper()
-                        break
-        elif self.question.question_type == 'true_false':
-            answer_clean = self.final_answer.lower().strip()
+    @staticmethod
+    def chosen_option(final_answer):
+        """Return the multiple-choice letter an answer is graded as, or None"""
+        # Handle variations like "A", "Option A", "The answer is A"
+        answer_clean = final_answer.upper().strip()
+        if answer_clean in ['A', 'B', 'C', 'D']:
+            return answer_clean
+        # Try to extract letter from longer responses
+        for letter in ['A', 'B', 'C', 'D']:
+            if letter in answer_clean:
+                return letter
+        return None
+
+    @staticmethod
+    def grade(question, final_answer):
+        """Grade an answer against a question, returning (is_correct, points_earned)"""
+        is_correct = False
+        if question.question_type == 'multiple_choice':
+            option = StudentResponse.chosen_option(final_answer)
+            is_correct = option is not None and option == question.correct_answer.upper()
+        elif question.question_type == 'true_false':
+            answer_clean = final_answer.lower().strip()
             if 'true' in answer_clean:
-                self.is_correct = self.question.correct_answer.lower() == 'true'
+                is_correct = question.correct_answer.lower() == 'true'
             elif 'false' in answer_clean:
-                self.is_correct = self.question.correct_answer.lower() == 'false'
+                is_correct = question.correct_answer.lower() == 'false'
         else:
             # Short answer - simple string comparison (can be enhanced)
-            self.is_correct = self.final_answer.lower().strip() == self.question.correct_answer.lower().strip()
-        
-        self.points_earned = self.question.points if self.is_correct else 0
+            is_correct = final_answer.lower().strip() == question.correct_answer.lower().strip()
+
+        return is_correct, question.points if is_correct else 0
+
+    def check_answer(self):
+        """Check if the answer is correct and calculate points"""
+        self.is_correct, self.points_earned = self.grade(self.question, self.final_answer)
         self.save()
 
     class Meta:
         ordering = ['answered_at']
-        unique_together = ['exam_session', 'question']
\ No newline at end of file
+        unique_together = ['exam_session', 'question']
+
+class ExamResult(models.Model):
+    """Summary of a finished session as it was graded at completion; a regrade only updates its outcomes"""
+    exam_session = models.OneToOneField(ExamSession, on_delete=models.CASCADE, related_name='result')
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='results')
+    # Content version of the exam the summary was graded against
+    exam_version = models.IntegerField(default=0)
+    exam_title = models.CharField(max_length=200)
+    subject_name = models.CharField(max_length=100)
+    duration_minutes = models.IntegerField()
+    total_questions = models.IntegerField()
+    answered_questions = models.IntegerField()
+    correct_answers = models.IntegerField()
+    total_score = models.IntegerField()
+    max_score = models.IntegerField()
+    accuracy_percentage = models.FloatField()
+    completion_percentage = models.FloatField()
+    time_taken_seconds = models.IntegerField()
+    completed_at = models.DateTimeField()
+    # One entry per exam question: text, answers and outcome, in question order
+    questions = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.exam_title} - {self.total_score}/{self.max_score}"
+
+    class Meta:
+        ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['exam', 'completed_at']),
+        ]
+
+
+class ExamStats(models.Model):
+    """Running class-level counters for an exam, maintained with deltas as sessions progress"""
+    HISTOGRAM_BUCKETS = 10
+
+    exam = models.OneToOneField(Exam, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    sessions_started = models.IntegerField(default=0)
+    sessions_completed = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    # Completed sessions per tenth of the maximum score; the last bucket includes full marks
+    score_histogram = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.exam_id}"
+
+    @classmethod
+    def bucket_for(cls, score, max_score):
+        if max_score <= 0:
+            return 0
+        return max(0, min(cls.HISTOGRAM_BUCKETS - 1, score * cls.HISTOGRAM_BUCKETS // max_score))
+
+    @property
+    def mean_score(self):
+        return self.score_sum / self.sessions_completed if self.sessions_completed else 0
+
+    @property
+    def histogram(self):
+        """(label, count) pairs for every bucket, including empty ones"""
+        counts = self.score_histogram or [0] * self.HISTOGRAM_BUCKETS
+        width = 100 // self.HISTOGRAM_BUCKETS
+        return [
+            (f"{i * width}-{100 if i == self.HISTOGRAM_BUCKETS - 1 else (i + 1) * width - 1}%", count)
+            for i, count in enumerate(counts)
+        ]
+
+
+class QuestionStats(models.Model):
+    """Running answer counters for a question, maintained with deltas as responses are graded"""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    responses = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+    points_sum = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Stats for question {self.question_id}"
+
+    @property
+    def percent_correct(self):
+        return self.correct / self.responses * 100 if self.responses else 0
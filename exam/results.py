@@ -0,0 +1,165 @@
+from collections import defaultdict
+from django.db import transaction
+import logging
+
+from .models import ExamResult, ExamSession, Question, StudentResponse
+from .stats import record_completions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def build_exam_result(session, responses):
+    """Build an unsaved ExamResult for a session from its responses keyed by question id"""
+    snapshot = session.exam_snapshot
+
+    questions = []
+    answered = correct = score = 0
+    for question in snapshot.questions:
+        response = responses.get(question.id)
+        if response is not None:
+            answered += 1
+            correct += response.is_correct
+            score += response.points_earned
+        questions.append({
+            'question_id': question.id,
+            'order': question.order,
+            'question_text': question.question_text,
+            'correct_answer': question.correct_answer,
+            'points': question.points,
+            'answered': response is not None,
+            'final_answer': response.final_answer if response else '',
+            'is_correct': response.is_correct if response else False,
+            'points_earned': response.points_earned if response else 0,
+        })
+
+    total_questions = snapshot.question_count
+    completed_at = session.completed_at or session.started_at
+    return ExamResult(
+        exam_session=session,
+        exam_id=snapshot.exam_id,
+        exam_version=snapshot.version,
+        exam_title=snapshot.title,
+        subject_name=snapshot.subject_name,
+        duration_minutes=snapshot.duration_minutes,
+        total_questions=total_questions,
+        answered_questions=answered,
+        correct_answers=correct,
+        total_score=score,
+        max_score=snapshot.total_points,
+        accuracy_percentage=(correct / answered * 100) if answered > 0 else 0,
+        completion_percentage=(answered / total_questions * 100) if total_questions > 0 else 0,
+        time_taken_seconds=max(0, int((completed_at - session.started_at).total_seconds())),
+        completed_at=completed_at,
+        questions=questions,
+    )
+
+
+def _responses_by_session(sessions):
+    responses = defaultdict(dict)
+    rows = StudentResponse.objects.filter(
+        exam_session__in=[session.pk for session in sessions]
+    ).only('exam_session_id', 'question_id', 'final_answer', 'is_correct', 'points_earned')
+    for response in rows:
+        responses[response.exam_session_id][response.question_id] = response
+    return responses
+
+
+def record_exam_results(sessions, update_stats=True):
+    """Write result summaries for finished sessions and return the new ones.
+
+    Sessions that already have a summary keep it; regrades patch its outcomes. New
+    results are also counted into the exam statistics unless update_stats
+    is False, as when backfilling sessions the statistics already cover.
+    """
+    sessions = list(sessions)
+    if not sessions:
+        return []
+    recorded = set(ExamResult.objects.filter(exam_session__in=sessions).values_list('exam_session_id', flat=True))
+    sessions = [session for session in sessions if session.pk not in recorded]
+    if not sessions:
+        return []
+
+    responses = _responses_by_session(sessions)
+    results = [build_exam_result(session, responses[session.pk]) for session in sessions]
+    with transaction.atomic():
+        ExamResult.objects.bulk_create(results, ignore_conflicts=True)
+        if update_stats:
+            record_completions(results)
+    return results
+
+
+def apply_regraded_responses(responses):
+    """Patch stored summaries with the new outcomes of regraded responses and return the changed results.
+
+    Only the regraded questions' is_correct and points_earned and the totals
+    derived from them change; question text, options, order and answer key
+    stay as they were when the session completed.
+    """
+    regraded = defaultdict(dict)
+    for response in responses:
+        regraded[response.exam_session_id][response.question_id] = response
+    results = list(ExamResult.objects.filter(exam_session_id__in=list(regraded)))
+    if not results:
+        return []
+
+    # Summaries written before entries carried question ids are matched on the question's order
+    orders = dict(Question.objects.filter(
+        pk__in={question_id for by_question in regraded.values() for question_id in by_question}
+    ).values_list('pk', 'order'))
+    for result in results:
+        by_question = regraded[result.exam_session_id]
+        by_order = {orders.get(question_id): response for question_id, response in by_question.items()}
+        for entry in result.questions:
+            if 'question_id' in entry:
+                response = by_question.get(entry['question_id'])
+            else:
+                response = by_order.get(entry['order'])
+            if response is not None and entry['answered']:
+                entry['is_correct'] = response.is_correct
+                entry['points_earned'] = response.points_earned
+
+        answered = [entry for entry in result.questions if entry['answered']]
+        result.correct_answers = sum(entry['is_correct'] for entry in answered)
+        result.total_score = sum(entry['points_earned'] for entry in answered)
+        result.accuracy_percentage = (
+            result.correct_answers / result.answered_questions * 100 if result.answered_questions > 0 else 0
+        )
+
+    ExamResult.objects.bulk_update(results, ['questions', 'correct_answers', 'total_score', 'accuracy_percentage'])
+    return results
+
+
+def preview_exam_result(session):
+    """Summary of a session that has no stored result yet, e.g. one still in progress"""
+    return build_exam_result(session, _responses_by_session([session])[session.pk])
+
+
+def rebuild_exam_results(sessions=None, replace=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write summaries for completed sessions that lack one, or replace all of them.
+
+    Sessions are processed in primary key order, one transaction per chunk.
+    Returns the number of sessions processed.
+    """
+    if sessions is None:
+        sessions = ExamSession.objects.all()
+    sessions = sessions.filter(current_state='exam_complete').select_related('exam').order_by('pk')
+    if not replace:
+        sessions = sessions.filter(result__isnull=True)
+
+    processed = 0
+    last_pk = 0
+    while True:
+        chunk = list(sessions.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        with transaction.atomic():
+            if replace:
+                ExamResult.objects.filter(exam_session__in=chunk).delete()
+            record_exam_results(chunk, update_stats=False)
+        processed += len(chunk)
+        last_pk = chunk[-1].pk
+
+    logger.info(f"Rebuilt {processed} exam results")
+    return processed
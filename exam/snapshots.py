@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+import threading
+
+from .metrics import record_cache, stage
+
+# Exams kept in the process-local snapshot cache before the least recently used is dropped
+MAX_CACHED_EXAMS = 64
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class QuestionSnapshot:
+    """Read-only copy of a question with its voice text pre-rendered"""
+    id: int
+    order: int
+    question_text: str
+    question_type: str
+    options: object  # MappingProxyType or None
+    correct_answer: str
+    points: int
+    voice_text: str
+
+    def format_for_voice(self):
+        return self.voice_text
+
+
+@dataclass(frozen=True)
+class ExamSnapshot:
+    """Immutable view of an exam and its ordered questions at one content version"""
+    exam_id: int
+    version: int
+    title: str
+    subject_name: str
+    language: str
+    duration_minutes: int
+    instructions: str
+    questions: tuple
+
+    @property
+    def question_count(self):
+        return len(self.questions)
+
+    @property
+    def total_points(self):
+        return sum(q.points for q in self.questions)
+
+    @property
+    def language_code(self):
+        return 'sw-KE' if self.language == 'sw' else 'en-US'
+
+    def question_at(self, index):
+        """Return the question at a zero-based index, or None past the end"""
+        if 0 <= index < len(self.questions):
+            return self.questions[index]
+        return None
+
+    def briefing_text(self, student_name, student_grade):
+        """Render the spoken exam briefing for a student"""
+        briefing = f"""
+        Hello {student_name}, Grade {student_grade}.
+
+        You are about to take the {self.title} exam in {self.subject_name}.
+
+        This exam has {self.question_count} questions and you have {self.duration_minutes} minutes to complete it.
+
+        {self.instructions}
+
+        Here are the voice commands you can use:
+        - Say 'repeat' to hear a question again
+        - Say 'go back' to return to the previous question
+        - Say 'time remaining' to hear how much time you have left
+
+        When you are ready to begin, say 'start'.
+        """
+
+        return briefing.strip()
+
+
+def build_exam_snapshot(exam):
+    """Load an exam and its questions from the database into a snapshot"""
+    exam = type(exam).objects.select_related('subject').get(pk=exam.pk)
+    questions = tuple(
+        QuestionSnapshot(
+            id=question.id,
+            order=question.order,
+            question_text=question.question_text,
+            question_type=question.question_type,
+            options=MappingProxyType(dict(question.options)) if question.options else None,
+            correct_answer=question.correct_answer,
+            points=question.points,
+            voice_text=question.format_for_voice(),
+        )
+        for question in exam.questions.all()
+    )
+    return ExamSnapshot(
+        exam_id=exam.pk,
+        version=exam.content_version,
+        title=exam.title,
+        subject_name=exam.subject.name,
+        language=exam.language,
+        duration_minutes=exam.duration_minutes,
+        instructions=exam.instructions,
+        questions=questions,
+    )
+
+
+def get_exam_snapshot(exam):
+    """Return the cached snapshot for an exam, rebuilding it when the exam has been edited"""
+    with _lock:
+        snapshot = _cache.get(exam.pk)
+        if snapshot is not None and snapshot.version >= exam.content_version:
+            _cache.move_to_end(exam.pk)
+            record_cache('exam_snapshot', hit=True)
+            return snapshot
+
+    record_cache('exam_snapshot', hit=False)
+    with stage('snapshot_build', exam_id=exam.pk):
+        snapshot = build_exam_snapshot(exam)
+    with _lock:
+        cached = _cache.get(exam.pk)
+        # Another thread may have stored a newer version in the meantime
+        if cached is None or cached.version <= snapshot.version:
+            _cache[exam.pk] = snapshot
+            _cache.move_to_end(exam.pk)
+        while len(_cache) > MAX_CACHED_EXAMS:
+            _cache.popitem(last=False)
+    return snapshot
+
+
+def clear_snapshot_cache():
+    """Drop every cached snapshot"""
+    with _lock:
+        _cache.clear()
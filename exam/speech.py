@@ -0,0 +1,298 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+import base64
+import hashlib
+import logging
+import math
+import random
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'exam.speech.GoogleRestBackend'
+
+# Seconds to wait for a speech API to connect and to send each part of its response
+DEFAULT_TIMEOUT_SECONDS = 10
+
+# Canned audio for the fake backend: these bytes followed by the transcript they stand for
+FAKE_AUDIO_PREFIX = b'FAKE-SPEECH:'
+
+
+class SpeechBackend:
+    """Speech-to-text and text-to-speech provider.
+
+    Both methods return the dicts VoiceProcessor has always produced:
+    {'success', 'transcript'} or {'success', 'audio_content', 'content_type'},
+    with 'error' set when success is False. Implementations must be safe to
+    call from several threads.
+    """
+
+    # Whether synthesized audio may be stored in the TTS disk cache
+    cache_audio = True
+
+    def __init__(self, **options):
+        self.options = options
+
+    @property
+    def name(self):
+        return f'{type(self).__module__}.{type(self).__qualname__}'
+
+    def transcribe(self, audio_data, language_code='en-US', sample_rate_hertz=16000, encoding='WEBM_OPUS',
+                   channels=1):
+        raise NotImplementedError
+
+    def synthesize(self, text, voice):
+        """Synthesize text with voice, a dict of 'code', 'name' and 'gender'"""
+        raise NotImplementedError
+
+
+class GoogleRestBackend(SpeechBackend):
+    """Google Cloud Speech-to-Text and Text-to-Speech over their REST APIs with an API key"""
+
+    def __init__(self, api_key=None, speech_base_url=None, tts_base_url=None, timeout=None, **options):
+        super().__init__(**options)
+        self.timeout = timeout or getattr(settings, 'SPEECH_BACKEND', {}).get('TIMEOUT', DEFAULT_TIMEOUT_SECONDS)
+        # Using API key directly instead of client library authentication
+        self.api_key = api_key or settings.GOOGLE_API_KEY
+        # Overridable so load tests can point at a local stand-in (see the speech_standin command)
+        self.speech_base_url = (speech_base_url or settings.GOOGLE_SPEECH_BASE_URL).rstrip('/')
+        self.tts_base_url = (tts_base_url or settings.GOOGLE_TTS_BASE_URL).rstrip('/')
+
+    def transcribe(self, audio_data, language_code='en-US', sample_rate_hertz=16000, encoding='WEBM_OPUS',
+                   channels=1):
+        try:
+            # Convert audio data to base64
+            audio_content = base64.b64encode(audio_data).decode('utf-8')
+
+            # Prepare request data with explicit audio config for webm
+            data = {
+                "config": {
+                    "languageCode": language_code,
+                    "enableAutomaticPunctuation": True,
+                    "encoding": encoding,  # Changed to WEBM_OPUS
+                    "sampleRateHertz": sample_rate_hertz,
+                    "audioChannelCount": channels,
+                    "model": "default"  # Use default model for better compatibility
+                },
+                "audio": {
+                    "content": audio_content
+                }
+            }
+
+            # Make request to Speech-to-Text API
+            url = f"{self.speech_base_url}/v1/speech:recognize?key={self.api_key}"
+            headers = {
+                'Content-Type': 'application/json'
+            }
+
+            response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+
+            result = response.json()
+
+            if 'results' in result and result['results']:
+                transcript = result['results'][0]['alternatives'][0]['transcript']
+                return {
+                    'success': True,
+                    'transcript': transcript
+                }
+            return {
+                'success': False,
+                'transcript': '',
+                'error': 'No speech detected'
+            }
+
+        except requests.exceptions.Timeout:
+            logger.error(f"Speech-to-Text timed out after {self.timeout}s")
+            return {
+                'success': False,
+                'transcript': '',
+                'error': f'Speech-to-Text timed out after {self.timeout}s'
+            }
+        except requests.exceptions.RequestException as e:
+            error_message = str(e)
+            if hasattr(e, 'response') and e.response is not None:
+                try:
+                    error_detail = e.response.json()
+                    error_message = f"{error_message}: {error_detail}"
+                except:
+                    pass
+            return {
+                'success': False,
+                'transcript': '',
+                'error': error_message
+            }
+        except Exception as e:
+            logger.error(f"Speech-to-Text error: {str(e)}")
+            return {
+                'success': False,
+                'transcript': '',
+                'error': str(e)
+            }
+
+    def synthesize(self, text, voice):
+        try:
+            # Prepare request data
+            data = {
+                "input": {"text": text},
+                "voice": {
+                    "languageCode": voice['code'],
+                    "name": voice['name'],
+                    "ssmlGender": voice['gender']
+                },
+                "audioConfig": {
+                    "audioEncoding": "MP3"
+                }
+            }
+
+            # Make request to Text-to-Speech API
+            url = f"{self.tts_base_url}/v1/text:synthesize?key={self.api_key}"
+            headers = {
+                'Content-Type': 'application/json',
+                'X-Goog-Api-Key': self.api_key
+            }
+            response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+
+            result = response.json()
+
+            if 'audioContent' in result:
+                return {
+                    'success': True,
+                    'audio_content': base64.b64decode(result['audioContent']),
+                    'content_type': 'audio/mp3'
+                }
+            return {
+                'success': False,
+                'error': 'Failed to generate audio'
+            }
+
+        except requests.exceptions.Timeout:
+            logger.error(f"Text-to-Speech timed out after {self.timeout}s")
+            return {
+                'success': False,
+                'error': f'Text-to-Speech timed out after {self.timeout}s'
+            }
+        except Exception as e:
+            logger.error(f"Text-to-Speech error: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+
+def draw_latency_ms(rng, spec):
+    """Milliseconds drawn from a latency spec: 'distribution' of 'fixed' (ms), 'uniform' (min_ms, max_ms)
+    or 'lognormal' (median_ms, sigma); no spec means no latency"""
+    if not spec:
+        return 0.0
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        return spec.get('ms', 0)
+    if distribution == 'uniform':
+        return rng.uniform(spec['min_ms'], spec['max_ms'])
+    if distribution == 'lognormal':
+        return rng.lognormvariate(math.log(spec['median_ms']), spec.get('sigma', 0.5))
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+def fake_audio(transcript):
+    """Canned audio that FakeSpeechBackend transcribes as the given text"""
+    return FAKE_AUDIO_PREFIX + transcript.encode('utf-8')
+
+
+def audio_hash(audio_data):
+    """Key of a recording in FakeSpeechBackend's transcripts option"""
+    return hashlib.sha256(audio_data).hexdigest()
+
+
+class FakeSpeechBackend(SpeechBackend):
+    """Deterministic in-process stand-in for a speech provider, for tests and benchmarks.
+
+    Options:
+        seed: seeds latency and error draws, so a run can be repeated.
+        latency: per operation ('transcribe', 'synthesize') latency spec,
+            see draw_latency_ms. No latency by default.
+        error_rate: per operation probability of failing like the provider.
+        transcripts: audio hash (see audio_hash) to transcript.
+        default_transcript: returned for unknown audio; None reports no speech.
+        audio_bytes_per_char: size of synthesized audio, to keep payloads realistic.
+        cache_audio: whether VoiceProcessor may cache the fake audio on disk.
+
+    Audio made by fake_audio() transcribes to the text it carries.
+    """
+
+    def __init__(self, seed=0, latency=None, error_rate=None, transcripts=None, default_transcript=None,
+                 audio_bytes_per_char=64, cache_audio=False, **options):
+        super().__init__(**options)
+        self.latency = latency or {}
+        self.error_rate = error_rate or {}
+        self.transcripts = transcripts or {}
+        self.default_transcript = default_transcript
+        self.audio_bytes_per_char = audio_bytes_per_char
+        self.cache_audio = cache_audio
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {'transcribe': 0, 'synthesize': 0}
+
+    def _simulate(self, operation):
+        """Count the call, draw its latency and outcome, then wait; returns True if it should fail"""
+        with self._lock:
+            self.calls[operation] += 1
+            delay = draw_latency_ms(self._random, self.latency.get(operation)) / 1000
+            failed = self._random.random() < self.error_rate.get(operation, 0)
+        if delay:
+            time.sleep(delay)
+        return failed
+
+    def transcribe(self, audio_data, language_code='en-US', sample_rate_hertz=16000, encoding='WEBM_OPUS',
+                   channels=1):
+        if self._simulate('transcribe'):
+            return {'success': False, 'transcript': '', 'error': '503 Server Error: simulated failure'}
+
+        audio_data = audio_data or b''
+        transcript = self.transcripts.get(audio_hash(audio_data))
+        if transcript is None and audio_data.startswith(FAKE_AUDIO_PREFIX):
+            transcript = audio_data[len(FAKE_AUDIO_PREFIX):].decode('utf-8')
+        if transcript is None:
+            transcript = self.default_transcript
+        if not transcript:
+            return {'success': False, 'transcript': '', 'error': 'No speech detected'}
+        return {'success': True, 'transcript': transcript}
+
+    def synthesize(self, text, voice):
+        if self._simulate('synthesize'):
+            return {'success': False, 'error': '503 Server Error: simulated failure'}
+
+        # Same text and voice, same bytes
+        digest = hashlib.sha256(f"{voice['name']}\0{text}".encode('utf-8')).digest()
+        size = max(len(digest), len(text) * self.audio_bytes_per_char)
+        audio = (digest * (size // len(digest) + 1))[:size]
+        return {'success': True, 'audio_content': audio, 'content_type': 'audio/mp3'}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_speech_backend():
+    """The process-wide backend configured by settings.SPEECH_BACKEND"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = getattr(settings, 'SPEECH_BACKEND', {})
+            backend_class = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+            _backend = backend_class(**config.get('OPTIONS', {}))
+        return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    global _backend
+    if setting in ('SPEECH_BACKEND', 'GOOGLE_API_KEY', 'GOOGLE_SPEECH_BASE_URL', 'GOOGLE_TTS_BASE_URL'):
+        with _backend_lock:
+            _backend = None
@@ -0,0 +1,181 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import base64
+import json
+import logging
+import random
+import threading
+import time
+
+from .speech import FakeSpeechBackend, draw_latency_ms
+
+logger = logging.getLogger(__name__)
+
+RECOGNIZE_PATH = '/v1/speech:recognize'
+SYNTHESIZE_PATH = '/v1/text:synthesize'
+OPERATIONS = {RECOGNIZE_PATH: 'recognize', SYNTHESIZE_PATH: 'synthesize'}
+
+# Google's status names for the errors the stand-in can inject
+ERROR_STATUSES = {
+    400: 'INVALID_ARGUMENT',
+    429: 'RESOURCE_EXHAUSTED',
+    500: 'INTERNAL',
+    503: 'UNAVAILABLE',
+}
+
+# Pieces a slow-drip body is split into
+DRIP_CHUNKS = 20
+
+
+class StandinBehaviour:
+    """How the stand-in answers: scripted steps first, then seeded random latency, errors and drips.
+
+    A script step is a dict with an optional 'operation' ('recognize' or
+    'synthesize', default either), 'status' (200, 429, 500 or 503),
+    'latency_ms', 'drip_seconds' and 'repeat'. Steps are played in order.
+    """
+
+    def __init__(self, seed=0, latency=None, rate_limit_rate=0.0, server_error_rate=0.0, drip_rate=0.0,
+                 drip_seconds=5.0, retry_after=1, script=None, default_transcript=None):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.drip_rate = drip_rate
+        self.drip_seconds = drip_seconds
+        self.retry_after = retry_after
+        self.script = []
+        for step in script or []:
+            self.script.extend([step] * step.get('repeat', 1))
+        # Answers the content of successful calls the same way the in-process fake does
+        self.speech = FakeSpeechBackend(seed=seed, default_transcript=default_transcript)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def next_step(self, operation):
+        """Status, latency in ms and drip seconds of the next call to an operation"""
+        with self._lock:
+            for index, step in enumerate(self.script):
+                if step.get('operation', operation) == operation:
+                    del self.script[index]
+                    return step.get('status', 200), step.get('latency_ms', 0), step.get('drip_seconds', 0)
+
+            latency_ms = draw_latency_ms(self._random, self.latency)
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                status = 429
+            elif roll < self.rate_limit_rate + self.server_error_rate:
+                status = self._random.choice((500, 503))
+            else:
+                status = 200
+            drip_seconds = self.drip_seconds if self._random.random() < self.drip_rate else 0
+            return status, latency_ms, drip_seconds
+
+    def count(self, operation, status):
+        with self._lock:
+            key = f'{operation} {status}'
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Google Speech-to-Text v1 recognize and Text-to-Speech v1 synthesize, as VoiceProcessor calls them"""
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def behaviour(self):
+        return self.server.behaviour
+
+    def do_GET(self):
+        # Call counts by operation and status, for checking what a load test actually hit
+        if urlsplit(self.path).path == '/stats':
+            self._send_json(200, self.behaviour.counts)
+        else:
+            self._send_error(404, f'No such endpoint: {self.path}')
+
+    def do_POST(self):
+        operation = OPERATIONS.get(urlsplit(self.path).path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if operation is None:
+            self._send_error(404, f'No such endpoint: {self.path}')
+            return
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self.behaviour.count(operation, 400)
+            self._send_error(400, 'Invalid JSON payload received.')
+            return
+
+        status, latency_ms, drip_seconds = self.behaviour.next_step(operation)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        self.behaviour.count(operation, status)
+
+        if status != 200:
+            headers = {'Retry-After': str(self.behaviour.retry_after)} if status == 429 else {}
+            self._send_error(status, 'Injected by the speech stand-in', headers, drip_seconds)
+            return
+        try:
+            if operation == 'recognize':
+                payload = self._recognize(request)
+            else:
+                payload = self._synthesize(request)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_error(400, f'Malformed request: {e}')
+            return
+        self._send_json(200, payload, drip_seconds=drip_seconds)
+
+    def _recognize(self, request):
+        audio = base64.b64decode(request['audio']['content'])
+        result = self.behaviour.speech.transcribe(audio, language_code=request['config'].get('languageCode'))
+        if not result['success']:
+            # Google answers silence with an empty object
+            return {}
+        return {'results': [{'alternatives': [{'transcript': result['transcript'], 'confidence': 0.92}]}]}
+
+    def _synthesize(self, request):
+        voice = {
+            'code': request['voice']['languageCode'],
+            'name': request['voice'].get('name', ''),
+            'gender': request['voice'].get('ssmlGender', 'NEUTRAL'),
+        }
+        result = self.behaviour.speech.synthesize(request['input']['text'], voice)
+        return {'audioContent': base64.b64encode(result['audio_content']).decode('ascii')}
+
+    def _send_error(self, status, message, headers=None, drip_seconds=0):
+        payload = {'error': {'code': status, 'message': message, 'status': ERROR_STATUSES.get(status, 'UNKNOWN')}}
+        self._send_json(status, payload, headers, drip_seconds)
+
+    def _send_json(self, status, payload, headers=None, drip_seconds=0):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            if not drip_seconds:
+                self.wfile.write(body)
+                return
+            # Headers arrive at once, the body trickles in, like a congested upstream
+            chunk_size = max(1, -(-len(body) // DRIP_CHUNKS))
+            for start in range(0, len(body), chunk_size):
+                self.wfile.write(body[start:start + chunk_size])
+                self.wfile.flush()
+                time.sleep(drip_seconds / DRIP_CHUNKS)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, which is what a timeout test wants to see
+            logger.info(f"Speech stand-in client disconnected during {self.path}")
+
+    def log_message(self, format, *args):
+        logger.debug(f"Speech stand-in: {format % args}")
+
+
+def make_server(host, port, behaviour):
+    """Bind the stand-in; call serve_forever() on the result"""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.behaviour = behaviour
+    return server
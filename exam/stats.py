@@ -0,0 +1,113 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+import logging
+
+from .models import Exam, ExamSession, ExamStats, Question, QuestionStats, StudentResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _add_to_counters(model, deltas, **key):
+    """Add deltas to one counter row with a single UPDATE, creating the row on first use"""
+    expressions = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not expressions:
+        return
+    rows = model.objects.filter(**key)
+    if not rows.update(**expressions):
+        model.objects.get_or_create(**key)
+        rows.update(**expressions)
+
+
+def record_session_started(exam_id):
+    _add_to_counters(ExamStats, {'sessions_started': 1}, exam_id=exam_id)
+
+
+def record_answer(question_id, responses=0, correct=0, points=0):
+    """Apply the change one graded answer made to its question's counters"""
+    _add_to_counters(
+        QuestionStats, {'responses': responses, 'correct': correct, 'points_sum': points},
+        question_id=question_id,
+    )
+
+
+def record_score_changes(changes):
+    """Move completed sessions between score totals and histogram buckets.
+
+    changes maps exam ids to lists of (old_score, new_score, max_score); an
+    old_score of None counts a newly completed session. The stats row is
+    locked while its histogram is rewritten.
+    """
+    with transaction.atomic():
+        for exam_id, scores in changes.items():
+            stats, _ = ExamStats.objects.select_for_update().get_or_create(exam_id=exam_id)
+            histogram = list(stats.score_histogram) or [0] * ExamStats.HISTOGRAM_BUCKETS
+            for old_score, new_score, max_score in scores:
+                if old_score is None:
+                    stats.sessions_completed += 1
+                else:
+                    stats.score_sum -= old_score
+                    histogram[ExamStats.bucket_for(old_score, max_score)] -= 1
+                stats.score_sum += new_score
+                histogram[ExamStats.bucket_for(new_score, max_score)] += 1
+            stats.score_histogram = histogram
+            stats.save(update_fields=['sessions_completed', 'score_sum', 'score_histogram', 'updated_at'])
+
+
+def record_completions(results):
+    """Count newly written ExamResults into their exams' score statistics"""
+    changes = defaultdict(list)
+    for result in results:
+        changes[result.exam_id].append((None, result.total_score, result.max_score))
+    record_score_changes(changes)
+
+
+def recompute_exam_stats(exam_ids=None):
+    """Rebuild the statistics of the given exams, or all exams, from the source tables"""
+    with transaction.atomic():
+        exams = Exam.objects.all()
+        if exam_ids is not None:
+            exams = exams.filter(pk__in=exam_ids)
+        max_points = dict(exams.values_list('pk', 'total_points'))
+        exam_ids = list(max_points)
+
+        sessions = ExamSession.objects.filter(exam_id__in=exam_ids).order_by()
+        started = dict(sessions.values('exam_id').annotate(n=Count('id')).values_list('exam_id', 'n'))
+        scores = sessions.filter(current_state='exam_complete').values('exam_id', 'total_score').annotate(
+            n=Count('id')
+        ).values_list('exam_id', 'total_score', 'n')
+
+        exam_stats = {
+            exam_id: ExamStats(
+                exam_id=exam_id,
+                sessions_started=started.get(exam_id, 0),
+                score_histogram=[0] * ExamStats.HISTOGRAM_BUCKETS,
+            )
+            for exam_id in exam_ids
+        }
+        for exam_id, score, count in scores:
+            stats = exam_stats[exam_id]
+            stats.sessions_completed += count
+            stats.score_sum += score * count
+            stats.score_histogram[ExamStats.bucket_for(score, max_points[exam_id])] += count
+
+        answers = StudentResponse.objects.filter(question__exam_id__in=exam_ids).order_by().values(
+            'question_id'
+        ).annotate(
+            n=Count('id'), n_correct=Count('id', filter=Q(is_correct=True)), points=Sum('points_earned')
+        ).values_list('question_id', 'n', 'n_correct', 'points')
+        question_stats = {
+            question_id: QuestionStats(question_id=question_id)
+            for question_id in Question.objects.filter(exam_id__in=exam_ids).values_list('pk', flat=True)
+        }
+        for question_id, count, correct, points in answers:
+            stats = question_stats[question_id]
+            stats.responses, stats.correct, stats.points_sum = count, correct, points or 0
+
+        ExamStats.objects.filter(exam_id__in=exam_ids).delete()
+        QuestionStats.objects.filter(question__exam_id__in=exam_ids).delete()
+        ExamStats.objects.bulk_create(exam_stats.values())
+        QuestionStats.objects.bulk_create(question_stats.values())
+
+    logger.info(f"Recomputed statistics for {len(exam_ids)} exams")
+    return len(exam_ids)
@@ -1,3 +1,1175 @@
-from django.test import TestCase
+import asyncio
+import csv
+import difflib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import tts_cache
+from .benchmarks import BenchmarkResult, baseline_payload, compare_to_baseline, relative_change
+from .expiry import _close_batch, expire_overdue_sessions
+from .exports import RESPONSE_COLUMNS
+from .grading import reconcile_session_scores, regrade_responses
+from .imports import QuestionBankError, parse_question_bank
+from .item_analysis import get_item_analysis
+from .load_data import generate_load_data
+from .loadtest import LockWaitMonitor
+from .models import (
+    Exam, ExamResult, ExamSession, ExamStats, Question, QuestionStats, StaleSessionError, StudentResponse, Subject,
+)
+from .results import rebuild_exam_results
+from .snapshots import clear_snapshot_cache
+from .speech import GoogleRestBackend, fake_audio
+from .stats import recompute_exam_stats, record_score_changes
+from .tracing import read_traces
+from .unit_of_work import TurnUnitOfWork
+from .voice_processor import VoiceFlowManager
+
+# Data every test starts from, and what grow() adds before the second measurement.
+# Raise QUERY_BUDGET_SESSIONS to check the same budgets against a much larger dataset.
+SMALL_VOLUME = {'subjects': 1, 'exams': 2, 'questions': 3, 'sessions': 6}
+LARGE_VOLUME = {
+    'subjects': 2,
+    'exams': 4,
+    'questions': 30,
+    'sessions': int(os.environ.get('QUERY_BUDGET_SESSIONS', 150)),
+}
+
+# Upper bound on the database time of one request, in seconds
+MAX_QUERY_SECONDS = float(os.environ.get('QUERY_BUDGET_SECONDS', 0.5))
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\"s\d+_x\d+\"")
+
+
+def _normalize(sql):
+    """SQL with literals and savepoint names blanked, so the same statement for different rows compares equal"""
+    return _LITERALS.sub('?', sql)
+
+
+def _query_report(small, large):
+    """Readable account of the queries a request ran at both volumes"""
+    small_sql = [_normalize(query['sql']) for query in small]
+    large_sql = [_normalize(query['sql']) for query in large]
+    diff = list(difflib.unified_diff(small_sql, large_sql, 'small volume', 'large volume', lineterm='', n=1))
+    if diff:
+        return 'Queries added or changed at the large volume:\n' + '\n'.join(diff)
+    return 'Queries at the large volume:\n' + '\n'.join(f'{n}. {sql}' for n, sql in enumerate(large_sql, 1))
+
+
+class QueryBudgetTestCase(TestCase):
+    """Drives a request at a small and a grown data volume and holds both to one query budget.
+
+    A request whose query count grows with the data (an N+1) fails with a
+    diff of the statements that were added.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Rolled-back test data reuses primary keys, so drop snapshots of earlier classes' exams
+        clear_snapshot_cache()
+        generate_load_data(seed=1, **SMALL_VOLUME)
+
+    def setUp(self):
+        cache.clear()
+
+    def grow(self):
+        generate_load_data(seed=2, **LARGE_VOLUME)
+
+    def capture(self, method, path, data=None, headers=None):
+        # Every measurement starts with cold process caches so both volumes do the same work
+        clear_snapshot_cache()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data, **(headers or {}))
+        return response, context.captured_queries
+
+    def assertQueryBudget(self, request, max_queries, status=200):
+        """Run request() before and after grow(); request returns (method, path[, data[, headers]])"""
+        small_response, small = self.capture(*request())
+        self.assertEqual(small_response.status_code, status, small_response.content[:500])
+        self.grow()
+        large_response, large = self.capture(*request())
+        self.assertEqual(large_response.status_code, status, large_response.content[:500])
+
+        problems = []
+        for volume, queries in (('small', small), ('large', large)):
+            if len(queries) > max_queries:
+                problems.append(f'{len(queries)} queries at the {volume} volume, budget is {max_queries}')
+            seconds = sum(float(query['time']) for query in queries)
+            if seconds > MAX_QUERY_SECONDS:
+                problems.append(f'{seconds:.3f}s of queries at the {volume} volume, budget is {MAX_QUERY_SECONDS}s')
+        if len(large) > len(small):
+            problems.append(f'{len(large) - len(small)} more queries at the large volume than at the small one')
+        if problems:
+            self.fail('\n'.join(problems) + '\n' + _query_report(small, large))
+        return large_response
+
+
+def _largest_exam():
+    return Exam.objects.order_by('-question_count', '-pk').first()
+
+
+def _completed_session():
+    """The newest completed session of the exam with the most questions"""
+    return ExamSession.objects.filter(current_state='exam_complete').order_by('-exam__question_count', '-pk').first()
+
+
+def _new_session(state, **fields):
+    """A fresh session of the exam with the most questions, part way through"""
+    return ExamSession.objects.create(exam=_largest_exam(), current_state=state, student_name='Budget', **fields)
+
+
+class ExamFlowQueryBudgetTests(QueryBudgetTestCase):
+    """Query budgets of the pages and endpoints a student uses"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        speech = override_settings(SPEECH_BACKEND={'BACKEND': 'exam.speech.FakeSpeechBackend'})
+        speech.enable()
+        self.addCleanup(speech.disable)
+
+    def test_exam_interface(self):
+        self.assertQueryBudget(lambda: ('get', reverse('exam:exam_session')), 1)
+
+    def test_start_session(self):
+        self.assertQueryBudget(lambda: ('post', reverse('exam:exam_session'), {'exam_id': _largest_exam().pk}), 10)
+
+    def test_voice_turn_confirming_an_answer(self):
+        def request():
+            session = _new_session('answer_confirmation')
+            client_session = self.client.session
+            client_session.update({'temp_answer': 'A', 'temp_transcript': 'option a'})
+            client_session.save()
+            audio = SimpleUploadedFile('turn.webm', fake_audio('yes'), 'audio/webm')
+            return 'post', reverse('exam:voice_process'), {'session_id': session.session_id, 'audio': audio}
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.assertQueryBudget(request, 12)
+        self.assertEqual(response.json()['state'], 'question_reading')
+        stages = [timing.split(';')[0] for timing in response['Server-Timing'].split(', ')]
+        expected_stages = ('upload', 'session_load', 'recording_io', 'stt', 'parse', 'route', 'db', 'tts', 'encode')
+        for expected in expected_stages + ('total',):
+            self.assertIn(expected, stages)
+
+    def test_slow_voice_turn_trace(self):
+        def request():
+            session = _new_session('answer_capture')
+            self.client.session.save()
+            audio = SimpleUploadedFile('turn.webm', fake_audio('option b'), 'audio/webm')
+            data = {'session_id': session.session_id, 'audio': audio}
+            return 'post', reverse('exam:voice_process'), data, {'HTTP_X_TRACE_ID': 'budget-trace-1'}
+
+        trace_log = os.path.join(self.media_root, 'slow_turns.jsonl')
+        # A threshold of 0 ms traces every turn; writing the trace must not cost a query
+        with override_settings(MEDIA_ROOT=self.media_root, TRACE_SLOW_TURN_MS=0, TRACE_LOG_PATH=trace_log):
+            response = self.assertQueryBudget(request, 10)
+        self.assertEqual(response['X-Trace-Id'], 'budget-trace-1')
+
+        records = list(read_traces(trace_log))
+        self.assertEqual(len(records), 2)
+        record = records[-1]
+        self.assertEqual(record['trace_id'], 'budget-trace-1')
+        self.assertEqual(record['before']['state'], 'answer_capture')
+        self.assertEqual(record['after']['state'], 'answer_confirmation')
+        self.assertEqual(record['sizes']['audio_bytes'], len(fake_audio('option b')))
+        spans = {span['name']: span for span in record['spans']['children']}
+        self.assertEqual(spans['stt']['attributes']['transcript_chars'], len('option b'))
+        # Answer parsing is timed inside the state handler, not added to the command parse
+        routed = {span['name']: span for span in spans['route']['children']}
+        self.assertEqual(routed['parse']['attributes'], {'operation': 'answer'})
+
+        output = StringIO()
+        call_command('slow_turns', path=trace_log, stdout=output)
+        self.assertIn('budget-trace-1', output.getvalue())
+
+    def test_session_state(self):
+        self.assertQueryBudget(
+            lambda: ('get', reverse('exam:session_state'), {
+                'session_id': _new_session('question_reading', current_question_index=1).session_id
+            }),
+            4,
+        )
+
+    def test_text_to_speech(self):
+        self.assertQueryBudget(lambda: ('post', reverse('exam:text_to_speech'), {'text': 'Question 1'}), 0)
+
+    def test_exam_results(self):
+        self.assertQueryBudget(
+            lambda: ('get', reverse('exam:exam_results', args=[_completed_session().session_id])),
+            1,
+        )
+
+
+class MonitorQueryBudgetTests(QueryBudgetTestCase):
+    """Query budgets of the pages teachers watch"""
+
+    def test_active_sessions(self):
+        self.assertQueryBudget(lambda: ('get', reverse('exam:session_list')), 1)
+
+    def test_completed_sessions(self):
+        self.assertQueryBudget(lambda: ('get', reverse('exam:session_list'), {'tab': 'completed'}), 1)
+
+    def test_live_session_cards(self):
+        self.assertQueryBudget(lambda: ('get', reverse('exam:session_cards')), 1)
+
+    def test_exam_stats(self):
+        self.assertQueryBudget(lambda: ('get', reverse('exam:exam_stats', args=[_largest_exam().pk])), 2)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics(self):
+        response = self.assertQueryBudget(
+            lambda: ('get', reverse('exam:metrics'), None, {'HTTP_AUTHORIZATION': 'Bearer scrape'}),
+            0,
+        )
+        self.assertIn(b'# TYPE sneportal_voice_turn_seconds histogram', response.content)
+
+
+class AdminQueryBudgetTests(QueryBudgetTestCase):
+    """Query budgets of the admin changelists"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('budget-admin', 'admin@example.com', 'budget'))
+
+    def test_subject_changelist(self):
+        self.assertQueryBudget(lambda: ('get', reverse('admin:exam_subject_changelist')), 5)
+
+    def test_exam_changelist(self):
+        self.assertQueryBudget(lambda: ('get', reverse('admin:exam_exam_changelist')), 7)
+
+    def test_question_changelist(self):
+        self.assertQueryBudget(lambda: ('get', reverse('admin:exam_question_changelist')), 7)
+
+    def test_session_changelist(self):
+        self.assertQueryBudget(lambda: ('get', reverse('admin:exam_examsession_changelist')), 6)
+
+    def test_session_change_form(self):
+        self.assertQueryBudget(
+            lambda: ('get', reverse('admin:exam_examsession_change', args=[_completed_session().pk])),
+            11,
+        )
+
+    def test_response_changelist(self):
+        self.assertQueryBudget(lambda: ('get', reverse('admin:exam_studentresponse_changelist')), 5)
+
+    def test_result_changelist(self):
+        self.assertQueryBudget(lambda: ('get', reverse('admin:exam_examresult_changelist')), 6)
+
+
+class ExamDataTestCase(TestCase):
+    """Behaviour tests against the small generated dataset, with the fake speech backend"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Rolled-back test data reuses primary keys, so drop snapshots of earlier classes' exams
+        clear_snapshot_cache()
+        generate_load_data(seed=1, **SMALL_VOLUME)
+
+    def setUp(self):
+        cache.clear()
+        clear_snapshot_cache()
+        speech = override_settings(SPEECH_BACKEND={'BACKEND': 'exam.speech.FakeSpeechBackend'})
+        speech.enable()
+        self.addCleanup(speech.disable)
+
+
+class TurnUnitOfWorkTests(ExamDataTestCase):
+    def confirm(self, session, answer):
+        unit_of_work = TurnUnitOfWork(session)
+        VoiceFlowManager()._save_student_response(session, answer, f'option {answer}', unit_of_work)
+        session.current_state = 'question_reading'
+        return unit_of_work
+
+    def test_flush_writes_the_session_before_anything_else(self):
+        session = _new_session('answer_confirmation')
+        unit_of_work = self.confirm(session, 'A')
+        with CaptureQueriesContext(connection) as context:
+            unit_of_work.flush()
+        statements = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertTrue(statements[0].startswith('UPDATE "exam_examsession"'), statements[0])
+        self.assertFalse(any(sql.startswith('SELECT') for sql in statements[:2]))
+
+        session.refresh_from_db()
+        response = session.responses.get()
+        self.assertEqual(session.current_state, 'question_reading')
+        self.assertEqual(session.total_score, response.points_earned)
+
+    def test_answering_again_replaces_the_response_and_its_points(self):
+        session = _new_session('answer_confirmation')
+        question = session.current_question
+        right, wrong = question.correct_answer, 'Z'
+        self.confirm(session, right).flush()
+        self.confirm(session, wrong).flush()
+
+        session.refresh_from_db()
+        response = session.responses.get()
+        self.assertEqual((response.final_answer, response.attempts), (wrong, 2))
+        self.assertEqual(session.total_score, response.points_earned)
+        stats = QuestionStats.objects.get(question_id=question.id)
+        answers = StudentResponse.objects.filter(question_id=question.id)
+        self.assertEqual(stats.responses, answers.count())
+        self.assertEqual(stats.points_sum, sum(answers.values_list('points_earned', flat=True)))
+
+    def test_stale_version_rolls_back_every_queued_write(self):
+        session = _new_session('answer_confirmation')
+        ExamSession.objects.filter(pk=session.pk).update(version=F('version') + 1)
+        with self.assertRaises(StaleSessionError):
+            self.confirm(session, 'A').flush()
+        self.assertFalse(StudentResponse.objects.filter(exam_session=session).exists())
+
+
+class ConcurrentTransitionTests(ExamDataTestCase):
+    def load(self, session):
+        copy = ExamSession.objects.select_related('exam').get(pk=session.pk)
+        copy._request_session = {'temp_answer': 'A', 'temp_transcript': 'option a'}
+        return copy
+
+    def test_racing_turns_retry_exactly_once(self):
+        session = _new_session('answer_confirmation')
+        turn = self.load(session)
+        # A supervisor extension lands after the turn read the session, leaving its state alone
+        ExamSession.objects.filter(pk=session.pk).extend_deadline(60)
+        with self.assertLogs('exam.voice_processor', 'INFO') as logs:
+            reply = VoiceFlowManager().handle_voice_input(turn, None, 'yes')
+
+        retries = [line for line in logs.output if 'changed concurrently' in line]
+        self.assertEqual(len(retries), 1)
+        self.assertIn(str(session.session_id), retries[0])
+        self.assertFalse(reply.get('error'))
+        session.refresh_from_db()
+        self.assertEqual((session.current_state, session.current_question_index), ('question_reading', 1))
+        self.assertEqual(session.extension_seconds, 60)
+        self.assertEqual(StudentResponse.objects.filter(exam_session=session).count(), 1)
+
+    def test_a_repeated_confirmation_that_loses_the_race_changes_nothing(self):
+        session = _new_session('answer_confirmation')
+        # A double tap: both requests read the session before either of them writes it
+        first, second = self.load(session), self.load(session)
+        manager = VoiceFlowManager()
+        with self.assertLogs('exam.voice_processor', 'INFO') as logs:
+            first_reply = manager.handle_voice_input(first, None, 'yes')
+            second_reply = manager.handle_voice_input(second, None, 'yes')
+
+        self.assertTrue(any('moved on before this turn' in line for line in logs.output))
+        self.assertFalse(second_reply.get('error'))
+        # The second "yes" is answered with where the first one left the student
+        self.assertEqual((second_reply['text'], second_reply['state']), (first_reply['text'], 'question_reading'))
+        session.refresh_from_db()
+        self.assertEqual((session.current_state, session.current_question_index), ('question_reading', 1))
+        self.assertEqual(StudentResponse.objects.filter(exam_session=session).count(), 1)
+
+    def test_locked_database_is_retried_after_a_backoff(self):
+        session = _new_session('answer_confirmation')
+        flush = TurnUnitOfWork.flush
+        calls = []
+
+        def locked_once(unit_of_work):
+            calls.append(unit_of_work)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return flush(unit_of_work)
+
+        with mock.patch.object(TurnUnitOfWork, 'flush', locked_once), \
+                mock.patch('exam.voice_processor.time.sleep') as sleep:
+            reply = VoiceFlowManager().handle_voice_input(self.load(session), None, 'yes')
+
+        self.assertFalse(reply.get('error'))
+        self.assertEqual(len(calls), 2)
+        sleep.assert_called_once()
+        session.refresh_from_db()
+        self.assertEqual(session.current_question_index, 1)
+
+    def test_other_database_errors_are_not_retried(self):
+        session = _new_session('answer_confirmation')
+        with mock.patch.object(TurnUnitOfWork, 'flush', side_effect=OperationalError('no such table')) as flush:
+            reply = VoiceFlowManager().handle_voice_input(self.load(session), None, 'yes')
+        self.assertTrue(reply.get('error'))
+        self.assertEqual(flush.call_count, 1)
+
+
+def _make_incorrect(question):
+    """Change a question's answer key to one no stored answer can match"""
+    question.correct_answer = {'multiple_choice': 'X', 'true_false': 'neither'}.get(
+        question.question_type, 'no student gives this answer'
+    )
+    question.save()
+
+
+class RegradeResultTests(ExamDataTestCase):
+    def test_regrade_rewrites_the_results_page(self):
+        answer = StudentResponse.objects.filter(
+            exam_session__current_state='exam_complete', points_earned__gt=0
+        ).select_related('exam_session', 'question').first()
+        session, question = answer.exam_session, answer.question
+        rebuild_exam_results(ExamSession.objects.filter(pk=session.pk))
+        score_before = session.result.total_score
+
+        _make_incorrect(question)
+        regrade_responses([question])
+
+        session.refresh_from_db()
+        self.assertEqual(session.total_score, score_before - answer.points_earned)
+        page = self.client.get(reverse('exam:exam_results', args=[session.session_id]))
+        result = page.context['result']
+        self.assertEqual(result.total_score, session.total_score)
+        outcome = next(entry for entry in result.questions if entry['order'] == question.order)
+        self.assertEqual((outcome['is_correct'], outcome['points_earned']), (False, 0))
+        self.assertContains(page, f'{result.total_score}/{result.max_score}')
+
+    def test_regrade_keeps_the_questions_as_they_were_at_completion(self):
+        answer = StudentResponse.objects.filter(
+            exam_session__current_state='exam_complete', points_earned__gt=0
+        ).select_related('exam_session', 'question').first()
+        session, question = answer.exam_session, answer.question
+        before = session.result.questions
+        entry = next(entry for entry in before if entry['question_id'] == question.pk)
+
+        question.question_text = 'Reworded after the exam'
+        question.order += 100
+        question.save()
+        _make_incorrect(question)
+        regrade_responses([question])
+
+        result = ExamResult.objects.get(exam_session=session)
+        patched = next(item for item in result.questions if item['question_id'] == question.pk)
+        self.assertEqual(patched, {**entry, 'is_correct': False, 'points_earned': 0})
+        self.assertEqual(
+            [item for item in result.questions if item['question_id'] != question.pk],
+            [item for item in before if item['question_id'] != question.pk],
+        )
+        self.assertEqual(result.total_score, sum(item['points_earned'] for item in result.questions))
+
+    def test_regrade_invalidates_the_cached_item_analysis(self):
+        answer = StudentResponse.objects.filter(
+            exam_session__current_state='exam_complete', is_correct=True
+        ).select_related('question__exam').first()
+        question, exam = answer.question, answer.question.exam
+        before = get_item_analysis(exam)
+
+        # A grading fix regrades without editing the exam, so neither its version nor its completions move
+        questions = Question.objects.filter(pk=question.pk)
+        questions.update(correct_answer='no student gives this answer')
+        with self.captureOnCommitCallbacks(execute=True):
+            regrade_responses(questions)
+
+        after = get_item_analysis(Exam.objects.select_related('stats').get(pk=exam.pk))
+        item = next(item for item in after.items if item.question_id == question.pk)
+        self.assertEqual(item.difficulty, 0)
+        self.assertNotEqual(after, before)
+
+
+class SessionTimerTests(ExamDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.supervisor = User.objects.create_user('supervisor', password='timer', is_staff=True)
+
+    def post_action(self, session, action, **data):
+        return self.client.post(reverse('exam:session_state'), {
+            'session_id': session.session_id, 'action': action, **data
+        })
+
+    def test_timer_controls_require_a_supervisor(self):
+        session = _new_session('question_reading', deadline_at=timezone.now() + timedelta(minutes=10))
+        for action, data in (('pause', {}), ('resume', {}), ('extend_time', {'seconds': 600})):
+            self.assertEqual(self.post_action(session, action, **data).status_code, 403)
+        session.refresh_from_db()
+        self.assertIsNone(session.paused_at)
+        self.assertEqual(session.extension_seconds, 0)
+
+    def test_extension_must_be_a_positive_whole_number(self):
+        session = _new_session('question_reading', deadline_at=timezone.now() + timedelta(minutes=10))
+        self.client.force_login(self.supervisor)
+        for seconds in ('ten', '', '-60'):
+            self.assertEqual(self.post_action(session, 'extend_time', seconds=seconds).status_code, 400)
+
+        response = self.post_action(session, 'extend_time', seconds=300)
+        self.assertEqual(response.status_code, 200)
+        session.refresh_from_db()
+        self.assertEqual(session.extension_seconds, 300)
+
+    def test_paused_clock_is_frozen_and_resume_moves_the_deadline(self):
+        session = _new_session('question_reading', deadline_at=timezone.now() + timedelta(minutes=10))
+        self.client.force_login(self.supervisor)
+        self.assertTrue(self.post_action(session, 'pause').json()['paused'])
+        # Time spent paused is given back on resume
+        ExamSession.objects.filter(pk=session.pk).update(paused_at=F('paused_at') - timedelta(minutes=5))
+        session.refresh_from_db()
+        remaining = session.time_remaining
+        self.assertFalse(session.is_expired)
+
+        self.post_action(session, 'resume')
+        session.refresh_from_db()
+        self.assertIsNone(session.paused_at)
+        self.assertAlmostEqual(session.time_remaining, remaining, delta=2)
+
+    def test_time_remaining_falls_back_to_the_exam_duration(self):
+        session = _new_session('question_reading')
+        self.assertIsNone(session.deadline_at)
+        expected = session.started_at + timedelta(minutes=session.exam.duration_minutes)
+        self.assertEqual(session.effective_deadline, expected)
+
+    def test_bulk_extension_covers_sessions_without_a_deadline(self):
+        with_deadline = _new_session('question_reading', deadline_at=timezone.now() + timedelta(minutes=10))
+        without_deadline = _new_session('question_reading')
+        deadlines = {s.pk: s.effective_deadline for s in (with_deadline, without_deadline)}
+
+        extended = ExamSession.objects.filter(pk__in=deadlines).extend_deadline(300)
+
+        self.assertEqual(extended, 2)
+        for session in ExamSession.objects.filter(pk__in=deadlines):
+            self.assertEqual(session.deadline_at, deadlines[session.pk] + timedelta(seconds=300))
+            self.assertEqual(session.extension_seconds, 300)
+
+
+class ExpirySweeperTests(ExamDataTestCase):
+    def started(self, session, minutes_ago):
+        ExamSession.objects.filter(pk=session.pk).update(started_at=timezone.now() - timedelta(minutes=minutes_ago))
+
+    def test_overdue_sessions_are_completed_with_their_results(self):
+        duration = _largest_exam().duration_minutes
+        overdue = _new_session('answer_capture', deadline_at=timezone.now() - timedelta(seconds=1))
+        legacy = _new_session('question_reading')
+        self.started(legacy, duration + 1)
+        running = _new_session('question_reading')
+        paused = _new_session('question_reading', deadline_at=timezone.now() - timedelta(minutes=1),
+                              paused_at=timezone.now() - timedelta(minutes=2))
+
+        expired, _ = expire_overdue_sessions(batch_size=1)
+
+        self.assertEqual(expired, 2)
+        states = dict(ExamSession.objects.filter(
+            pk__in=[overdue.pk, legacy.pk, running.pk, paused.pk]
+        ).values_list('pk', 'current_state'))
+        self.assertEqual(states[overdue.pk], 'exam_complete')
+        # No stored deadline, but past started_at + duration, as effective_deadline says
+        self.assertEqual(states[legacy.pk], 'exam_complete')
+        self.assertEqual(states[running.pk], 'question_reading')
+        self.assertEqual(states[paused.pk], 'question_reading')
+        self.assertEqual(ExamResult.objects.filter(exam_session__in=[overdue, legacy]).count(), 2)
+
+    def test_sessions_paused_or_extended_after_the_scan_are_left_running(self):
+        past = timezone.now() - timedelta(seconds=1)
+        overdue = _new_session('answer_capture', deadline_at=past)
+        # Both were overdue when the sweeper read the batch, then a supervisor stepped in
+        paused = _new_session('question_reading', deadline_at=past, paused_at=timezone.now())
+        extended = _new_session('question_reading', deadline_at=timezone.now() + timedelta(minutes=5))
+
+        with mock.patch('exam.expiry.publish_session_refresh') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            closed = _close_batch([overdue.pk, paused.pk, extended.pk], timezone.now())
+
+        self.assertEqual(closed, 1)
+        publish.assert_called_once_with([str(overdue.session_id)])
+        states = dict(ExamSession.objects.filter(
+            pk__in=[overdue.pk, paused.pk, extended.pk]
+        ).values_list('pk', 'current_state'))
+        self.assertEqual(states, {
+            overdue.pk: 'exam_complete', paused.pk: 'question_reading', extended.pk: 'question_reading'
+        })
+        self.assertEqual(list(ExamResult.objects.filter(
+            exam_session__in=[overdue, paused, extended]
+        ).values_list('exam_session', flat=True)), [overdue.pk])
+
+    def test_sweeping_twice_expires_nothing_more(self):
+        _new_session('answer_capture', deadline_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(expire_overdue_sessions()[0], 1)
+        self.assertEqual(expire_overdue_sessions()[0], 0)
+
+
+class SpeechCacheTests(ExamDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        speech = override_settings(
+            TTS_CACHE_DIR=self.cache_dir,
+            SPEECH_BACKEND={'BACKEND': 'exam.speech.FakeSpeechBackend', 'OPTIONS': {'cache_audio': True}},
+        )
+        speech.enable()
+        self.addCleanup(speech.disable)
+
+    def cached_files(self):
+        return [name for _, _, names in os.walk(self.cache_dir) for name in names]
+
+    def test_only_fixed_prompts_are_cached(self):
+        session = _new_session('student_name')
+        reply = VoiceFlowManager().handle_voice_input(session, None, 'Ada Lovelace')
+        self.assertFalse(reply['cacheable'])
+        self.assertEqual(self.cached_files(), [])
+
+        session = _new_session('question_reading')
+        reply = VoiceFlowManager().handle_voice_input(session, None, 'repeat')
+        self.assertTrue(reply['cacheable'])
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_text_to_speech_honours_the_cache_flag(self):
+        self.client.post(reverse('exam:text_to_speech'), {'text': 'Your score is 7', 'cache': '0'})
+        self.assertEqual(self.cached_files(), [])
+        self.client.post(reverse('exam:text_to_speech'), {'text': 'Question 1'})
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_prune_drops_the_least_recently_used_audio(self):
+        for age, key in enumerate(('c' * 64, 'b' * 64, 'a' * 64)):
+            tts_cache.store_audio(key, b'x' * 100)
+            stamp = time.time() - 100 * (3 - age)
+            os.utime(tts_cache._path(key), (stamp, stamp))
+        # Reading the oldest entry makes it the most recently used
+        self.assertEqual(tts_cache.get_audio('c' * 64), b'x' * 100)
+
+        self.assertEqual(tts_cache.prune(max_bytes=200), 1)
+        self.assertIsNone(tts_cache.get_audio('b' * 64))
+        self.assertIsNotNone(tts_cache.get_audio('a' * 64))
+        self.assertIsNotNone(tts_cache.get_audio('c' * 64))
+
+
+class QuestionBankImportTests(SimpleTestCase):
+    def assertBankErrors(self, content, format, *expected):
+        with self.assertRaises(QuestionBankError) as raised:
+            parse_question_bank(content, format)
+        for fragment in expected:
+            self.assertTrue(any(fragment in error for error in raised.exception.errors), raised.exception.errors)
+
+    def test_json_values_of_the_wrong_type_are_row_errors(self):
+        bank = json.dumps([{
+            'title': 'Fractions',
+            'subject': 'MATH',
+            'grade_level': ['5'],
+            'language': ['en'],
+            'questions': [
+                {'question_text': 'Is 1/2 more than 1/3?', 'question_type': {'type': 'true_false'},
+                 'correct_answer': 'true'},
+                {'question_text': 'Half of 8?', 'question_type': 'short_answer', 'correct_answer': '4',
+                 'points': [1]},
+            ],
+        }])
+        self.assertBankErrors(
+            bank, 'json',
+            'Exam 1 (Fractions): grade_level must be text, got a list',
+            'Exam 1 (Fractions): language must be one of',
+            'Exam 1 (Fractions) question 1: question_type must be one of',
+            'Exam 1 (Fractions) question 2: points must be a whole number',
+        )
+
+    def test_malformed_csv_rows_are_reported_with_their_line(self):
+        bank = (
+            'exam,subject,grade_level,question_text,question_type,correct_answer,option_a,option_b\n'
+            'Fractions,MATH,5,Half of 8?,short_answer,4,,\n'
+            'Fractions,MATH,5,Is 1/2 more than 1/3?,yes_no,true,,\n'
+            'Fractions,MATH,5\n'
+            'Fractions,MATH,5,Which is larger?,multiple_choice,C,1/2,1/3,extra\n'
+        )
+        self.assertBankErrors(
+            bank, 'csv',
+            'question 2 (line 3): question_type must be one of',
+            'question 3 (line 4): question_text is required',
+            "question 4 (line 5): correct_answer 'C' is not one of the options",
+        )
+
+    def test_valid_bank_parses(self):
+        bank = parse_question_bank(json.dumps({'exams': [{
+            'title': 'Fractions', 'subject': 'MATH', 'grade_level': '5',
+            'questions': [{'question_text': 'Half of 8?', 'question_type': 'short_answer', 'correct_answer': '4'}],
+        }]}), 'json')
+        self.assertEqual([spec.title for spec in bank], ['Fractions'])
+        self.assertEqual(bank[0].fields['language'], 'en')
+
+
+@override_settings(
+    GOOGLE_API_KEY='test-key', SPEECH_BACKEND={'BACKEND': 'exam.speech.GoogleRestBackend', 'TIMEOUT': 2.5}
+)
+class SpeechTimeoutTests(SimpleTestCase):
+    def test_timed_out_calls_fail_like_any_speech_error(self):
+        backend = GoogleRestBackend()
+        voice = {'code': 'en-US', 'name': 'en-US-Standard-C', 'gender': 'NEUTRAL'}
+        with mock.patch('exam.speech.requests.post', side_effect=requests.Timeout('read timed out')) as post, \
+                self.assertLogs('exam.speech', 'ERROR'):
+            transcription = backend.transcribe(b'audio')
+            synthesis = backend.synthesize('Question 1', voice)
+
+        self.assertEqual([call.kwargs['timeout'] for call in post.call_args_list], [2.5, 2.5])
+        self.assertEqual(transcription, {
+            'success': False, 'transcript': '', 'error': 'Speech-to-Text timed out after 2.5s'
+        })
+        self.assertEqual(synthesis, {'success': False, 'error': 'Text-to-Speech timed out after 2.5s'})
+
+
+class LoadDataTests(ExamDataTestCase):
+    def test_generated_timestamps_are_kept_without_touching_the_models(self):
+        generated = ExamSession.objects.filter(current_state='exam_complete').order_by('started_at')
+        self.assertLess(generated.first().started_at, timezone.now() - timedelta(hours=1))
+        for response in StudentResponse.objects.filter(exam_session__in=generated).select_related('exam_session'):
+            self.assertGreaterEqual(response.answered_at, response.exam_session.started_at)
+
+        # The shared field definitions still stamp new rows
+        self.assertTrue(ExamSession._meta.get_field('started_at').auto_now_add)
+        self.assertTrue(StudentResponse._meta.get_field('answered_at').auto_now_add)
+        self.assertGreater(_new_session('student_name').started_at, timezone.now() - timedelta(minutes=1))
+
+
+class RegradeCommandTests(ExamDataTestCase):
+    def test_regrade_writes_changed_responses_in_chunks(self):
+        exam = _largest_exam()
+        responses = StudentResponse.objects.filter(question__exam=exam)
+        correct = responses.filter(is_correct=True).count()
+        self.assertGreater(correct, 1)
+        # A new answer key that no stored answer matches
+        Question.objects.filter(exam=exam).update(correct_answer='no student gives this answer')
+
+        output = StringIO()
+        call_command('regrade', '--exam', str(exam.pk), '--chunk-size', '1', stdout=output)
+        self.assertIn(f'Scanned {responses.count()} responses, updated {correct}', output.getvalue())
+        self.assertFalse(responses.filter(is_correct=True).exists())
+        self.assertFalse(responses.exclude(points_earned=0).exists())
+        self.assertFalse(ExamSession.objects.filter(exam=exam).exclude(total_score=0).exists())
+
+    def test_regrade_needs_a_target(self):
+        with self.assertRaises(CommandError):
+            call_command('regrade')
+
+
+class ExamTotalsTests(ExamDataTestCase):
+    def assertTotals(self, exam):
+        exam.refresh_from_db()
+        questions = exam.questions.all()
+        self.assertEqual(exam.question_count, questions.count())
+        self.assertEqual(exam.total_points, sum(question.points for question in questions))
+
+    def test_totals_follow_question_changes(self):
+        exam, other = Exam.objects.order_by('pk')[:2]
+        question = Question.objects.create(
+            exam=exam, question_text='Half of 8?', question_type='short_answer', correct_answer='4', order=99, points=5
+        )
+        self.assertTotals(exam)
+
+        question.points = 2
+        question.save()
+        self.assertTotals(exam)
+
+        # Moving a question changes both exams
+        question.exam = other
+        question.save()
+        self.assertTotals(exam)
+        self.assertTotals(other)
+
+        question.delete()
+        self.assertTotals(other)
+
+    def test_a_stale_exam_does_not_overwrite_the_totals(self):
+        exam = _largest_exam()
+        stale = Exam.objects.get(pk=exam.pk)
+        exam.questions.first().delete()
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertTotals(exam)
+
+
+class ExamSnapshotTests(ExamDataTestCase):
+    def test_snapshot_is_served_from_memory_until_the_exam_changes(self):
+        exam = _largest_exam()
+        snapshot = exam.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertIs(exam.get_snapshot(), snapshot)
+
+        question = exam.questions.get(order=snapshot.questions[0].order)
+        question.question_text = 'What is half of 8?'
+        question.save()
+        exam.refresh_from_db()
+        rebuilt = exam.get_snapshot()
+        self.assertGreater(rebuilt.version, snapshot.version)
+        self.assertIn('What is half of 8?', rebuilt.questions[0].voice_text)
+        self.assertNotIn('What is half of 8?', snapshot.questions[0].voice_text)
+
+    def test_each_edit_is_one_new_version(self):
+        exam = _largest_exam()
+        version = exam.content_version
+        exam.title = 'Renamed'
+        exam.save()
+        self.assertEqual(exam.content_version, version + 1)
+
+    def test_bulk_question_updates_refresh_the_snapshot(self):
+        exam = _largest_exam()
+        first = exam.get_snapshot().questions[0]
+        Question.objects.filter(pk=first.id).update(correct_answer='changed in bulk')
+        exam.refresh_from_db()
+        self.assertEqual(exam.get_snapshot().questions[0].correct_answer, 'changed in bulk')
+
+    def test_snapshot_is_read_only(self):
+        snapshot = _largest_exam().get_snapshot()
+        with self.assertRaises(AttributeError):
+            snapshot.questions[0].points = 10
+        multiple_choice = next(question for question in snapshot.questions if question.options)
+        with self.assertRaises(TypeError):
+            multiple_choice.options['A'] = 'changed'
+
+
+class ScoreReconciliationTests(ExamDataTestCase):
+    def test_only_drifted_sessions_are_repaired(self):
+        drifted = _completed_session()
+        expected = drifted.total_score
+        ExamSession.objects.filter(pk=drifted.pk).update(total_score=F('total_score') + 7)
+        untouched = ExamSession.objects.exclude(pk=drifted.pk).values_list('pk', 'version')
+
+        before = dict(untouched)
+        checked, repaired = reconcile_session_scores()
+        self.assertEqual((checked, repaired), (ExamSession.objects.count(), 1))
+        drifted.refresh_from_db()
+        self.assertEqual(drifted.total_score, expected)
+        self.assertEqual(dict(untouched), before)
+
+    def test_results_and_statistics_of_a_drifted_session_are_corrected(self):
+        session = ExamSession.objects.filter(
+            current_state='exam_complete', result__total_score__gt=0
+        ).select_related('result').first()
+        result = session.result
+        stats = ExamStats.objects.filter(exam=session.exam_id).values('score_sum', 'score_histogram')
+        expected_result, expected_stats = [dict(entry) for entry in result.questions], stats.get()
+
+        # A lost point: the session, its summary and the statistics all moved with it
+        entry = next(entry for entry in result.questions if entry['points_earned'])
+        lost = entry['points_earned']
+        entry.update(is_correct=False, points_earned=0)
+        ExamResult.objects.filter(pk=result.pk).update(
+            questions=result.questions, total_score=F('total_score') - lost, correct_answers=F('correct_answers') - 1
+        )
+        ExamSession.objects.filter(pk=session.pk).update(total_score=F('total_score') - lost)
+        record_score_changes({session.exam_id: [(result.total_score, result.total_score - lost, result.max_score)]})
+
+        self.assertEqual(reconcile_session_scores()[1], 1)
+        result.refresh_from_db()
+        self.assertEqual(result.questions, expected_result)
+        self.assertEqual(result.total_score, session.total_score)
+        self.assertEqual(stats.get(), expected_stats)
+
+    def test_reconcile_command_reports_repairs(self):
+        ExamSession.objects.filter(pk=_completed_session().pk).update(total_score=-1)
+        output = StringIO()
+        call_command('reconcile_scores', stdout=output)
+        self.assertIn(f'Checked {ExamSession.objects.count()} sessions, repaired 1', output.getvalue())
+
+
+class SessionEventsTests(ExamDataTestCase):
+    def advance(self, session):
+        with self.captureOnCommitCallbacks(execute=True):
+            session.current_state = 'answer_capture'
+            session.save()
+
+    async def test_stream_sends_the_state_then_each_new_version(self):
+        session = await sync_to_async(_new_session)('question_reading')
+        response = await self.async_client.get(reverse('exam:session_events'), {'session_id': session.session_id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        try:
+            first = (await anext(events)).decode()
+            self.assertTrue(first.startswith(f'id: {session.version}\nevent: state\n'), first)
+            self.assertEqual(json.loads(first.split('data: ', 1)[1])['state'], 'question_reading')
+
+            # The next transition is pushed without a poll
+            await sync_to_async(self.advance)(session)
+            second = (await asyncio.wait_for(anext(events), timeout=1)).decode()
+            self.assertTrue(second.startswith(f'id: {session.version}\n'), second)
+            self.assertEqual(json.loads(second.split('data: ', 1)[1])['state'], 'answer_capture')
+        finally:
+            await events.aclose()
+
+    def test_stream_needs_the_asgi_server(self):
+        session = _new_session('question_reading')
+        response = self.client.get(reverse('exam:session_events'), {'session_id': session.session_id})
+        self.assertEqual(response.status_code, 501)
+
+
+class SessionStatePollTests(ExamDataTestCase):
+    def poll(self, session, **params):
+        headers = params.pop('headers', {})
+        return self.client.get(reverse('exam:session_state'), {'session_id': session.session_id, **params}, **headers)
+
+    def test_unchanged_state_is_not_modified(self):
+        session = _new_session('question_reading')
+        first = self.poll(session)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(1):
+            again = self.poll(session, headers={'HTTP_IF_NONE_MATCH': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+        session.current_state = 'answer_capture'
+        session.save()
+        self.assertEqual(self.poll(session, headers={'HTTP_IF_NONE_MATCH': first['ETag']}).status_code, 200)
+
+    def test_since_returns_only_changed_fields(self):
+        session = _new_session('question_reading')
+        version = self.poll(session).json()['version']
+        session.current_state = 'answer_capture'
+        session.save()
+
+        delta = self.poll(session, since=version).json()
+        self.assertEqual(
+            (delta['since'], delta['version'], delta['state']), (version, session.version, 'answer_capture')
+        )
+        self.assertNotIn('exam_title', delta)
+        self.assertNotIn('current_question', delta)
+
+        # A version this process never served falls back to the full state
+        self.assertIn('exam_title', self.poll(session, since=version + 100).json())
+
+
+class SessionMonitorPageTests(ExamDataTestCase):
+    def test_keyset_pages_cover_every_session_once(self):
+        # Sessions started at the same moment are split by id
+        tied = ExamSession.objects.order_by('pk')[:3]
+        ExamSession.objects.filter(pk__in=[session.pk for session in tied]).update(started_at=timezone.now())
+        sessions = ExamSession.objects.for_monitor()
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = sessions.page(cursor, size=2)
+            seen.extend((session.started_at, session.pk) for session in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), ExamSession.objects.count())
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        response = self.client.get(reverse('exam:session_list'), {'tab': 'completed', 'before': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class IncrementalStatsTests(ExamDataTestCase):
+    def counters(self, exam):
+        exam_stats = ExamStats.objects.filter(exam=exam).values(
+            'sessions_started', 'sessions_completed', 'score_sum', 'score_histogram'
+        ).get()
+        question_stats = set(QuestionStats.objects.filter(question__exam=exam).values_list(
+            'question_id', 'responses', 'correct', 'points_sum'
+        ))
+        return exam_stats, question_stats
+
+    def test_counters_match_a_full_recompute(self):
+        exam = _largest_exam()
+        session = _new_session('answer_confirmation')
+        session._request_session = {'temp_answer': 'A', 'temp_transcript': 'option a'}
+        VoiceFlowManager().handle_voice_input(session, None, 'yes')
+        session.refresh_from_db()
+        session.complete_exam()
+        _make_incorrect(exam.questions.order_by('order').first())
+        regrade_responses(exam.questions.all())
+
+        incremental = self.counters(exam)
+        recompute_exam_stats([exam.pk])
+        self.assertEqual(self.counters(exam), incremental)
+
+
+class ResultsExportTests(ExamDataTestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user('supervisor', password='export', is_staff=True)
+        self.client.login(username='supervisor', password='export')
+
+    def export(self, **params):
+        response = self.client.get(reverse('exam:results_export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_sessions_csv_has_one_row_per_result(self):
+        exam = _largest_exam()
+        response, body = self.export(kind='sessions', format='csv', exam=exam.pk)
+        self.assertIn(f'sessions-exam{exam.pk}-', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(body)))
+        results = ExamResult.objects.filter(exam=exam).select_related('exam_session')
+        self.assertEqual(len(rows), results.count())
+        self.assertEqual(
+            {(row['session_id'], int(row['total_score'])) for row in rows},
+            {(str(result.exam_session.session_id), result.total_score) for result in results},
+        )
+
+    def test_responses_jsonl_covers_completed_sessions_only(self):
+        with mock.patch('exam.exports.ROWS_PER_WRITE', 2):
+            response, body = self.export(kind='responses', format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(
+            len(rows), StudentResponse.objects.filter(exam_session__current_state='exam_complete').count()
+        )
+        self.assertEqual(list(rows[0]), [name for name, _ in RESPONSE_COLUMNS])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(reverse('exam:results_export'), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminChangelistTests(ExamDataTestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.create_superuser('admin', password='changelist')
+        self.client.login(username='admin', password='changelist')
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:exam_studentresponse_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        counts = [query['sql'] for query in context.captured_queries
+                  if query['sql'].upper().startswith('SELECT COUNT(') and 'exam_studentresponse' in query['sql']]
+        return response.context['cl'], counts
+
+    def test_large_unfiltered_table_is_estimated_instead_of_counted(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with mock.patch('exam.admin.ESTIMATED_COUNT_THRESHOLD', 1):
+            changelist, counts = self.changelist()
+        self.assertEqual(counts, [])
+        self.assertEqual(changelist.result_count, StudentResponse.objects.count())
+
+    def test_tables_without_a_usable_estimate_are_counted(self):
+        # Deleting rows leaves gaps in the ids, which must not inflate the total
+        StudentResponse.objects.filter(pk__in=StudentResponse.objects.order_by('pk').values('pk')[1:5]).delete()
+        with mock.patch('exam.admin.ESTIMATED_COUNT_THRESHOLD', 1):
+            changelist, counts = self.changelist()
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(changelist.result_count, StudentResponse.objects.count())
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        # Below the threshold the estimate is not trusted either
+        changelist, counts = self.changelist()
+        self.assertEqual(len(counts), 1)
+
+    def test_filtered_pages_are_counted_once(self):
+        with mock.patch('exam.admin.ESTIMATED_COUNT_THRESHOLD', 1):
+            changelist, counts = self.changelist(is_correct__exact='1')
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(changelist.result_count, StudentResponse.objects.filter(is_correct=True).count())
+
+
+class LoadTestCommandTests(TransactionTestCase):
+    """A small in-process run; worker threads only see committed data"""
+
+    def setUp(self):
+        clear_snapshot_cache()
+        self.addCleanup(clear_snapshot_cache)
+        generate_load_data(seed=1, **SMALL_VOLUME)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_students_complete_their_exams_and_the_lock_monitor_is_removed(self):
+        monitors = []
+
+        class RecordingMonitor(LockWaitMonitor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                monitors.append(self)
+
+        exam = Exam.objects.filter(is_active=True, question_count__gt=0).order_by('pk').first()
+        sessions_before = ExamSession.objects.count()
+        report_path = os.path.join(self.media_root, 'report.json')
+        # The shared in-memory test database refuses concurrent writes outright instead of waiting on
+        # them, so the students start half a second apart
+        with override_settings(MEDIA_ROOT=self.media_root, TRACE_LOG_PATH=''), \
+                mock.patch('exam.management.commands.loadtest_exam.LockWaitMonitor', RecordingMonitor):
+            call_command('loadtest_exam', '--students', '2', '--exam', str(exam.pk), '--ramp-up', '1',
+                         '--lock-threshold-ms', '0', '--json', report_path, '--cleanup', stdout=StringIO())
+
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['exams_completed'], 2)
+        self.assertEqual(report['error_rate'], 0.0)
+        for table in ('endpoints', 'states'):
+            self.assertTrue(report[table])
+            for row in report[table].values():
+                self.assertLessEqual(row['p50'], row['p95'])
+                self.assertLessEqual(row['p99'], row['max'])
+        self.assertEqual(report['states']['answer_capture']['requests'], 2 * exam.question_count)
+        self.assertIn('voice_process', report['endpoints'])
+        self.assertEqual(ExamSession.objects.count(), sessions_before)
+
+        # Every write of the run was timed, and nothing is timed once it is over
+        monitor, = monitors
+        self.assertGreater(report['sqlite_lock_waits']['waits'], 0)
+        waits = len(monitor.waits)
+
+        def write():
+            connection.close()
+            Subject.objects.update(name=F('name'))
+
+        asyncio.run(sync_to_async(write)())
+        self.assertEqual(len(monitor.waits), waits)
+
+
+def _benchmark_result(name, best_us):
+    return BenchmarkResult(name=name, calls=20, best_us=best_us, median_us=best_us * 1.1, p95_us=best_us * 1.5)
+
+
+class BenchmarkBaselineTests(SimpleTestCase):
+    def setUp(self):
+        self.baseline = baseline_payload([_benchmark_result('parse_command', 10.0), _benchmark_result('grade', 40.0)])
+
+    def test_only_changes_beyond_the_threshold_are_regressions(self):
+        results = [_benchmark_result('parse_command', 11.0), _benchmark_result('grade', 50.0)]
+        self.assertAlmostEqual(relative_change(results[0], self.baseline), 0.1)
+        self.assertAlmostEqual(relative_change(results[1], self.baseline), 0.25)
+        self.assertEqual(compare_to_baseline(results, self.baseline, 0.15), [('grade', 40.0, 50.0, 0.25)])
+        self.assertEqual(compare_to_baseline(results, self.baseline, 0.25), [])
+        # Faster is never a regression
+        self.assertEqual(compare_to_baseline([_benchmark_result('grade', 20.0)], self.baseline, -0.4), [])
+
+    def test_benchmarks_missing_from_the_baseline_are_not_compared(self):
+        new = _benchmark_result('turn_answer', 500.0)
+        self.assertIsNone(relative_change(new, self.baseline))
+        self.assertIsNone(relative_change(new, None))
+        self.baseline['results']['turn_answer'] = {'name': 'turn_answer', 'best_us': 0}
+        self.assertIsNone(relative_change(new, self.baseline))
+        self.assertEqual(compare_to_baseline([new], self.baseline, 0.15), [])
+
+    def test_saved_baseline_is_compared_on_the_next_run(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        baseline_path = os.path.join(directory, 'voice_benchmarks.json')
+        runs = [
+            [_benchmark_result('parse_command', 9.0), _benchmark_result('grade', 45.0)],
+            [_benchmark_result('parse_command', 10.0), _benchmark_result('grade', 40.0)],
+            [_benchmark_result('parse_command', 10.5), _benchmark_result('grade', 42.0)],
+            [_benchmark_result('parse_command', 10.5), _benchmark_result('grade', 60.0)],
+        ]
+
+        def benchmark_voice(*args):
+            output = StringIO()
+            call_command('benchmark_voice', '--baseline', baseline_path, *args, stdout=output, stderr=output)
+            return output.getvalue()
+
+        # Timing is replaced with fixed results; the throwaway database is not needed for them
+        command = 'exam.management.commands.benchmark_voice'
+        with mock.patch(f'{command}.run_benchmarks', side_effect=runs), \
+                mock.patch(f'{command}.seed_benchmark_data'), \
+                mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            self.assertIn('No baseline at', benchmark_voice())
+            self.assertIn('Baseline written to', benchmark_voice('--save'))
+            with open(baseline_path) as baseline_file:
+                saved = json.load(baseline_file)
+            self.assertEqual(saved['results']['grade']['best_us'], 40.0)
+
+            self.assertIn('No regressions beyond 15%', benchmark_voice())
+            output = StringIO()
+            with self.assertRaisesMessage(CommandError, '1 benchmarks regressed by more than 15%'):
+                call_command('benchmark_voice', '--baseline', baseline_path, stdout=output, stderr=output)
+        self.assertIn('grade: 40.00 us -> 60.00 us (+50.0%)', output.getvalue())
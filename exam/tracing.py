@@ -0,0 +1,147 @@
+from collections import Counter
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Header the voice client sends its per-turn trace id in; responses echo it back
+TRACE_HEADER = 'X-Trace-Id'
+
+_TRACE_ID = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+
+_write_lock = threading.Lock()
+
+
+def trace_id_from(request):
+    """The client's trace id for a request, or a new one when it sent none or an unusable one"""
+    supplied = request.headers.get(TRACE_HEADER, '')
+    return supplied if _TRACE_ID.match(supplied) else uuid.uuid4().hex
+
+
+def session_trace_state(session):
+    """The parts of a session's state a slow-turn trace records, read without a query"""
+    return {
+        'state': session.current_state,
+        'question': session.current_question_index + 1,
+        'version': session.version,
+        'total_score': session.total_score,
+    }
+
+
+def is_slow(turn):
+    """Whether a finished turn took at least TRACE_SLOW_TURN_MS and tracing is switched on"""
+    threshold = getattr(settings, 'TRACE_SLOW_TURN_MS', None)
+    if threshold is None or not getattr(settings, 'TRACE_LOG_PATH', None):
+        return False
+    return turn.elapsed * 1000 >= threshold
+
+
+def trace_record(turn, status):
+    """One JSON-ready slow-turn record: the span tree, session state around the turn and payload sizes"""
+    spans = turn.root.to_dict(turn.root.started)
+    return {
+        'trace_id': turn.trace_id,
+        'recorded_at': timezone.now().isoformat(),
+        'session_id': spans.get('attributes', {}).get('session_id'),
+        'state': turn.state,
+        'language': turn.language,
+        'outcome': turn.outcome,
+        'status': status,
+        'duration_ms': spans['duration_ms'],
+        'threshold_ms': getattr(settings, 'TRACE_SLOW_TURN_MS', None),
+        'before': turn.before,
+        'after': turn.after,
+        'sizes': turn.sizes,
+        'spans': spans,
+    }
+
+
+def append_trace(record, path=None):
+    """Append a record as one line of the trace log; failures are logged and never raised"""
+    path = path or settings.TRACE_LOG_PATH
+    line = json.dumps(record, default=str, separators=(',', ':')) + '\n'
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One write per record to a file opened for appending, so lines never interleave
+        with _write_lock, open(path, 'a', encoding='utf-8') as log:
+            log.write(line)
+    except OSError as e:
+        logger.error(f"Could not write slow turn trace {record.get('trace_id')}: {str(e)}")
+
+
+def read_traces(path):
+    """Records in a trace log, skipping lines that are not JSON (such as one cut short by a crash)"""
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def top_level_stages(record):
+    """Milliseconds per top-level stage of a record, summed over repeats"""
+    totals = {}
+    for span in record.get('spans', {}).get('children', []):
+        totals[span['name']] = totals.get(span['name'], 0.0) + span['duration_ms']
+    return totals
+
+
+def dominant_stage(record):
+    """(name, milliseconds) of the stage a turn spent longest in, or (None, 0.0) if it has none"""
+    stages = top_level_stages(record)
+    if not stages:
+        return None, 0.0
+    name = max(stages, key=stages.get)
+    return name, stages[name]
+
+
+def summarize_traces(records, top=10):
+    """The slowest turns and, over every record, how often each stage dominated and its total time"""
+    records = sorted(records, key=lambda record: record.get('duration_ms', 0), reverse=True)
+    dominated = Counter()
+    stage_ms = Counter()
+    for record in records:
+        name, _ = dominant_stage(record)
+        if name:
+            dominated[name] += 1
+        stage_ms.update(top_level_stages(record))
+    return {
+        'count': len(records),
+        'worst': records[:top],
+        'stages': [
+            {'stage': name, 'dominant_in': dominated[name], 'total_ms': round(total, 2)}
+            for name, total in stage_ms.most_common()
+        ],
+    }
+
+
+def find_trace(records, trace_id):
+    """The newest record with a trace id, or None"""
+    found = None
+    for record in records:
+        if record.get('trace_id') == trace_id:
+            found = record
+    return found
+
+
+def format_span_tree(span, depth=0):
+    """Lines of an indented span tree with each span's start, duration and attributes"""
+    attributes = ' '.join(f'{key}={value}' for key, value in span.get('attributes', {}).items())
+    lines = [f"{'  ' * depth}{span['name']:<{max(1, 20 - 2 * depth)}} "
+             f"+{span['start_ms']:>9.1f} ms {span['duration_ms']:>9.1f} ms  {attributes}".rstrip()]
+    for child in span.get('children', []):
+        lines.extend(format_span_tree(child, depth + 1))
+    return lines
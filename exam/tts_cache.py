@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+import hashlib
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Concurrent synthesis requests while prerendering
+PRERENDER_WORKERS = 4
+
+# Writes between checks of the cache size against TTS_CACHE_MAX_BYTES
+PRUNE_EVERY = 100
+
+_writes = itertools.count(1)
+
+
+def cache_dir():
+    return getattr(settings, 'TTS_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'tts'))
+
+
+def cache_key(request_body):
+    """Key synthesized audio by everything that shapes it: text, voice and encoding"""
+    return hashlib.sha256(json.dumps(request_body, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _path(key):
+    return os.path.join(cache_dir(), key[:2], f'{key}.mp3')
+
+
+def get_audio(key):
+    """Return cached audio bytes for a key, or None; a hit marks the entry as recently used"""
+    path = _path(key)
+    try:
+        with open(path, 'rb') as audio_file:
+            audio_content = audio_file.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return audio_content
+
+
+def store_audio(key, audio_content):
+    """Write audio to the cache; readers never see a partly written file"""
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            temp_file.write(audio_content)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"TTS cache write error: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return
+    if next(_writes) % PRUNE_EVERY == 0:
+        prune()
+
+
+def prune(max_bytes=None):
+    """Delete the least recently used audio until the cache fits in max_bytes; returns files removed"""
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'TTS_CACHE_MAX_BYTES', None)
+    if not max_bytes:
+        return 0
+
+    entries = []
+    total = 0
+    for directory, _, names in os.walk(cache_dir()):
+        for name in names:
+            if not name.endswith('.mp3'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    if removed:
+        logger.info(f"Pruned {removed} least recently used files from the TTS cache")
+    return removed
+
+
+def prerender_exams(exam_ids):
+    """Synthesize every question of the given exams into the cache; returns how many succeeded"""
+    from .models import Exam
+    from .voice_processor import VoiceProcessor
+
+    processor = VoiceProcessor()
+    texts = []
+    for exam in Exam.objects.filter(pk__in=exam_ids):
+        snapshot = exam.get_snapshot()
+        texts.extend((question.voice_text, snapshot.language_code) for question in snapshot.questions)
+
+    with ThreadPoolExecutor(max_workers=PRERENDER_WORKERS) as executor:
+        results = executor.map(lambda item: processor.synthesize_speech(*item)['success'], texts)
+        rendered = sum(results)
+
+    logger.info(f"Prerendered {rendered}/{len(texts)} question prompts for exams {list(exam_ids)}")
+    return rendered
+
+
+def prerender_in_background(exam_ids):
+    """Start prerendering on a daemon thread after the current transaction commits"""
+    def run():
+        try:
+            prerender_exams(exam_ids)
+        except Exception as e:
+            logger.error(f"TTS prerender error: {str(e)}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name='tts-prerender', daemon=True)
+    transaction.on_commit(thread.start)
+    return thread
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models import F
+
+
+class TurnUnitOfWork:
+    """Collect the writes of one voice turn and flush them in a single transaction.
+
+    Handlers do their reads first, mutate the ExamSession in memory and queue
+    other writes with defer(); flush() then issues one version-checked UPDATE
+    for the session fields that changed, followed by the queued writes. If the
+    session was written concurrently the whole transaction rolls back and
+    StaleSessionError propagates so the caller can re-run the turn.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._deferred = []
+        self._expressions = {}
+
+    def defer(self, operation):
+        """Queue a callable to run inside the flush transaction, after the session write"""
+        self._deferred.append(operation)
+
+    def adjust(self, field, delta):
+        """Add delta to a numeric session field with an F() expression"""
+        if not delta:
+            return
+        setattr(self.session, field, getattr(self.session, field) + delta)
+        expression = self._expressions.get(field, F(field))
+        self._expressions[field] = expression + delta
+
+    def flush(self):
+        """Apply the session's changed fields and all queued writes atomically.
+
+        The session UPDATE is the transaction's first statement, so on SQLite it
+        takes the write lock up front and waits out the busy timeout, where a
+        transaction that read first fails at once when another one is writing.
+        Queued writes always bump the version, which fences what the handlers
+        read before the transaction: any concurrent change to it bumps it too.
+        """
+        with transaction.atomic():
+            changed = self.session.commit_changes(self._expressions, touch=bool(self._deferred))
+            for operation in self._deferred:
+                operation()
+        self._deferred = []
+        self._expressions = {}
+        return changed
@@ -15,10 +15,15 @@ urlpatterns = [
     
     # Session management
     path('session/state/', views.SessionStateView.as_view(), name='session_state'),
+    path('session/events/', views.SessionEventsView.as_view(), name='session_events'),
     path('session/list/', views.SessionListView.as_view(), name='session_list'),
+    path('session/list/live/', views.LiveSessionCardsView.as_view(), name='session_cards'),
     
     # Results and monitoring
     path('results/<str:session_id>/', views.ExamResultsView.as_view(), name='exam_results'),
+    path('exams/<int:exam_id>/stats/', views.ExamStatsView.as_view(), name='exam_stats'),
+    path('exports/results/', views.ResultsExportView.as_view(), name='results_export'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     
     # Admin interface
     path('admin/', admin.site.urls),
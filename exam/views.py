@@ -1,18 +1,33 @@
 import json
 import uuid
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.utils import timezone
 from django.core.files.base import ContentFile
 from django.core.files import File
-from datetime import datetime
+from django.db.models import F
+from datetime import date, datetime, timedelta
+import asyncio
+import hmac
 import os
 
-from .models import Exam, ExamSession, Subject
+from .models import Exam, ExamResult, ExamSession, ExamStats, QuestionStats, Subject
+from .exports import EXPORT_FORMATS, EXPORT_KINDS, export_rows, iterate_async
+from .results import preview_exam_result, record_exam_results
+from .events import (
+    MONITOR_CHANNEL, REFRESH, broker, format_sse, remember_state, session_channel,
+    session_state_payload, state_delta
+)
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, stage, voice_turn
+from .tracing import TRACE_HEADER, append_trace, is_slow, session_trace_state, trace_id_from, trace_record
 from .voice_processor import VoiceFlowManager, VoiceProcessor
 import logging
 
@@ -48,7 +63,7 @@ class ExamSessionView(View):
                 exam=exam,
                 session_id=str(uuid.uuid4()),
                 current_state='student_name',
-                time_remaining=exam.duration_minutes * 60  # Convert to seconds
+                deadline_at=timezone.now() + timedelta(minutes=exam.duration_minutes)
             )
             
             # Store session ID in Django session
@@ -77,26 +92,59 @@ class VoiceProcessingView(View):
         self.voice_flow_manager = VoiceFlowManager()
     
     def post(self, request):
+        with voice_turn(trace_id_from(request)) as turn:
+            response = self._process(request, turn)
+            if response.status_code >= 400:
+                turn.outcome = 'error'
+            turn.sizes['response_bytes'] = len(response.content)
+            turn.finish()
+            response['Server-Timing'] = turn.server_timing()
+            response[TRACE_HEADER] = turn.trace_id
+            turn.observe()
+            if is_slow(turn):
+                append_trace(trace_record(turn, response.status_code))
+        return response
+    
+    def _process(self, request, turn):
         try:
+            # The multipart body, audio included, is read and parsed on first access
+            with stage('upload') as span:
+                audio_file = request.FILES.get('audio')
+                turn.sizes['request_bytes'] = int(request.META.get('CONTENT_LENGTH') or 0)
+                turn.sizes['audio_bytes'] = audio_file.size if audio_file else 0
+                span.update(turn.sizes)
+            
             # Get session and validate
             session_id = request.POST.get('session_id') or request.session.get('exam_session_id')
             if not session_id:
                 return JsonResponse({'error': 'No active session'}, status=400)
             
-            session = get_object_or_404(ExamSession, session_id=session_id)
+            with stage('session_load'):
+                session = get_object_or_404(ExamSession.objects.select_related('exam'), session_id=session_id)
+            turn.state = session.current_state
+            turn.language = session.exam.language
+            turn.annotate(session_id=str(session.session_id), exam_id=session.exam_id)
+            turn.before = session_trace_state(session)
             
             # Check session expiry
-            if session.time_remaining <= 0:
-                session.current_state = 'exam_complete'
-                session.save()
+            if session.is_expired:
+                # Normally already closed by the expire_sessions sweeper
+                if session.current_state != 'exam_complete':
+                    session.complete_exam()
                 return JsonResponse({
                     'error': 'Time expired',
                     'message': 'Your exam time has expired.',
                     'state': 'exam_complete'
                 })
             
+            if session.paused_at:
+                return JsonResponse({
+                    'error': 'Exam paused',
+                    'message': 'Your exam has been paused by the supervisor.',
+                    'state': session.current_state
+                })
+            
             # Get and validate audio file
-            audio_file = request.FILES.get('audio')
             if not audio_file:
                 return JsonResponse({'error': 'No audio file provided'}, status=400)
             
@@ -112,13 +160,15 @@ class VoiceProcessingView(View):
             
             # Save file and read it back
             file_path = os.path.join(settings.MEDIA_ROOT, recording_path)
-            with open(file_path, 'wb+') as destination:
-                for chunk in audio_file.chunks():
-                    destination.write(chunk)
-            
-            # Read saved file for processing
-            with open(file_path, 'rb') as audio_file:
-                audio_data = audio_file.read()
+            with stage('recording_io') as span:
+                with open(file_path, 'wb+') as destination:
+                    for chunk in audio_file.chunks():
+                        destination.write(chunk)
+                
+                # Read saved file for processing
+                with open(file_path, 'rb') as audio_file:
+                    audio_data = audio_file.read()
+                span.update({'bytes': len(audio_data)})
             
             # Process with exact same parameters as management command
             processor = VoiceProcessor()
@@ -160,12 +210,17 @@ class VoiceProcessingView(View):
                 None,  # Don't pass audio_data here
                 transcript  # Pass the validated transcript
             )
+            if response.get('error'):
+                turn.outcome = 'error'
+            turn.after = {
+                'state': response.get('state'),
+                'question': response.get('current_question'),
+                'progress': response.get('progress'),
+                'error': response.get('error', False),
+            }
             
-            # Update session time and save
-            session.time_remaining = max(0, session.time_remaining - 5)
-            session.save()
-            
-            return JsonResponse(response)
+            with stage('encode'):
+                return JsonResponse(response)
             
         except Exception as e:
             logger.error(f"Voice processing error: {str(e)}", exc_info=True)
@@ -175,42 +230,45 @@ class VoiceProcessingView(View):
             }, status=500)
 
 
+def _session_state_etag(request):
+    """ETag of a session's state from its version and its exam's content version"""
+    session_id = request.GET.get('session_id') or request.session.get('exam_session_id')
+    if not session_id:
+        return None
+    
+    # A single indexed row read; the exam and questions are only loaded on a miss
+    versions = ExamSession.objects.filter(session_id=session_id).values_list(
+        'version', 'exam__content_version'
+    ).first()
+    return '%s.%s' % versions if versions else None
+
+
 class SessionStateView(View):
     """Handle session state requests"""
     
+    # Timer controls only a logged-in supervisor may use
+    STAFF_ACTIONS = ('extend_time', 'pause', 'resume')
+    
+    @method_decorator(condition(etag_func=_session_state_etag))
     def get(self, request):
-        """Return current session state as JSON"""
+        """Return current session state as JSON, or only the fields changed after ?since=<version>"""
         try:
             session_id = request.GET.get('session_id') or request.session.get('exam_session_id')
             if not session_id:
                 return JsonResponse({'error': 'No active session'}, status=400)
             
-            session = get_object_or_404(ExamSession, session_id=session_id)
+            session = get_object_or_404(ExamSession.objects.select_related('exam'), session_id=session_id)
             
-            current_question = session.current_question
+            payload = session_state_payload(session)
+            remember_state(payload)
             
-            return JsonResponse({
-                'session_id': session.session_id,
-                'state': session.current_state,
-                'student_name': session.student_name,
-                'student_grade': session.student_grade,
-                'current_question_index': session.current_question_index,
-                'total_questions': session.exam.get_total_questions(),
-                'progress_percentage': session.progress_percentage,
-                'time_remaining': session.time_remaining,
-                'time_remaining_formatted': session.time_remaining_formatted,
-                'total_score': session.total_score,
-                'max_score': session.exam.get_total_points(),
-                'exam_title': session.exam.title,
-                'subject': session.exam.subject.name,
-                'current_question': {
-                    'order': current_question.order,
-                    'text': current_question.question_text,
-                    'type': current_question.question_type,
-                    'options': current_question.options,
-                    'points': current_question.points
-                } if current_question else None
-            })
+            since = request.GET.get('since', '')
+            if since.isdigit():
+                delta = state_delta(payload, int(since))
+                if delta is not None:
+                    return JsonResponse(delta)
+            
+            return JsonResponse(payload)
             
         except ExamSession.DoesNotExist:
             return JsonResponse({'error': 'Invalid session'}, status=404)
@@ -229,11 +287,11 @@ class SessionStateView(View):
             
             # Handle specific state updates
             action = request.POST.get('action')
+            if action in self.STAFF_ACTIONS and not request.user.is_staff:
+                return JsonResponse({'error': 'Supervisor login required'}, status=403)
             
             if action == 'emergency_stop':
-                session.current_state = 'exam_complete'
-                session.completed_at = timezone.now()
-                session.save()
+                session.complete_exam()
                 
                 return JsonResponse({
                     'success': True,
@@ -241,14 +299,32 @@ class SessionStateView(View):
                     'state': 'exam_complete'
                 })
             
-            elif action == 'update_time':
-                time_remaining = int(request.POST.get('time_remaining', 0))
-                session.time_remaining = max(0, time_remaining)
-                session.save()
+            elif action == 'extend_time':
+                try:
+                    seconds = int(request.POST.get('seconds', 0))
+                except (TypeError, ValueError):
+                    return JsonResponse({'error': 'Extension must be a whole number of seconds'}, status=400)
+                if seconds <= 0:
+                    return JsonResponse({'error': 'Extension must be positive'}, status=400)
+                session.extend(seconds)
+                
+                return JsonResponse({
+                    'success': True,
+                    'time_remaining': session.time_remaining,
+                    'deadline_at': session.effective_deadline.isoformat()
+                })
+            
+            elif action in ('pause', 'resume'):
+                if action == 'pause':
+                    session.pause()
+                else:
+                    session.resume()
                 
                 return JsonResponse({
                     'success': True,
-                    'time_remaining': session.time_remaining
+                    'paused': session.paused_at is not None,
+                    'time_remaining': session.time_remaining,
+                    'deadline_at': session.effective_deadline.isoformat()
                 })
             
             return JsonResponse({'error': 'Invalid action'}, status=400)
@@ -260,6 +336,88 @@ class SessionStateView(View):
             return JsonResponse({'error': 'Failed to update session'}, status=500)
 
 
+class SessionEventsView(View):
+    """Server-Sent Events stream of session state, pushed on every transition"""
+    
+    # Seconds between database version probes, which catch writes made by other processes
+    RECHECK_SECONDS = 5
+    
+    async def get(self, request):
+        """Stream one session's state (?session_id=) or every session for the monitor (?monitor=1)"""
+        if not isinstance(request, ASGIRequest):
+            # Streams need the ASGI server; clients fall back to polling SessionStateView
+            return JsonResponse({'error': 'Event stream requires the ASGI server'}, status=501)
+        
+        if request.GET.get('monitor'):
+            stream = self._monitor_stream()
+        else:
+            session_id = request.GET.get('session_id')
+            if not session_id:
+                return JsonResponse({'error': 'No active session'}, status=400)
+            if not await ExamSession.objects.filter(session_id=session_id).aexists():
+                return JsonResponse({'error': 'Invalid session'}, status=404)
+            stream = self._session_stream(session_id)
+        
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    async def _session_stream(self, session_id):
+        channel = session_channel(session_id)
+        queue = broker.subscribe(channel)
+        try:
+            payload = await self._load_state(session_id)
+            last_version = payload['version']
+            yield format_sse(payload)
+            
+            while payload['state'] != 'exam_complete':
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=self.RECHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    version = await ExamSession.objects.filter(
+                        session_id=session_id
+                    ).values_list('version', flat=True).afirst()
+                    if version is None:
+                        return
+                    if version == last_version:
+                        yield ': keepalive\n\n'
+                        continue
+                    payload = REFRESH
+                
+                if payload is REFRESH:
+                    payload = await self._load_state(session_id)
+                if payload['version'] <= last_version:
+                    continue
+                last_version = payload['version']
+                yield format_sse(payload)
+        finally:
+            broker.unsubscribe(channel, queue)
+    
+    async def _monitor_stream(self):
+        queue = broker.subscribe(MONITOR_CHANNEL)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=self.RECHECK_SECONDS * 3)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if payload is REFRESH:
+                    yield 'event: refresh\ndata: {}\n\n'
+                else:
+                    yield format_sse(payload)
+        finally:
+            broker.unsubscribe(MONITOR_CHANNEL, queue)
+    
+    @staticmethod
+    @sync_to_async
+    def _load_state(session_id):
+        session = ExamSession.objects.select_related('exam').get(session_id=session_id)
+        return session_state_payload(session)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class TTSView(View):
     """Text-to-speech endpoint"""
@@ -278,9 +436,9 @@ class TTSView(View):
             # Get language preference
             language_code = request.POST.get('language', 'en-US')
             
-            # Generate TTS
+            # Generate TTS; voice turn replies say whether their text may be cached
             tts_result = self.voice_flow_manager.voice_processor.synthesize_speech(
-                text, language_code
+                text, language_code, cache=request.POST.get('cache') != '0'
             )
             
             if tts_result['success']:
@@ -336,24 +494,24 @@ class ExamResultsView(View):
     def get(self, request, session_id):
         """Display exam results"""
         try:
-            session = get_object_or_404(ExamSession, session_id=session_id)
-            
-            # Get all responses for this session
-            responses = session.responses.all().select_related('question').order_by('question__order')
-            
-            # Calculate detailed statistics
-            total_questions = session.exam.get_total_questions()
-            answered_questions = responses.count()
-            correct_answers = responses.filter(is_correct=True).count()
+            # Finished results only change when a regrade patches their outcomes, so read back the summary row
+            result = ExamResult.objects.select_related('exam_session').filter(
+                exam_session__session_id=session_id
+            ).first()
+            if result is not None:
+                session = result.exam_session
+            else:
+                session = ExamSession.objects.select_related('exam').get(session_id=session_id)
+                if session.current_state == 'exam_complete':
+                    # Completed before summaries existed; store it so later views hit the fast path
+                    recorded = record_exam_results([session], update_stats=False)
+                    result = recorded[0] if recorded else ExamResult.objects.get(exam_session=session)
+                else:
+                    result = preview_exam_result(session)
             
             context = {
                 'session': session,
-                'responses': responses,
-                'total_questions': total_questions,
-                'answered_questions': answered_questions,
-                'correct_answers': correct_answers,
-                'accuracy_percentage': (correct_answers / answered_questions * 100) if answered_questions > 0 else 0,
-                'completion_percentage': (answered_questions / total_questions * 100) if total_questions > 0 else 0
+                'result': result,
             }
             
             return render(request, 'exam/exam_results.html', context)
@@ -365,23 +523,164 @@ class ExamResultsView(View):
             return render(request, 'exam/error.html', {'error': 'Failed to load results'}, status=500)
 
 
+class ExamStatsView(View):
+    """Class-level statistics for an exam, read from the maintained counters"""
+    
+    def get(self, request, exam_id):
+        """Display exam statistics, or return them as JSON with ?format=json"""
+        try:
+            exam = Exam.objects.select_related('subject', 'stats').get(pk=exam_id)
+            stats = exam.stats if hasattr(exam, 'stats') else ExamStats(exam=exam)
+            
+            # One row per question; questions nobody has answered yet have no counters
+            questions = exam.questions.select_related('stats').order_by('order')
+            question_stats = [
+                (question, question.stats if hasattr(question, 'stats') else QuestionStats(question=question))
+                for question in questions
+            ]
+            
+            if request.GET.get('format') == 'json':
+                return JsonResponse({
+                    'exam_id': exam.pk,
+                    'sessions_started': stats.sessions_started,
+                    'sessions_completed': stats.sessions_completed,
+                    'mean_score': stats.mean_score,
+                    'max_score': exam.total_points,
+                    'score_histogram': dict(stats.histogram),
+                    'questions': [
+                        {
+                            'order': question.order,
+                            'responses': counters.responses,
+                            'correct': counters.correct,
+                            'percent_correct': counters.percent_correct,
+                        }
+                        for question, counters in question_stats
+                    ]
+                })
+            
+            context = {
+                'exam': exam,
+                'stats': stats,
+                'question_stats': question_stats,
+                'histogram_peak': max([count for _, count in stats.histogram] + [1]),
+            }
+            
+            return render(request, 'exam/exam_stats.html', context)
+            
+        except Exam.DoesNotExist:
+            return render(request, 'exam/error.html', {'error': 'Exam not found'}, status=404)
+        except Exception as e:
+            logger.error(f"Exam stats error: {str(e)}")
+            return render(request, 'exam/error.html', {'error': 'Failed to load statistics'}, status=500)
+
+
+def _session_card(session):
+    """Fields of a monitor card that change while a session is live"""
+    return {
+        'session_id': session.session_id,
+        'version': session.version,
+        'state': session.current_state,
+        'student_name': session.student_name,
+        'student_grade': session.student_grade,
+        'progress_percentage': session.progress,
+        'time_remaining': session.time_remaining,
+        'deadline_at': session.effective_deadline.isoformat(),
+        'paused': session.paused_at is not None,
+    }
+
+
 class SessionListView(View):
-    """List all exam sessions for monitoring"""
+    """List exam sessions for monitoring, one keyset-paginated tab at a time"""
+    
+    PAGE_SIZE = 50
     
     def get(self, request):
-        """Display list of exam sessions"""
+        """Display one page of active or completed sessions"""
         try:
-            # Get recent sessions
-            sessions = ExamSession.objects.select_related('exam', 'exam__subject').order_by('-started_at')[:50]
+            tab = 'completed' if request.GET.get('tab') == 'completed' else 'active'
+            sessions = ExamSession.objects.for_monitor()
+            if tab == 'active':
+                sessions = sessions.active()
+            else:
+                sessions = sessions.filter(current_state='exam_complete').annotate(
+                    result_score=F('result__total_score'),
+                    result_max_score=F('result__max_score'),
+                )
+            
+            try:
+                page, next_cursor = sessions.page(request.GET.get('before'), self.PAGE_SIZE)
+            except ValueError:
+                return render(request, 'exam/error.html', {'error': 'Invalid page'}, status=400)
             
             context = {
-                'sessions': sessions,
-                'active_sessions': sessions.filter(current_state__in=['student_name', 'student_grade', 'exam_briefing', 'question_reading', 'answer_capture', 'answer_confirmation']),
-                'completed_sessions': sessions.filter(current_state='exam_complete')
+                'tab': tab,
+                'sessions': page,
+                'next_cursor': next_cursor,
+                'is_first_page': not request.GET.get('before'),
             }
             
             return render(request, 'exam/session_list.html', context)
             
         except Exception as e:
             logger.error(f"Session list error: {str(e)}")
-            return render(request, 'exam/error.html', {'error': 'Failed to load sessions'}, status=500)
\ No newline at end of file
+            return render(request, 'exam/error.html', {'error': 'Failed to load sessions'}, status=500)
+
+
+class LiveSessionCardsView(View):
+    """Current state of the active sessions on the first monitor page, for refreshing cards in place"""
+    
+    def get(self, request):
+        try:
+            sessions, _ = ExamSession.objects.for_monitor().active().page(size=SessionListView.PAGE_SIZE)
+            
+            return JsonResponse({
+                'server_time': timezone.now().isoformat(),
+                'sessions': [_session_card(session) for session in sessions]
+            })
+            
+        except Exception as e:
+            logger.error(f"Live session cards error: {str(e)}")
+            return JsonResponse({'error': 'Failed to load sessions'}, status=500)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ResultsExportView(View):
+    """Stream completed sessions or their responses as CSV or JSON Lines"""
+    
+    def get(self, request):
+        """Export ?kind=sessions|responses as ?format=csv|jsonl for an ?exam= and/or ?since=&until= dates"""
+        kind = request.GET.get('kind', 'sessions')
+        export_format = request.GET.get('format', 'csv')
+        if kind not in EXPORT_KINDS or export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': 'Unknown export kind or format'}, status=400)
+        
+        try:
+            exam_id = int(request.GET['exam']) if request.GET.get('exam') else None
+            since = date.fromisoformat(request.GET['since']) if request.GET.get('since') else None
+            until = date.fromisoformat(request.GET['until']) if request.GET.get('until') else None
+        except ValueError:
+            return JsonResponse({'error': 'Invalid exam or date'}, status=400)
+        
+        encode, content_type = EXPORT_FORMATS[export_format]
+        chunks = encode(*export_rows(kind, exam_id=exam_id, since=since, until=until))
+        if isinstance(request, ASGIRequest):
+            chunks = iterate_async(chunks)
+        
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        filename = f"{kind}{f'-exam{exam_id}' if exam_id else ''}-{timezone.now():%Y%m%d}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class MetricsView(View):
+    """Voice turn latency histograms, speech backend errors and cache hit counts for Prometheus"""
+    
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        authorization = request.headers.get('Authorization', '')
+        # Scrapers present the token; staff can look from a logged-in browser
+        if not request.user.is_staff and not (
+            token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+        ):
+            return HttpResponse('Forbidden', status=403, content_type='text/plain')
+        return HttpResponse(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
@@ -2,140 +2,104 @@ import json
 import re
 import wave
 import numpy as np
-import requests
 import base64
-from google.cloud import speech
-from google.cloud import texttospeech
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import OperationalError
 from django.utils import timezone
+from functools import partial
 import logging
+import time
+
+from . import metrics, tts_cache
+from .models import StaleSessionError
+from .results import record_exam_results
+from .speech import get_speech_backend
+from .stats import record_answer
+from .unit_of_work import TurnUnitOfWork
 
 logger = logging.getLogger(__name__)
 
+# How often a turn is re-run after losing a race with a concurrent request
+MAX_TRANSITION_ATTEMPTS = 3
+
+# Wait before re-running a turn the database was too busy to write, doubled on each attempt
+BUSY_RETRY_BACKOFF_SECONDS = 0.05
+
+
+def is_busy_error(error):
+    """Whether an OperationalError is SQLite reporting that another connection holds the lock"""
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
 
 class VoiceProcessor:
-    """Core voice processing functionality using Google Cloud APIs"""
+    """Core voice processing functionality on top of the configured speech backend"""
     
     def __init__(self):
-        # Using API key directly instead of client library authentication
-        self.api_key = settings.GOOGLE_API_KEY
         self.voice_settings = getattr(settings, 'VOICE_SETTINGS', {})
     
     def transcribe_audio(self, audio_data, language_code='en-US', sample_rate_hertz=16000, encoding='WEBM_OPUS', channels=1):
-        """Convert audio to text using Google Speech-to-Text"""
-        try:
-            # Convert audio data to base64
-            audio_content = base64.b64encode(audio_data).decode('utf-8')
-            
-            # Prepare request data with explicit audio config for webm
-            data = {
-                "config": {
-                    "languageCode": language_code,
-                    "enableAutomaticPunctuation": True,
-                    "encoding": encoding,  # Changed to WEBM_OPUS
-                    "sampleRateHertz": sample_rate_hertz,
-                    "audioChannelCount": channels,
-                    "model": "default"  # Use default model for better compatibility
-                },
-                "audio": {
-                    "content": audio_content
-                }
-            }
-            
-            # Make request to Speech-to-Text API
-            url = f"https://speech.googleapis.com/v1/speech:recognize?key={self.api_key}"
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.post(url, json=data, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if 'results' in result and result['results']:
-                transcript = result['results'][0]['alternatives'][0]['transcript']
-                return {
-                    'success': True,
-                    'transcript': transcript
-                }
-            return {
-                'success': False,
-                'transcript': '',
-                'error': 'No speech detected'
-            }
-                
-        except requests.exceptions.RequestException as e:
-            error_message = str(e)
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_detail = e.response.json()
-                    error_message = f"{error_message}: {error_detail}"
-                except:
-                    pass
-            return {
-                'success': False,
-                'transcript': '',
-                'error': error_message
-            }
-        except Exception as e:
-            logger.error(f"Speech-to-Text error: {str(e)}")
-            return {
-                'success': False,
-                'transcript': '',
-                'error': str(e)
-            }
+        """Convert audio to text with the speech backend"""
+        with metrics.stage('stt', audio_bytes=len(audio_data or b''), language=language_code):
+            result = get_speech_backend().transcribe(
+                audio_data,
+                language_code=language_code,
+                sample_rate_hertz=sample_rate_hertz,
+                encoding=encoding,
+                channels=channels,
+            )
+            metrics.annotate(
+                success=result.get('success', False),
+                transcript_chars=len(result.get('transcript') or ''),
+                error=result.get('error'),
+            )
+        metrics.record_speech_call('transcribe', result)
+        return result
     
-    def synthesize_speech(self, text, language_code='en-US', voice_gender='NEUTRAL'):
-        """Convert text to speech using Google Text-to-Speech"""
-        try:
-            # Get voice settings for language
-            lang_key = 'en' if language_code.startswith('en') else 'sw'
-            voice_config = self.voice_settings['LANGUAGES'].get(lang_key, {})
-            
-            # Prepare request data
-            data = {
-                "input": {"text": text},
-                "voice": {
-                    "languageCode": voice_config.get('code', language_code),
-                    "name": voice_config.get('voice', 'en-US-Standard-C'),
-                    "ssmlGender": voice_config.get('gender', voice_gender)
-                },
-                "audioConfig": {
-                    "audioEncoding": "MP3"
-                }
-            }
-            
-            # Make request to Text-to-Speech API
-            url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={self.api_key}"
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Goog-Api-Key': self.api_key
-            }
-            response = requests.post(url, json=data, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if 'audioContent' in result:
-                audio_content = base64.b64decode(result['audioContent'])
+    def synthesize_speech(self, text, language_code='en-US', voice_gender='NEUTRAL', cache=True):
+        """Convert text to speech with the speech backend.
+
+        Only pass cache=True for text that is the same for every student, such
+        as questions and fixed prompts; names, answers and scores stay off disk.
+        """
+        # Get voice settings for language
+        lang_key = 'en' if language_code.startswith('en') else 'sw'
+        voice_config = self.voice_settings['LANGUAGES'].get(lang_key, {})
+        voice = {
+            'code': voice_config.get('code', language_code),
+            'name': voice_config.get('voice', 'en-US-Standard-C'),
+            'gender': voice_config.get('gender', voice_gender),
+        }
+        
+        backend = get_speech_backend()
+        cache = cache and backend.cache_audio
+        if cache:
+            # Identical prompts (question text, fixed replies) are synthesized once
+            key = tts_cache.cache_key({'backend': backend.name, 'text': text, 'voice': voice})
+            with metrics.stage('tts_cache', operation='lookup'):
+                audio_content = tts_cache.get_audio(key)
+                metrics.annotate(hit=audio_content is not None)
+            metrics.record_cache('tts', hit=audio_content is not None)
+            if audio_content is not None:
                 return {
                     'success': True,
                     'audio_content': audio_content,
                     'content_type': 'audio/mp3'
                 }
-            return {
-                'success': False,
-                'error': 'Failed to generate audio'
-            }
-            
-        except Exception as e:
-            logger.error(f"Text-to-Speech error: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+        
+        with metrics.stage('tts', text_chars=len(text), voice=voice['name']):
+            result = backend.synthesize(text, voice)
+            metrics.annotate(
+                success=result['success'],
+                audio_bytes=len(result.get('audio_content') or b''),
+                error=result.get('error'),
+            )
+        metrics.record_speech_call('synthesize', result)
+        if result['success'] and cache:
+            with metrics.stage('tts_cache', operation='store', audio_bytes=len(result['audio_content'])):
+                tts_cache.store_audio(key, result['audio_content'])
+        return result
             
     def generate_tone(self, frequency=800, duration=0.5, sample_rate=16000):
         """Generate audio tone to signal voice capture start"""
@@ -324,7 +288,7 @@ class VoiceFlowManager:
                 transcript = existing_transcript
                 transcription_success = True
             else:
-                language_code = 'sw-KE' if session.exam.language == 'sw' else 'en-US'
+                language_code = session.exam_snapshot.language_code
                 transcription_result = self.voice_processor.transcribe_audio(
                     audio_data, 
                     language_code,
@@ -342,23 +306,51 @@ class VoiceFlowManager:
                 )
             
             # Process the transcript
-            command = self.command_parser.parse_command(transcript, session.current_state)
+            with metrics.stage('parse', transcript_chars=len(transcript)):
+                command = self.command_parser.parse_command(transcript, session.current_state)
+                metrics.annotate(command=command.get('type'))
                 
-            # Route to appropriate handler
-            if session.current_state == 'student_name':
-                return self._handle_name_input(session, transcript, command)
-            elif session.current_state == 'student_grade':
-                return self._handle_grade_input(session, transcript, command)
-            elif session.current_state == 'exam_briefing':
-                return self._handle_briefing_response(session, transcript, command)
-            elif session.current_state == 'question_reading':
-                return self._handle_question_command(session, transcript, command)
-            elif session.current_state == 'answer_capture':
-                return self._handle_answer_input(session, transcript, command)
-            elif session.current_state == 'answer_confirmation':
-                return self._handle_confirmation(session, transcript, command)
+            # Handlers only change state in memory; the turn is then persisted with
+            # one version-checked write, before the slow TTS call. If another request
+            # wrote the session first, or held the write lock for longer than the
+            # busy timeout, reload it and run the transition again, but only while
+            # the session is still where the command was spoken.
+            spoken_at = (session.current_state, session.current_question_index)
+            for attempt in range(1, MAX_TRANSITION_ATTEMPTS + 1):
+                unit_of_work = TurnUnitOfWork(session)
+                with metrics.stage('route', attempt=attempt):
+                    reply = self._route(session, transcript, command, unit_of_work)
+                try:
+                    with metrics.stage('db', attempt=attempt):
+                        unit_of_work.flush()
+                    break
+                except (StaleSessionError, OperationalError) as e:
+                    if attempt == MAX_TRANSITION_ATTEMPTS:
+                        raise
+                    if isinstance(e, OperationalError):
+                        if not is_busy_error(e):
+                            raise
+                        logger.info(f"Database busy writing session {session.session_id}, retrying turn")
+                        time.sleep(BUSY_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                    else:
+                        logger.info(f"Session {session.session_id} changed concurrently, retrying turn")
+                    with metrics.stage('retry', attempt=attempt + 1):
+                        with metrics.stage('db', operation='reload'):
+                            session = self._reload_session(session)
+                        metrics.annotate(state=session.current_state)
+                    if (session.current_state, session.current_question_index) != spoken_at:
+                        # The other request already moved the session on, as a repeated "yes" does
+                        logger.info(f"Session {session.session_id} moved on before this turn, not repeating it")
+                        reply = self._current_state_reply(session)
+                        break
             
-            return self._create_error_response("Invalid state")
+            if reply is None:
+                return self._create_error_response("Invalid state")
+            
+            text, include_tone, static = reply
+            if callable(text):
+                text = text(session)
+            return self._create_voice_response(session, text, include_tone=include_tone, static=static)
             
         except Exception as e:
             logger.error(f"Voice flow error: {str(e)}")
@@ -366,6 +358,40 @@ class VoiceFlowManager:
                 "Sorry, there was an error processing your response. Please try again."
             )
     
+    def _route(self, session, transcript, command, unit_of_work):
+        """Dispatch a parsed command to the handler for the session's state"""
+        if session.current_state == 'student_name':
+            return self._handle_name_input(session, transcript, command)
+        elif session.current_state == 'student_grade':
+            return self._handle_grade_input(session, transcript, command)
+        elif session.current_state == 'exam_briefing':
+            return self._handle_briefing_response(session, transcript, command)
+        elif session.current_state == 'question_reading':
+            return self._handle_question_command(session, transcript, command)
+        elif session.current_state == 'answer_capture':
+            return self._handle_answer_input(session, transcript, command)
+        elif session.current_state == 'answer_confirmation':
+            return self._handle_confirmation(session, transcript, command, unit_of_work)
+        return None
+    
+    def _current_state_reply(self, session):
+        """What to say to a turn that arrived for a state the session has already left"""
+        if session.current_state == 'exam_complete':
+            return self._reply(self._create_exam_completion_text(session))
+        if session.current_state == 'question_reading':
+            return self._reply(self._format_question_for_voice(session.current_question), static=True)
+        if session.current_state == 'answer_capture':
+            return self._reply("Please provide your answer after the tone.", include_tone=True, static=True)
+        return self._reply("Your last response was already received. Please continue.", static=True)
+    
+    def _reload_session(self, session):
+        """Fetch a fresh copy of a session after a concurrent write"""
+        from .models import ExamSession
+        
+        fresh = ExamSession.objects.select_related('exam').get(pk=session.pk)
+        fresh._request_session = getattr(session, '_request_session', {})
+        return fresh
+    
     def _handle_name_input(self, session, transcript, command):
         """Handle student name input"""
         if command['type'] == 'navigation':
@@ -374,10 +400,9 @@ class VoiceFlowManager:
         # Store name and confirm
         session.student_name = transcript
         session.current_state = 'student_grade'
-        session.save()
         
         response_text = f"Thank you, {transcript}. Now please state your grade level."
-        return self._create_voice_response(session, response_text)
+        return self._reply(response_text)
     
     def _handle_grade_input(self, session, transcript, command):
         """Handle student grade input"""
@@ -387,30 +412,28 @@ class VoiceFlowManager:
         # Store grade and move to briefing
         session.student_grade = transcript
         session.current_state = 'exam_briefing'
-        session.save()
         
         # Create briefing text
         briefing_text = self._create_exam_briefing(session)
-        return self._create_voice_response(session, briefing_text)
+        return self._reply(briefing_text)
     
     def _handle_briefing_response(self, session, transcript, command):
         """Handle exam briefing response"""
         if command['type'] == 'navigation' and command['command'] == 'start_exam':
             # Move to first question
             session.current_state = 'question_reading'
-            session.save()
             
             question_text = self._format_question_for_voice(session.current_question)
-            return self._create_voice_response(session, question_text)
+            return self._reply(question_text, static=True)
         
         elif command['type'] == 'navigation' and command['command'] == 'repeat_question':
             # Repeat briefing
             briefing_text = self._create_exam_briefing(session)
-            return self._create_voice_response(session, briefing_text)
+            return self._reply(briefing_text)
         
         # Default response
         response_text = "Please say 'start' when you are ready to begin the exam, or say 'repeat' to hear the instructions again."
-        return self._create_voice_response(session, response_text)
+        return self._reply(response_text, static=True)
     
     def _handle_question_command(self, session, transcript, command):
         """Handle commands during question reading"""
@@ -419,10 +442,9 @@ class VoiceFlowManager:
         
         # Move to answer capture
         session.current_state = 'answer_capture'
-        session.save()
         
         response_text = "Please provide your answer after the tone."
-        return self._create_voice_response(session, response_text, include_tone=True)
+        return self._reply(response_text, include_tone=True, static=True)
     
     def _handle_answer_input(self, session, transcript, command):
         """Handle answer input from student"""
@@ -431,14 +453,14 @@ class VoiceFlowManager:
         
         # Extract answer from transcript
         current_question = session.current_question
-        answer_result = self.command_parser.extract_answer(
-            transcript, current_question.question_type
-        )
+        with metrics.stage('parse', operation='answer'):
+            answer_result = self.command_parser.extract_answer(
+                transcript, current_question.question_type
+            )
         
         if self.command_parser.is_valid_answer(answer_result['answer'], current_question.question_type):
             # Store the answer temporarily and confirm
             session.current_state = 'answer_confirmation'
-            session.save()
             
             # Store answer in session for confirmation
             # We'll use Django session storage for this temporary data
@@ -448,13 +470,13 @@ class VoiceFlowManager:
             request_session['temp_transcript'] = transcript
             
             response_text = f"You answered {answer_result['answer']}. Is this correct? Say yes to confirm or no to try again."
-            return self._create_voice_response(session, response_text)
+            return self._reply(response_text)
         else:
             # Invalid answer, ask to try again
             response_text = f"I didn't understand your answer. For this {current_question.question_type} question, please provide a clear answer."
-            return self._create_voice_response(session, response_text, include_tone=True)
+            return self._reply(response_text, include_tone=True, static=True)
     
-    def _handle_confirmation(self, session, transcript, command):
+    def _handle_confirmation(self, session, transcript, command, unit_of_work):
         """Handle answer confirmation"""
         if command['type'] == 'confirmation':
             from django.contrib.sessions.models import Session
@@ -465,93 +487,70 @@ class VoiceFlowManager:
                 temp_answer = request_session.get('temp_answer', '')
                 temp_transcript = request_session.get('temp_transcript', '')
                 
-                self._save_student_response(session, temp_answer, temp_transcript)
+                self._save_student_response(session, temp_answer, temp_transcript, unit_of_work)
                 
                 # Move to next question or complete exam
-                session.advance_question()
+                session.advance_question(commit=False)
                 
                 if session.is_complete():
-                    session.complete_exam()
-                    final_text = self._create_exam_completion_text(session)
-                    return self._create_voice_response(session, final_text)
+                    session.complete_exam(commit=False)
+                    unit_of_work.defer(partial(record_exam_results, [session]))
+                    # The final score is only known once the response has been flushed
+                    return self._reply(self._create_exam_completion_text)
                 else:
                     session.current_state = 'question_reading'
-                    session.save()
                     
                     question_text = self._format_question_for_voice(session.current_question)
-                    return self._create_voice_response(session, question_text)
+                    return self._reply(question_text, static=True)
             else:
                 # Go back to answer capture
                 session.current_state = 'answer_capture'
-                session.save()
                 
                 response_text = "Please provide your answer again after the tone."
-                return self._create_voice_response(session, response_text, include_tone=True)
+                return self._reply(response_text, include_tone=True, static=True)
         
         # Default response for unclear confirmation
         response_text = "Please say 'yes' to confirm your answer or 'no' to try again."
-        return self._create_voice_response(session, response_text)
+        return self._reply(response_text, static=True)
     
     def _handle_navigation_command(self, session, command):
         """Handle navigation commands"""
         if command == 'go_back':
             if session.current_question_index > 0:
-                session.go_back_question()
+                session.go_back_question(commit=False)
                 session.current_state = 'question_reading'
-                session.save()
                 
                 question_text = self._format_question_for_voice(session.current_question)
-                return self._create_voice_response(session, question_text)
+                return self._reply(question_text, static=True)
             else:
                 response_text = "You are already at the first question."
-                return self._create_voice_response(session, response_text)
+                return self._reply(response_text, static=True)
         
         elif command == 'repeat_question':
             if session.current_question:
                 question_text = self._format_question_for_voice(session.current_question)
-                return self._create_voice_response(session, question_text)
+                return self._reply(question_text, static=True)
             else:
                 response_text = "No question to repeat."
-                return self._create_voice_response(session, response_text)
+                return self._reply(response_text, static=True)
         
         elif command == 'time_remaining':
             response_text = f"You have {session.time_remaining_formatted} remaining."
-            return self._create_voice_response(session, response_text)
+            return self._reply(response_text)
         
         elif command == 'next_question':
             if session.current_state == 'question_reading':
                 session.current_state = 'answer_capture'
-                session.save()
                 response_text = "Please provide your answer after the tone."
-                return self._create_voice_response(session, response_text, include_tone=True)
+                return self._reply(response_text, include_tone=True, static=True)
         
         # Default response
         response_text = "I didn't understand that command. Please try again."
-        return self._create_voice_response(session, response_text)
+        return self._reply(response_text, static=True)
     
     def _create_exam_briefing(self, session):
         """Create comprehensive exam briefing text"""
-        exam = session.exam
-        total_questions = exam.get_total_questions()
-        
-        briefing = f"""
-        Hello {session.student_name}, Grade {session.student_grade}. 
-        
-        You are about to take the {exam.title} exam in {exam.subject.name}.
-        
-        This exam has {total_questions} questions and you have {exam.duration_minutes} minutes to complete it.
-        
-        {exam.instructions}
-        
-        Here are the voice commands you can use:
-        - Say 'repeat' to hear a question again
-        - Say 'go back' to return to the previous question
-        - Say 'time remaining' to hear how much time you have left
-        
-        When you are ready to begin, say 'start'.
-        """
-        
-        return briefing.strip()
+        return session.exam_snapshot.briefing_text(session.student_name, session.student_grade)
     
     def _format_question_for_voice(self, question):
         """Format question for voice reading"""
@@ -562,53 +561,59 @@ class VoiceFlowManager:
     
     def _create_exam_completion_text(self, session):
         """Create exam completion announcement"""
+        snapshot = session.exam_snapshot
         return f"""
-        Congratulations {session.student_name}! You have completed the {session.exam.title} exam.
+        Congratulations {session.student_name}! You have completed the {snapshot.title} exam.
         
-        Your final score is {session.total_score} out of {session.exam.get_total_points()} points.
+        Your final score is {session.total_score} out of {snapshot.total_points} points.
         
         Thank you for taking the exam. You may now leave your seat.
         """
     
-    def _save_student_response(self, session, answer, transcript):
-        """Save student response to database"""
+    def _save_student_response(self, session, answer, transcript, unit_of_work):
+        """Grade an answer and queue the write of its student response on the turn's unit of work"""
         from .models import StudentResponse
         
         current_question = session.current_question
-        
-        # Create or update response
-        response, created = StudentResponse.objects.get_or_create(
-            exam_session=session,
-            question=current_question,
-            defaults={
-                'transcribed_text': transcript,
-                'final_answer': answer,
-                'attempts': 1
-            }
-        )
-        
-        if not created:
-            response.final_answer = answer
-            response.transcribed_text = transcript
-            response.attempts += 1
-        
-        # Check if answer is correct and calculate score
-        response.check_answer()
-        
-        # Update session total score
-        session.total_score = sum(
-            r.points_earned for r in session.responses.all()
-        )
-        session.save()
-        
-        return response
+        # Grade against the cached question rather than reloading it
+        is_correct, points_earned = StudentResponse.grade(current_question, answer)
+        
+        # Read before the flush transaction opens, so that it starts with a write
+        response = StudentResponse.objects.filter(
+            exam_session=session, question_id=current_question.id
+        ).only('id', 'is_correct', 'points_earned', 'attempts').first()
+        created = response is None
+        if created:
+            response = StudentResponse(exam_session=session, question_id=current_question.id, attempts=0)
+            previous_points, previous_correct = 0, False
+            update_fields = None
+        else:
+            previous_points, previous_correct = response.points_earned, response.is_correct
+            update_fields = ['final_answer', 'transcribed_text', 'is_correct', 'points_earned', 'attempts']
+        response.final_answer = answer
+        response.transcribed_text = transcript
+        response.is_correct = is_correct
+        response.points_earned = points_earned
+        response.attempts += 1
+        
+        # Adjust the score by this answer's change in points with an F() expression
+        unit_of_work.adjust('total_score', points_earned - previous_points)
+        unit_of_work.defer(partial(response.save, update_fields=update_fields))
+        unit_of_work.defer(partial(
+            record_answer,
+            current_question.id,
+            responses=int(created),
+            correct=int(is_correct) - int(previous_correct),
+            points=points_earned - previous_points,
+        ))
     
-    def _create_voice_response(self, session, text, include_tone=False):
-        """Create voice response with TTS"""
-        language_code = 'sw-KE' if session.exam.language == 'sw' else 'en-US'
+    def _create_voice_response(self, session, text, include_tone=False, static=False):
+        """Create voice response with TTS; static text is the same for every student and may be cached"""
+        snapshot = session.exam_snapshot
+        language_code = snapshot.language_code
         
         # Generate TTS
-        tts_result = self.voice_processor.synthesize_speech(text, language_code)
+        tts_result = self.voice_processor.synthesize_speech(text, language_code, cache=static)
         
         response = {
             'session_id': session.session_id,
@@ -616,19 +621,30 @@ class VoiceFlowManager:
             'text': text,
             'audio_available': tts_result['success'],
             'include_tone': include_tone,
+            'cacheable': static,
             'progress': session.progress_percentage,
             'time_remaining': session.time_remaining,
+            'deadline_at': session.effective_deadline.isoformat(),
             'current_question': session.current_question_index + 1,
-            'total_questions': session.exam.get_total_questions()
+            'total_questions': snapshot.question_count
         }
         
         if tts_result['success']:
             # Encode audio data as base64 for JSON serialization
-            response['audio_data'] = base64.b64encode(tts_result['audio_content']).decode('utf-8')
+            with metrics.stage('encode', audio_bytes=len(tts_result['audio_content'])):
+                response['audio_data'] = base64.b64encode(tts_result['audio_content']).decode('utf-8')
             response['audio_content_type'] = tts_result.get('content_type', 'audio/mp3')
         
         return response
     
+    def _reply(self, text, include_tone=False, static=False):
+        """Bundle reply text (or a callable rendering it from the session) with the tone flag.
+
+        static marks text that is the same for every student, such as a
+        question or a fixed prompt; only static text is cached as audio.
+        """
+        return text, include_tone, static
+    
     def _create_error_response(self, message):
         """Create error response"""
         return {
@@ -8,6 +8,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # load GOOGLE_API_KEY from .env
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Point both at `manage.py speech_standin` to load test without Google Cloud
+GOOGLE_SPEECH_BASE_URL = os.getenv("GOOGLE_SPEECH_BASE_URL", "https://speech.googleapis.com")
+GOOGLE_TTS_BASE_URL = os.getenv("GOOGLE_TTS_BASE_URL", "https://texttospeech.googleapis.com")
+# Bearer token Prometheus presents to scrape /metrics; staff users can always view it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Voice turns taking at least this long are written in full to TRACE_LOG_PATH, one JSON
+# line each; read them with `manage.py slow_turns`. Set TRACE_LOG_PATH empty to stop
+TRACE_SLOW_TURN_MS = int(os.getenv("TRACE_SLOW_TURN_MS", "2000"))
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", str(BASE_DIR / "logs" / "slow_turns.jsonl"))
 
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -104,6 +113,20 @@ RECORDINGS_DIR = os.path.join(MEDIA_ROOT, 'recordings')
 if not os.path.exists(RECORDINGS_DIR):
     os.makedirs(RECORDINGS_DIR)
 
+# Synthesized speech of questions and fixed prompts is cached here, keyed by text and voice;
+# the least recently used files are dropped once it grows past TTS_CACHE_MAX_BYTES
+TTS_CACHE_DIR = os.path.join(MEDIA_ROOT, 'tts')
+TTS_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Speech-to-text and text-to-speech provider; exam.speech.FakeSpeechBackend runs
+# without network access or an API key (see exam/speech.py for its OPTIONS)
+SPEECH_BACKEND = {
+    'BACKEND': os.getenv('SPEECH_BACKEND', 'exam.speech.GoogleRestBackend'),
+    'OPTIONS': {},
+    # Seconds GoogleRestBackend waits on the speech APIs before reporting the call as failed
+    'TIMEOUT': float(os.getenv('SPEECH_TIMEOUT', 10)),
+}
+
 # Voice settings for Google Cloud APIs
 VOICE_SETTINGS = {
     'LANGUAGES': {
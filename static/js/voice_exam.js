@@ -12,7 +12,18 @@ class VoiceExamSystem {
         this.audioChunks = [];
         this.isRecording = false;
         this.sessionData = null;
-        this.updateTimer = null;
+        this.eventSource = null;
+        this.pollTimer = null;
+        this.countdownTimer = null;
+        this.deadline = null;
+        this.paused = false;
+        this.frozenRemaining = 0;
+        this.clockOffset = 0;
+        this.stateVersion = null;
+        this.stateEtag = null;
+        this.totalQuestions = null;
+        this.questionIndex = 0;
+        this.POLL_INTERVAL = 5000; // Only used when the event stream is unavailable
         this.ttsQueue = [];
         this.isPlaying = false;
         this.silenceTimeout = null;
@@ -236,19 +247,30 @@ class VoiceExamSystem {
         formData.append('state', this.sessionData?.state);
         formData.append('question_index', this.sessionData?.current_question_index);
 
+        // Identifies this turn in the server's slow-turn trace log
+        const traceId = this.newTraceId();
         try {
             const response = await fetch('/voice/process/', {
                 method: 'POST',
+                headers: { 'X-Trace-Id': traceId },
                 body: formData
             });
 
             const data = await response.json();
             await this.handleVoiceResponse(data);
         } catch (error) {
+            console.error(`Voice turn ${traceId} failed:`, error);
             this.showFeedback('Failed to process voice input', 'error');
         }
     }
 
+    newTraceId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+    }
+
     async handleVoiceResponse(data) {
         if (data.error) {
             if (this.retryCount < this.MAX_RETRIES) {
@@ -268,7 +290,7 @@ class VoiceExamSystem {
 
         // Play the response and automatically start recording after it's done
         if (data.text) {
-            await this.playTTSResponse(data.text);
+            await this.playTTSResponse(data.text, data.cacheable);
             if (data.include_tone) {
                 await this.playTone();
                 this.startRecording();
@@ -278,7 +300,8 @@ class VoiceExamSystem {
         this.updateSessionState(data);
     }
 
-    async playTTSResponse(text) {
+    // Replies naming the student or their answers are not cacheable and stay off the server's disk
+    async playTTSResponse(text, cacheable = true) {
         try {
             const response = await fetch('/voice/tts/', {
                 method: 'POST',
@@ -286,7 +309,7 @@ class VoiceExamSystem {
                     'Content-Type': 'application/x-www-form-urlencoded',
                     'X-CSRFToken': this.getCookie('csrftoken')
                 },
-                body: `text=${encodeURIComponent(text)}`
+                body: `text=${encodeURIComponent(text)}&cache=${cacheable ? 1 : 0}`
             });
 
             if (response.ok) {
@@ -306,7 +329,14 @@ class VoiceExamSystem {
     async updateSessionState(data = null) {
         if (!data) {
             try {
-                const response = await fetch(`/session/state/?session_id=${this.sessionData?.session_id}`);
+                // Ask only for what changed; an unchanged session answers 304 without a body
+                const since = this.stateVersion !== null ? `&since=${this.stateVersion}` : '';
+                const response = await fetch(`/session/state/?session_id=${this.sessionData?.session_id}${since}`, {
+                    cache: 'no-store',
+                    headers: this.stateEtag ? { 'If-None-Match': this.stateEtag } : {}
+                });
+                if (response.status === 304) return;
+                this.stateEtag = response.headers.get('ETag');
                 data = await response.json();
             } catch (error) {
                 console.error('Failed to update session state:', error);
@@ -314,22 +344,96 @@ class VoiceExamSystem {
             }
         }
 
+        if (data.version !== undefined) {
+            this.stateVersion = data.version;
+        }
+
         if (data.state === 'exam_complete') {
             this.endExam();
             return;
         }
 
-        // Update UI elements
-        this.sessionState.textContent = this.formatState(data.state);
-        this.timeRemaining.textContent = data.time_remaining_formatted;
-        this.progressBar.style.width = `${data.progress_percentage}%`;
+        // Update UI elements; delta responses carry only the fields that changed
+        if (data.state) {
+            this.sessionState.textContent = this.formatState(data.state);
+        }
 
-        if (data.current_question) {
-            this.questionNumber.textContent = `Question ${data.current_question_index + 1} of ${data.total_questions}`;
+        if (data.deadline_at) {
+            this.deadline = new Date(data.deadline_at).getTime();
+        }
+        if (data.paused !== undefined) {
+            this.paused = Boolean(data.paused);
+        }
+        if (data.time_remaining !== undefined) {
+            this.frozenRemaining = data.time_remaining;
+        }
+        if (data.server_time) {
+            this.clockOffset = new Date(data.server_time).getTime() - Date.now();
+        }
+        this.renderCountdown();
+
+        const progress = data.progress_percentage ?? data.progress;
+        if (progress !== undefined) {
+            this.progressBar.style.width = `${progress}%`;
+        }
+
+        if (data.total_questions !== undefined) {
+            this.totalQuestions = data.total_questions;
+        }
+        if (data.current_question_index !== undefined) {
+            this.questionIndex = data.current_question_index;
+        }
+        if (data.current_question && data.current_question.text) {
+            this.questionNumber.textContent = `Question ${this.questionIndex + 1} of ${this.totalQuestions}`;
             this.questionText.textContent = data.current_question.text;
         }
     }
 
+    renderCountdown() {
+        // The timer runs on the client from the server deadline; no request per tick
+        if (this.deadline === null) return;
+
+        const remaining = this.paused
+            ? this.frozenRemaining
+            : Math.max(0, Math.floor((this.deadline - (Date.now() + this.clockOffset)) / 1000));
+        this.timeRemaining.textContent = this.formatRemaining(remaining);
+    }
+
+    formatRemaining(seconds) {
+        const minutes = Math.floor(seconds / 60);
+        const remainingSeconds = seconds % 60;
+        if (minutes > 0) {
+            return `${minutes} minutes and ${remainingSeconds} seconds`;
+        }
+        return `${remainingSeconds} seconds`;
+    }
+
+    connectStateStream() {
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        const sessionId = encodeURIComponent(this.sessionData?.session_id);
+        this.eventSource = new EventSource(`/session/events/?session_id=${sessionId}`);
+        this.eventSource.addEventListener('state', (event) => {
+            this.updateSessionState(JSON.parse(event.data));
+        });
+        this.eventSource.onerror = () => {
+            // A closed stream means the server cannot push (e.g. not running under ASGI)
+            if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+                this.eventSource = null;
+                this.startPolling();
+            }
+        };
+    }
+
+    startPolling() {
+        if (!this.pollTimer) {
+            this.pollTimer = setInterval(() => this.updateSessionState(), this.POLL_INTERVAL);
+        }
+    }
+
     formatState(state) {
         return state.split('_').map(word => 
             word.charAt(0).toUpperCase() + word.slice(1)
@@ -339,11 +443,17 @@ class VoiceExamSystem {
     async startExamSession() {
         await this.initializeRecording();
         await this.updateSessionState();
-        this.updateTimer = setInterval(() => this.updateSessionState(), 1000);
+        this.connectStateStream();
+        this.countdownTimer = setInterval(() => this.renderCountdown(), 1000);
     }
 
     endExam() {
-        clearInterval(this.updateTimer);
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        clearInterval(this.pollTimer);
+        clearInterval(this.countdownTimer);
         window.location.href = `/results/${this.sessionData?.session_id}/`;
     }
 